@@ -0,0 +1,1383 @@
+""" A local stand-in for the NetBox API with generated fixtures. It
+    implements the parts of the REST API that nbcli uses: paged lists
+    with filters, single resources, creates, updates and deletes, the
+    status endpoint, a generated OpenAPI schema and the `API-Version`
+    header. `POST /graphql/` answers list queries and the
+    introspection query with types that are generated from the
+    fixtures, like the GraphQL API of NetBox 4.1.
+
+    The server counts the requests it handles. `GET /_stats/` returns
+    the counters and `DELETE /_stats/` resets them.
+
+    Usage:
+
+        python benchmarks/fake_netbox.py --sites 10000 --latency 0.02
+
+    The server prints the URL it listens on as the first line. """
+import argparse
+import json
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+
+# The NetBox version the server reports
+NETBOX_VERSION = '4.1.0'
+
+# The endpoints with objects that belong to a site
+RELATED_ENDPOINTS = (
+    'dcim/racks', 'dcim/devices', 'ipam/prefixes', 'ipam/vlans', 'circuits/circuits')
+
+# The parameters that are not filters
+CONTROL_PARAMETERS = ('limit', 'offset', 'brief', 'fields', 'ordering')
+
+# The status values of sites
+SITE_STATUSES = ('planned', 'staging', 'active', 'decommissioning', 'retired')
+
+# The fields that are not in the request bodies of the schema
+READ_ONLY_FIELDS = ('id', 'url', 'display', '_depth', 'last_updated', 'site_count', 'rack_count',
+                    'device_count', 'virtualmachine_count', 'prefix_count', 'vlan_count',
+                    'circuit_count')
+
+# The number of child regions per region
+REGION_FANOUT = 10
+
+# The list fields of the GraphQL types for related objects, with the
+# endpoint of the objects and the field that points back
+REVERSE_FIELDS = {
+    'dcim/regions': {'children': ('dcim/regions', 'parent'), 'sites': ('dcim/sites', 'region')},
+    'dcim/sites': {
+        'racks': ('dcim/racks', 'site'),
+        'devices': ('dcim/devices', 'site'),
+        'prefixes': ('ipam/prefixes', 'site'),
+        'vlans': ('ipam/vlans', 'site'),
+        'circuit_terminations': ('circuits/circuits', 'site'),
+        'virtual_machines': ('virtualization/virtual-machines', 'site')}
+}
+
+# The GraphQL types of related objects by field. Other related
+# objects have the brief type.
+RELATED_TYPES = {'parent': None, 'region': 'dcim/regions', 'site': 'dcim/sites'}
+
+PATH_PATTERN = re.compile(r'^/api/(\w+/[\w-]+)/(?:(\d+)/)?$')
+
+# The tokens of GraphQL queries: punctuation, strings, numbers and
+# names. Commas are ignored, like whitespace.
+TOKEN_PATTERN = re.compile(
+    r'[\s,]*(?:([{}()\[\]:])|"((?:[^"\\]|\\.)*)"|(-?\d+(?:\.\d+)?)|(\w+))')
+
+
+def get_brief(resource: dict) -> dict:
+    """ Get the nested representation of a resource
+
+        Parameters
+        ----------
+        resource: dict
+            The resource
+
+        Returns
+        -------
+        dict
+            The nested resource with its ID, name and slug
+    """
+    return {
+        'id': resource['id'],
+        'url': resource.get('url'),
+        'name': resource['name'],
+        'slug': resource.get('slug'),
+        'display': resource['name']}
+
+
+def generate_regions(count: int) -> list:
+    """ Generate regions. The regions form a tree with
+        `REGION_FANOUT` children per region.
+
+        Parameters
+        ----------
+        count: int
+            The number of regions
+
+        Returns
+        -------
+        list
+            The regions
+    """
+    regions = []
+    for region_id in range(1, count + 1):
+        parent_id = (region_id - 1) // REGION_FANOUT
+        parent = regions[parent_id - 1] if parent_id else None
+        regions.append({
+            'id': region_id,
+            'url': f'/api/dcim/regions/{region_id}/',
+            'name': f'region{region_id}',
+            'slug': f'region{region_id}',
+            'display': f'region{region_id}',
+            'parent': get_brief(parent) if parent else None,
+            'description': f'Region {region_id}',
+            'site_count': 0,
+            '_depth': parent['_depth'] + 1 if parent else 0,
+            'last_updated': '2024-01-01T00:00:00Z'})
+    return regions
+
+
+def generate_sites(count: int, regions: list) -> list:
+    """ Generate sites. The sites are spread over the regions.
+
+        Parameters
+        ----------
+        count: int
+            The number of sites
+
+        regions: list
+            The regions for the sites
+
+        Returns
+        -------
+        list
+            The sites
+    """
+    sites = []
+    for site_id in range(1, count + 1):
+        region = regions[site_id % len(regions)] if regions else None
+        if region:
+            region['site_count'] += 1
+        sites.append({
+            'id': site_id,
+            'url': f'/api/dcim/sites/{site_id}/',
+            'name': f'site{site_id}',
+            'slug': f'site{site_id}',
+            'display': f'site{site_id}',
+            'status': {'value': 'active', 'label': 'Active'},
+            'region': get_brief(region) if region else None,
+            'group': None,
+            'tenant': None,
+            'facility': f'DC{site_id}',
+            'time_zone': None,
+            'description': f'Site {site_id}',
+            'physical_address': '',
+            'shipping_address': '',
+            'asns': [],
+            'rack_count': 0,
+            'device_count': 0,
+            'virtualmachine_count': 0,
+            'prefix_count': 0,
+            'vlan_count': 0,
+            'circuit_count': 0,
+            'last_updated': '2024-01-01T00:00:00Z'})
+    return sites
+
+
+def generate_related(sites: list, per_site: int) -> dict:
+    """ Generate racks, devices, prefixes, VLANs and circuits for
+        the sites. The counts of the sites are updated.
+
+        Parameters
+        ----------
+        sites: list
+            The sites
+
+        per_site: int
+            The number of objects of every type per site
+
+        Returns
+        -------
+        dict
+            The objects per endpoint
+    """
+    status = {'value': 'active', 'label': 'Active'}
+    related = {endpoint: [] for endpoint in RELATED_ENDPOINTS}
+    for site in sites:
+        site_brief = get_brief(site)
+        for field in ('rack_count', 'device_count', 'prefix_count', 'vlan_count', 'circuit_count'):
+            site[field] = per_site
+        for number in range(per_site):
+            object_id = len(related['dcim/racks']) + 1
+            related['dcim/racks'].append({
+                'id': object_id, 'name': f'rack{object_id}',
+                'status': status, 'site': site_brief})
+            related['dcim/devices'].append({
+                'id': object_id, 'name': f'device{object_id}', 'status': status,
+                'device_type': {'id': 1, 'model': 'Model X', 'display': 'Model X'},
+                'site': site_brief})
+            related['ipam/prefixes'].append({
+                'id': object_id, 'prefix': f'10.{object_id // 256 % 256}.{object_id % 256}.0/24',
+                'status': status, 'vlan': None, 'site': site_brief})
+            related['ipam/vlans'].append({
+                'id': object_id, 'vid': number + 1, 'name': f'vlan{object_id}',
+                'status': status, 'site': site_brief})
+            related['circuits/circuits'].append({
+                'id': object_id, 'cid': f'circuit{object_id}', 'status': status,
+                'provider': {'id': 1, 'name': 'Provider', 'display': 'Provider'},
+                'site': site_brief})
+    return related
+
+
+def get_sort_key(value: object) -> tuple:
+    """ Get the key to sort a value by. Numbers sort as numbers,
+        nested objects by their name and empty values last.
+
+        Parameters
+        ----------
+        value: object
+            The value of a field
+
+        Returns
+        -------
+        tuple
+            The key
+    """
+    if isinstance(value, dict):
+        value = value.get('name', value.get('value'))
+    if isinstance(value, (int, float)):
+        return (value is None, 0, value, '')
+    return (value is None, 1, 0, '' if value is None else str(value))
+
+
+def get_property(value: object, writable: bool) -> dict:
+    """ Get the OpenAPI schema of a field from an example value
+
+        Parameters
+        ----------
+        value: object
+            The value of the field in a resource
+
+        writable: bool
+            If set, the schema is for a request body
+
+        Returns
+        -------
+        dict
+            The schema of the field
+    """
+    if isinstance(value, dict) and 'value' in value:
+        if writable:
+            return {'type': 'string', 'enum': [*SITE_STATUSES, '']}
+        return {'type': 'object', 'properties': {
+            'value': {'type': 'string', 'enum': [*SITE_STATUSES]},
+            'label': {'type': 'string', 'enum': [status.title() for status in SITE_STATUSES]}}}
+    if isinstance(value, dict) or value is None:
+        nested = {'$ref': '#/components/schemas/BriefObject'}
+        if writable:
+            return {'oneOf': [{'type': 'integer'}, nested], 'nullable': True}
+        return {'allOf': [nested], 'nullable': True}
+    if isinstance(value, bool):
+        return {'type': 'boolean'}
+    if isinstance(value, int):
+        return {'type': 'integer'}
+    if isinstance(value, list):
+        return {'type': 'array', 'items': {'type': 'integer'}}
+    return {'type': 'string'}
+
+
+def generate_schema(data: dict) -> dict:
+    """ Generate an OpenAPI schema in the layout NetBox uses, with a
+        list, create, update and delete operation per endpoint. The
+        fields are taken from the first resource of every endpoint.
+
+        Parameters
+        ----------
+        data: dict
+            The resources per endpoint
+
+        Returns
+        -------
+        dict
+            The schema
+    """
+    schemas = {'BriefObject': {'type': 'object', 'properties': {
+        'id': {'type': 'integer'}, 'name': {'type': 'string'}}}}
+    paths = {}
+    for endpoint, resources in data.items():
+        example = next(iter(resources.values()), {'id': 1, 'name': ''})
+        name = ''.join(part.capitalize() for part in re.split(r'[/_-]', endpoint))
+        schemas[name] = {'type': 'object', 'properties': {
+            field: {**get_property(value, False),
+                    **({'readOnly': True} if field in READ_ONLY_FIELDS else {})}
+            for field, value in example.items()}}
+        schemas[f'Writable{name}Request'] = {
+            'type': 'object',
+            'required': [field for field in ('name', 'slug') if field in example],
+            'properties': {
+                field: get_property(value, True)
+                for field, value in example.items() if field not in READ_ONLY_FIELDS}}
+        schemas[f'Paginated{name}List'] = {'type': 'object', 'properties': {
+            'count': {'type': 'integer'},
+            'results': {'type': 'array', 'items': {'$ref': f'#/components/schemas/{name}'}}}}
+
+        parameters = [
+            {'name': parameter, 'in': 'query', 'schema': {'type': 'integer'}}
+            for parameter in ('limit', 'offset')]
+        for field, value in example.items():
+            if field in READ_ONLY_FIELDS and field != 'id':
+                continue
+            parameter_type = 'integer' if isinstance(value, int) else 'string'
+            parameters.append({
+                'name': field, 'in': 'query', 'explode': True,
+                'schema': {'type': 'array', 'items': {'type': parameter_type}}})
+            if parameter_type == 'string':
+                parameters.append({'name': f'{field}__ic', 'in': 'query',
+                                   'schema': {'type': 'array', 'items': {'type': 'string'}}})
+
+        body = {'content': {'application/json': {
+            'schema': {'$ref': f'#/components/schemas/Writable{name}Request'}}}}
+        response = {'content': {'application/json': {
+            'schema': {'$ref': f'#/components/schemas/{name}'}}}}
+        paths[f'/api/{endpoint}/'] = {
+            'get': {'parameters': parameters, 'responses': {'200': {'content': {
+                'application/json': {
+                    'schema': {'$ref': f'#/components/schemas/Paginated{name}List'}}}}}},
+            'post': {'requestBody': body, 'responses': {'201': response}}}
+        paths[f'/api/{endpoint}/{{id}}/'] = {
+            'get': {'responses': {'200': response}},
+            'patch': {'requestBody': body, 'responses': {'200': response}},
+            'delete': {'responses': {'204': {}}}}
+
+    paths['/api/status/'] = {'get': {'responses': {'200': {}}}}
+    return {
+        'openapi': '3.0.3',
+        'info': {'title': 'NetBox REST API', 'version': NETBOX_VERSION},
+        'paths': paths,
+        'components': {'schemas': schemas}}
+
+
+def get_type_name(endpoint: str) -> str:
+    """ Get the GraphQL type of an endpoint, like `SiteType`
+
+        Parameters
+        ----------
+        endpoint: str
+            The endpoint, like `dcim/sites`
+
+        Returns
+        -------
+        str
+            The type
+    """
+    return f'{get_list_query(endpoint)[:-len("_list")].capitalize()}Type'
+
+
+def get_list_query(endpoint: str) -> str:
+    """ Get the GraphQL list query of an endpoint, like `site_list`
+
+        Parameters
+        ----------
+        endpoint: str
+            The endpoint, like `dcim/sites`
+
+        Returns
+        -------
+        str
+            The list query
+    """
+    name = endpoint.split('/')[1]
+    return f'{name[:-2] if name.endswith("xes") else name[:-1]}_list'
+
+
+def generate_graphql_types(data: dict) -> dict:
+    """ Generate the GraphQL types from the first resource of every
+        endpoint. Counts are not fields in GraphQL; the related
+        objects are lists instead.
+
+        Parameters
+        ----------
+        data: dict
+            The resources per endpoint
+
+        Returns
+        -------
+        dict
+            The fields of every type, with the kind, the type and if
+            the field is a list
+    """
+    types = {'BriefType': {
+        'id': ('SCALAR', 'ID', False),
+        'name': ('SCALAR', 'String', False),
+        'slug': ('SCALAR', 'String', False),
+        'display': ('SCALAR', 'String', False),
+        'group': ('OBJECT', 'BriefType', False)}}
+    for endpoint, resources in data.items():
+        type_name = get_type_name(endpoint)
+        example = next(iter(resources.values()), {'id': 1})
+        fields = {}
+        for field, value in example.items():
+            if field.endswith('_count') or field.startswith('_'):
+                continue
+            if field == 'id':
+                fields[field] = ('SCALAR', 'ID', False)
+            elif isinstance(value, dict) and 'value' in value:
+                fields[field] = ('ENUM', f'{type_name[:-4]}{field.capitalize()}Enum', False)
+            elif isinstance(value, dict) or value is None:
+                related = RELATED_TYPES.get(field, False)
+                fields[field] = ('OBJECT', type_name if related is None else (
+                    get_type_name(related) if related else 'BriefType'), False)
+            elif isinstance(value, list):
+                fields[field] = ('OBJECT', 'BriefType', True)
+            elif isinstance(value, bool):
+                fields[field] = ('SCALAR', 'Boolean', False)
+            elif isinstance(value, int):
+                fields[field] = ('SCALAR', 'Int', False)
+            else:
+                fields[field] = ('SCALAR', 'String', False)
+        for field, (related_endpoint, _) in REVERSE_FIELDS.get(endpoint, {}).items():
+            fields[field] = ('OBJECT', get_type_name(related_endpoint) if (
+                related_endpoint in data) else 'BriefType', True)
+        types[type_name] = fields
+    return types
+
+
+def get_type_reference(kind: str, name: str, is_list: bool) -> dict:
+    """ Get an introspected type reference
+
+        Parameters
+        ----------
+        kind: str
+            The kind, like `OBJECT`
+
+        name: str
+            The name of the type
+
+        is_list: bool
+            If set, the reference is a non-null list
+
+        Returns
+        -------
+        dict
+            The type reference
+    """
+    reference = {'kind': kind, 'name': name, 'ofType': None}
+    if is_list:
+        reference = {'kind': 'NON_NULL', 'name': None, 'ofType': {
+            'kind': 'LIST', 'name': None, 'ofType': {
+                'kind': 'NON_NULL', 'name': None, 'ofType': reference}}}
+    return reference
+
+
+def generate_introspection(data: dict, types: dict) -> dict:
+    """ Generate the result of the introspection query. Every type
+        has a list query with filters per lookup, like `name__ic`.
+
+        Parameters
+        ----------
+        data: dict
+            The resources per endpoint
+
+        types: dict
+            The GraphQL types
+
+        Returns
+        -------
+        dict
+            The data of the introspection query
+    """
+    def get_field(name: str, kind: str, type_name: str, is_list: bool, args: tuple = ()) -> dict:
+        return {'name': name, 'args': [*args], 'type': get_type_reference(kind, type_name, is_list)}
+
+    def get_input(name: str, kind: str, type_name: str, is_list: bool) -> dict:
+        return {'name': name, 'type': get_type_reference(kind, type_name, is_list)}
+
+    nodes = [{'kind': 'SCALAR', 'name': name, 'fields': None, 'inputFields': None}
+             for name in ('ID', 'String', 'Int', 'Boolean')]
+    nodes.append({'kind': 'INPUT_OBJECT', 'name': 'OffsetPaginationInput', 'fields': None,
+                  'inputFields': [get_input(name, 'SCALAR', 'Int', False)
+                                  for name in ('offset', 'limit')]})
+    query_fields = []
+    for type_name, fields in types.items():
+        nodes.append({'kind': 'OBJECT', 'name': type_name, 'inputFields': None, 'fields': [
+            get_field(field, kind, target, is_list)
+            for field, (kind, target, is_list) in fields.items()]})
+        nodes.extend(
+            {'kind': 'ENUM', 'name': target, 'fields': None, 'inputFields': None}
+            for kind, target, _ in fields.values() if kind == 'ENUM')
+
+    for endpoint in data:
+        type_name = get_type_name(endpoint)
+        filters = []
+        for field, (kind, _, is_list) in types[type_name].items():
+            if is_list and kind == 'OBJECT':
+                continue
+            filters.append(get_input(field, 'SCALAR', 'String', True))
+            if kind == 'OBJECT':
+                filters.append(get_input(f'{field}_id', 'SCALAR', 'String', True))
+            else:
+                filters.append(get_input(f'{field}__ic', 'SCALAR', 'String', True))
+        filters.append(get_input('last_updated__gte', 'SCALAR', 'String', False))
+        nodes.append({'kind': 'INPUT_OBJECT', 'name': f'{type_name[:-4]}Filter',
+                      'fields': None, 'inputFields': filters})
+        query_fields.append(get_field(get_list_query(endpoint), 'OBJECT', type_name, True, (
+            get_input('filters', 'INPUT_OBJECT', f'{type_name[:-4]}Filter', False),
+            get_input('pagination', 'INPUT_OBJECT', 'OffsetPaginationInput', False))))
+
+    nodes.append({'kind': 'OBJECT', 'name': 'Query', 'fields': query_fields, 'inputFields': None})
+    return {'__schema': {'queryType': {'name': 'Query'}, 'types': nodes}}
+
+
+class QueryParser:
+    def __init__(self, query: str) -> None:
+        """ The initiator splits a GraphQL query into tokens
+
+            Parameters
+            ----------
+            query: str
+                The query
+
+            Returns
+            -------
+            None
+        """
+        self.tokens = []
+        position = 0
+        query = query.rstrip(' \n\t,')
+        while position < len(query):
+            match = TOKEN_PATTERN.match(query, position)
+            if match is None:
+                raise ValueError(f'Syntax error at position {position}')
+            position = match.end()
+            punctuation, string, number, name = match.groups()
+            if punctuation:
+                self.tokens.append(punctuation)
+            elif string is not None:
+                self.tokens.append(('value', json.loads(f'"{string}"')))
+            elif number is not None:
+                self.tokens.append(('value', float(number) if '.' in number else int(number)))
+            else:
+                self.tokens.append(('name', name))
+        self.position = 0
+
+    def peek(self) -> object:
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def take(self, expected: Optional[str] = None) -> object:
+        token = self.peek()
+        if token is None or (expected is not None and token != expected):
+            raise ValueError(f'Expected {expected or "a token"} at token {self.position}')
+        self.position += 1
+        return token
+
+    def take_name(self) -> str:
+        token = self.take()
+        if not isinstance(token, tuple) or token[0] != 'name':
+            raise ValueError(f'Expected a name at token {self.position - 1}')
+        return token[1]
+
+    def parse(self) -> list:
+        """ Method to parse the query. Only anonymous queries
+            without variables and fragments are supported.
+
+            Parameters
+            ----------
+            None
+
+            Returns
+            -------
+            list
+                The selections of the query
+        """
+        if self.peek() == ('name', 'query'):
+            self.position += 1
+            if isinstance(self.peek(), tuple):
+                self.position += 1
+        selections = self.parse_selections()
+        if self.peek() is not None:
+            raise ValueError(f'Unexpected token at {self.position}')
+        return selections
+
+    def parse_selections(self) -> list:
+        """ Method to parse a selection set
+
+            Parameters
+            ----------
+            None
+
+            Returns
+            -------
+            list
+                The selections, with the alias, the field name, the
+                arguments and the selections of the field
+        """
+        self.take('{')
+        selections = []
+        while self.peek() != '}':
+            alias = name = self.take_name()
+            if self.peek() == ':':
+                self.take(':')
+                name = self.take_name()
+            arguments = {}
+            if self.peek() == '(':
+                self.take('(')
+                while self.peek() != ')':
+                    argument = self.take_name()
+                    self.take(':')
+                    arguments[argument] = self.parse_value()
+                self.take(')')
+            subselections = self.parse_selections() if self.peek() == '{' else []
+            selections.append((alias, name, arguments, subselections))
+        self.take('}')
+        return selections
+
+    def parse_value(self) -> object:
+        """ Method to parse a value. Enum values become strings.
+
+            Parameters
+            ----------
+            None
+
+            Returns
+            -------
+            object
+                The value
+        """
+        token = self.take()
+        if token == '[':
+            values = []
+            while self.peek() != ']':
+                values.append(self.parse_value())
+            self.take(']')
+            return values
+        if token == '{':
+            values = {}
+            while self.peek() != '}':
+                name = self.take_name()
+                self.take(':')
+                values[name] = self.parse_value()
+            self.take('}')
+            return values
+        if not isinstance(token, tuple):
+            raise ValueError(f'Unexpected "{token}" at token {self.position - 1}')
+        if token[0] == 'name':
+            return {'true': True, 'false': False, 'null': None}.get(token[1], token[1])
+        return token[1]
+
+
+class FakeNetBox:
+    def __init__(self,
+                 sites: int = 1000,
+                 regions: Optional[int] = None,
+                 related_per_site: int = 2,
+                 latency: float = 0.0,
+                 max_page_size: int = 1000) -> None:
+        """ The initiator generates the fixtures
+
+            Parameters
+            ----------
+            sites: int
+                The number of sites
+
+            regions: Optional[int]
+                The number of regions. By default, there are as
+                many regions as sites.
+
+            related_per_site: int
+                The number of racks, devices, prefixes, VLANs and
+                circuits per site. Only the first 100 sites get
+                related objects.
+
+            latency: float
+                The time in seconds every request waits before it
+                is answered
+
+            max_page_size: int
+                The largest page that is returned, like the
+                `MAX_PAGE_SIZE` setting of NetBox
+
+            Returns
+            -------
+            None
+        """
+        self.latency = latency
+        self.max_page_size = max_page_size
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.requests_by_method = {}
+
+        # The number of the next requests that fail with a server
+        # error, to test the retries
+        self.failures = 0
+
+        region_list = generate_regions(sites if regions is None else regions)
+        site_list = generate_sites(sites, region_list)
+        self.data = {
+            'dcim/regions': {region['id']: region for region in region_list},
+            'dcim/sites': {site['id']: site for site in site_list}}
+        for endpoint, resources in generate_related(site_list[:100], related_per_site).items():
+            self.data[endpoint] = {resource['id']: resource for resource in resources}
+        self.graphql_types = generate_graphql_types(self.data)
+        self.list_queries = {get_list_query(endpoint): endpoint for endpoint in self.data}
+
+        # The exact name filter is used for every lookup by name, so
+        # it has an index like in the database of NetBox. Names are
+        # not unique everywhere, like the names of regions with
+        # different parents, so a name has a set of IDs.
+        self.names = {endpoint: {} for endpoint in self.data}
+        for endpoint, resources in self.data.items():
+            for resource_id, resource in resources.items():
+                self.index_name(endpoint, resource_id, resource.get('name'))
+
+    def index_name(self, endpoint: str, resource_id: int, name: Optional[str]) -> None:
+        """ Method to add a resource to the name index
+
+            Parameters
+            ----------
+            endpoint: str
+                The endpoint
+
+            resource_id: int
+                The ID of the resource
+
+            name: Optional[str]
+                The name of the resource
+
+            Returns
+            -------
+            None
+        """
+        self.names[endpoint].setdefault(name, {})[resource_id] = None
+
+    def unindex_name(self, endpoint: str, resource_id: int, name: Optional[str]) -> None:
+        """ Method to remove a resource from the name index
+
+            Parameters
+            ----------
+            endpoint: str
+                The endpoint
+
+            resource_id: int
+                The ID of the resource
+
+            name: Optional[str]
+                The name of the resource
+
+            Returns
+            -------
+            None
+        """
+        ids = self.names[endpoint].get(name, {})
+        ids.pop(resource_id, None)
+        if not ids:
+            self.names[endpoint].pop(name, None)
+
+    def count_request(self, method: str) -> None:
+        """ Method to count a request
+
+            Parameters
+            ----------
+            method: str
+                The HTTP method
+
+            Returns
+            -------
+            None
+        """
+        with self.lock:
+            self.requests += 1
+            self.requests_by_method[method] = self.requests_by_method.get(method, 0) + 1
+
+    def get_stats(self) -> dict:
+        """ Method to get the request counters
+
+            Parameters
+            ----------
+            None
+
+            Returns
+            -------
+            dict
+                The total number of requests and the number per
+                method
+        """
+        with self.lock:
+            return {'requests': self.requests, 'methods': dict(self.requests_by_method)}
+
+    def take_failure(self) -> bool:
+        """ Method to check if a request fails with a server error.
+            Every failing request lowers `failures` by one.
+
+            Parameters
+            ----------
+            None
+
+            Returns
+            -------
+            bool
+                True if the request fails
+        """
+        with self.lock:
+            if self.failures == 0:
+                return False
+            self.failures -= 1
+            return True
+
+    def reset_stats(self) -> None:
+        """ Method to reset the request counters
+
+            Parameters
+            ----------
+            None
+
+            Returns
+            -------
+            None
+        """
+        with self.lock:
+            self.requests = 0
+            self.requests_by_method = {}
+
+    def select(self, endpoint: str, query: dict) -> list:
+        """ Method to get the resources that match filters. The
+            filters work like the NetBox filters for the lookups
+            that nbcli uses.
+
+            Parameters
+            ----------
+            endpoint: str
+                The endpoint, like `dcim/sites`
+
+            query: dict
+                The parsed query string
+
+            Returns
+            -------
+            list
+                The matching resources
+        """
+        resources = self.data[endpoint]
+        filters = {
+            parameter: values for parameter, values in query.items()
+            if parameter not in CONTROL_PARAMETERS}
+
+        if 'name' in filters:
+            candidates = [
+                resources[resource_id] for name in filters.pop('name')
+                for resource_id in self.names[endpoint].get(name, ())]
+        else:
+            candidates = resources.values()
+
+        if not filters:
+            return [*candidates]
+        return [resource for resource in candidates if self.match(resource, filters)]
+
+    @staticmethod
+    def match(resource: dict, filters: dict) -> bool:
+        """ Method to check if a resource matches filters
+
+            Parameters
+            ----------
+            resource: dict
+                The resource
+
+            filters: dict
+                The filters with a list of values per filter
+
+            Returns
+            -------
+            bool
+                True if the resource matches all filters
+        """
+        for parameter, values in filters.items():
+            field, _, lookup = parameter.partition('__')
+            if field.endswith('_id') and field[:-3] in resource:
+                related = resource[field[:-3]]
+                value = str(related['id']) if related else 'null'
+                choices = {value}
+            else:
+                value = resource.get(field)
+                if isinstance(value, dict):
+                    # Nested objects match by their value or slug
+                    choices = {
+                        str(value[key]) for key in ('value', 'slug', 'id') if key in value}
+                    value = value.get('value', value.get('id'))
+                value = 'null' if value is None else str(value)
+                if not isinstance(resource.get(field), dict):
+                    choices = {value}
+
+            if lookup == 'ic':
+                if not any(wanted.lower() in value.lower() for wanted in values):
+                    return False
+            elif lookup == 'gte':
+                if not value >= values[0]:
+                    return False
+            elif lookup == 'lte':
+                if not value <= values[0]:
+                    return False
+            elif not choices.intersection(values):
+                return False
+        return True
+
+    @staticmethod
+    def order(resources: list, ordering: str) -> list:
+        """ Method to sort resources like the `ordering` parameter
+
+            Parameters
+            ----------
+            resources: list
+                The resources
+
+            ordering: str
+                Comma-separated fields; a `-` sorts descending
+
+            Returns
+            -------
+            list
+                The sorted resources
+        """
+        for field in reversed(ordering.split(',')):
+            name = field.lstrip('-')
+            resources = sorted(
+                resources,
+                key=lambda resource: get_sort_key(resource.get(name)),
+                reverse=field.startswith('-'))
+        return resources
+
+    def list(self, endpoint: str, query: dict, base_url: str) -> dict:
+        """ Method to get a page of resources
+
+            Parameters
+            ----------
+            endpoint: str
+                The endpoint
+
+            query: dict
+                The parsed query string
+
+            base_url: str
+                The URL of the endpoint for the `next` link
+
+            Returns
+            -------
+            dict
+                The page, like NetBox returns it
+        """
+        resources = self.select(endpoint, query)
+        if 'ordering' in query:
+            resources = self.order(resources, query['ordering'][0])
+
+        limit = int(query.get('limit', ['50'])[0]) or self.max_page_size
+        limit = min(limit, self.max_page_size)
+        offset = int(query.get('offset', ['0'])[0])
+        page = resources[offset:offset + limit]
+
+        if 'fields' in query:
+            fields = query['fields'][0].split(',')
+            page = [{field: resource.get(field) for field in fields} for resource in page]
+        elif query.get('brief', [''])[0].lower() in ('1', 'true'):
+            page = [
+                {field: resource.get(field) for field in ('id', 'url', 'display', 'name', 'slug')}
+                for resource in page]
+
+        next_url = None
+        if offset + limit < len(resources):
+            next_url = f'{base_url}?limit={limit}&offset={offset + limit}'
+        return {'count': len(resources), 'next': next_url, 'previous': None, 'results': page}
+
+    def graphql(self, query: str) -> dict:
+        """ Method to answer a GraphQL query. The list queries use the
+            filters of the REST API; the introspection query returns
+            the generated types.
+
+            Parameters
+            ----------
+            query: str
+                The query
+
+            Returns
+            -------
+            dict
+                The result, with `data` or `errors`
+        """
+        if '__schema' in query:
+            return {'data': generate_introspection(self.data, self.graphql_types)}
+
+        data = {}
+        try:
+            for alias, name, arguments, selections in QueryParser(query).parse():
+                endpoint = self.list_queries.get(name)
+                if endpoint is None:
+                    raise ValueError(f"Cannot query field '{name}' on type 'Query'.")
+                filters = {
+                    field: [str(value) for value in (values if isinstance(values, list) else [values])]
+                    for field, values in (arguments.get('filters') or {}).items()}
+                pagination = arguments.get('pagination') or {}
+                offset = pagination.get('offset') or 0
+                limit = pagination.get('limit')
+                resources = self.select(endpoint, filters)
+                resources = resources[offset:None if limit is None else offset + limit]
+                data[alias] = [
+                    self.project(endpoint, get_type_name(endpoint), resource, selections)
+                    for resource in resources]
+        except ValueError as error:
+            return {'data': None, 'errors': [{'message': str(error)}]}
+        return {'data': data}
+
+    def project(self, endpoint: Optional[str], type_name: str, resource: dict, selections: list) -> dict:
+        """ Method to select the fields of a resource for a GraphQL
+            query. Related objects are looked up by their URL, so
+            their fields can be selected too.
+
+            Parameters
+            ----------
+            endpoint: Optional[str]
+                The endpoint of the resource; None for brief types
+
+            type_name: str
+                The GraphQL type of the resource
+
+            resource: dict
+                The resource
+
+            selections: list
+                The parsed selections
+
+            Returns
+            -------
+            dict
+                The selected fields
+        """
+        fields = self.graphql_types[type_name]
+        result = {}
+        for alias, name, _, subselections in selections:
+            if name not in fields:
+                raise ValueError(f"Cannot query field '{name}' on type '{type_name}'.")
+            kind, target, is_list = fields[name]
+            if kind == 'OBJECT' and not subselections:
+                raise ValueError(f"Field '{name}' of type '{target}' must have a selection.")
+
+            if name in REVERSE_FIELDS.get(endpoint, {}):
+                related_endpoint, link = REVERSE_FIELDS[endpoint][name]
+                value = [
+                    related for related in self.data.get(related_endpoint, {}).values()
+                    if (related.get(link) or {}).get('id') == resource['id']]
+            else:
+                value = resource.get(name)
+
+            if value is None:
+                result[alias] = None
+            elif name == 'id':
+                result[alias] = str(value)
+            elif kind == 'ENUM':
+                result[alias] = f'{name.upper()}_{value["value"].upper()}'
+            elif kind == 'OBJECT':
+                items = [self.get_full(item) for item in (value if is_list else [value])]
+                items = [
+                    self.project(target_endpoint, target, item, subselections)
+                    for target_endpoint, item in items]
+                result[alias] = items if is_list else items[0]
+            else:
+                result[alias] = value
+        return result
+
+    def get_full(self, related: dict) -> tuple:
+        """ Method to get the full resource of a nested object
+
+            Parameters
+            ----------
+            related: dict
+                The nested object
+
+            Returns
+            -------
+            tuple
+                The endpoint and the resource, or None and the nested
+                object if it has no URL
+        """
+        match = PATH_PATTERN.match(related.get('url') or '')
+        if match is None or match.group(1) not in self.data:
+            return None, related
+        return match.group(1), self.data[match.group(1)].get(int(match.group(2)), related)
+
+    def create(self, endpoint: str, values: dict) -> dict:
+        """ Method to create a resource
+
+            Parameters
+            ----------
+            endpoint: str
+                The endpoint
+
+            values: dict
+                The fields of the resource
+
+            Returns
+            -------
+            dict
+                The created resource
+        """
+        with self.lock:
+            resources = self.data[endpoint]
+            resource_id = max(resources, default=0) + 1
+            template = next(iter(resources.values()), {})
+            resource = {
+                field: 0 if field.endswith('_count') else None for field in template}
+            resource.update(values)
+            if isinstance(resource.get('status'), str):
+                resource['status'] = {
+                    'value': resource['status'], 'label': resource['status'].title()}
+            resource.update(
+                id=resource_id,
+                url=f'/api/{endpoint}/{resource_id}/',
+                display=values.get('name'),
+                asns=resource.get('asns') or [],
+                last_updated=time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()))
+            resources[resource_id] = resource
+            self.index_name(endpoint, resource_id, resource.get('name'))
+        return resource
+
+    def update(self, endpoint: str, resource_id: int, values: dict) -> Optional[dict]:
+        """ Method to update a resource
+
+            Parameters
+            ----------
+            endpoint: str
+                The endpoint
+
+            resource_id: int
+                The ID of the resource
+
+            values: dict
+                The fields to change
+
+            Returns
+            -------
+            Optional[dict]
+                The updated resource, or None if it does not exist
+        """
+        with self.lock:
+            resource = self.data[endpoint].get(resource_id)
+            if resource is None:
+                return None
+            self.unindex_name(endpoint, resource_id, resource.get('name'))
+            if isinstance(values.get('status'), str):
+                values = {**values, 'status': {
+                    'value': values['status'], 'label': values['status'].title()}}
+            resource.update(
+                values, last_updated=time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()))
+            self.index_name(endpoint, resource_id, resource.get('name'))
+        return resource
+
+    def delete(self, endpoint: str, resource_id: int) -> bool:
+        """ Method to delete a resource
+
+            Parameters
+            ----------
+            endpoint: str
+                The endpoint
+
+            resource_id: int
+                The ID of the resource
+
+            Returns
+            -------
+            bool
+                True if the resource existed
+        """
+        with self.lock:
+            resource = self.data[endpoint].pop(resource_id, None)
+            if resource is None:
+                return False
+            self.unindex_name(endpoint, resource_id, resource.get('name'))
+        return True
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    # Keep connections open, like a real NetBox behind a web server
+    protocol_version = 'HTTP/1.1'
+    netbox: FakeNetBox
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def send(self, status: int, body: Optional[object] = None) -> None:
+        data = json.dumps(body).encode() if body is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('API-Version', NETBOX_VERSION.rsplit('.', 1)[0])
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def read_body(self) -> object:
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length)) if length else None
+
+    def fail(self) -> bool:
+        """ Method to answer the request with a server error if the
+            fake NetBox has failures left
+
+            Parameters
+            ----------
+            None
+
+            Returns
+            -------
+            bool
+                True if the request was answered with an error
+        """
+        if not self.netbox.take_failure():
+            return False
+        self.read_body()
+        self.send(503, {'detail': 'Service unavailable.'})
+        return True
+
+    def route(self) -> tuple:
+        """ Method to count the request, wait for the latency and
+            find the endpoint
+
+            Parameters
+            ----------
+            None
+
+            Returns
+            -------
+            tuple
+                The parsed URL, the endpoint and the resource ID.
+                The endpoint is None if it does not exist.
+        """
+        url = urlparse(self.path)
+        if url.path.startswith('/_stats/'):
+            return url, None, None
+
+        self.netbox.count_request(self.command)
+        if self.netbox.latency:
+            time.sleep(self.netbox.latency)
+        match = PATH_PATTERN.match(url.path)
+        if not match or match.group(1) not in self.netbox.data:
+            return url, None, None
+        return url, match.group(1), int(match.group(2)) if match.group(2) else None
+
+    def do_GET(self) -> None:
+        url, endpoint, resource_id = self.route()
+        if endpoint is not None and self.fail():
+            return
+        if url.path == '/_stats/':
+            return self.send(200, self.netbox.get_stats())
+        if url.path == '/api/':
+            return self.send(200, {
+                endpoint.split('/')[0]: f'{url.path}{endpoint.split("/")[0]}/'
+                for endpoint in self.netbox.data})
+        if url.path == '/api/status/':
+            return self.send(200, {
+                'django-version': '5.0',
+                'netbox-version': NETBOX_VERSION,
+                'python-version': sys.version.split()[0],
+                'installed-apps': {},
+                'plugins': {},
+                'rq-workers-running': 1})
+        if url.path == '/api/schema/':
+            return self.send(200, generate_schema(self.netbox.data))
+        if endpoint is None:
+            return self.send(404, {'detail': 'Not found.'})
+
+        if resource_id is not None:
+            resource = self.netbox.data[endpoint].get(resource_id)
+            if resource is None:
+                return self.send(404, {'detail': 'Not found.'})
+            return self.send(200, resource)
+
+        base_url = f'http://{self.headers["Host"]}{url.path}'
+        self.send(200, self.netbox.list(endpoint, parse_qs(url.query), base_url))
+
+    def do_POST(self) -> None:
+        url, endpoint, resource_id = self.route()
+        if endpoint is not None and self.fail():
+            return
+        if url.path == '/graphql/':
+            return self.send(200, self.netbox.graphql((self.read_body() or {}).get('query', '')))
+        if endpoint is None or resource_id is not None:
+            return self.send(404, {'detail': 'Not found.'})
+        body = self.read_body()
+        created = [self.netbox.create(endpoint, values) for values in
+                   (body if isinstance(body, list) else [body])]
+        self.send(201, created if isinstance(body, list) else created[0])
+
+    def do_PATCH(self) -> None:
+        url, endpoint, resource_id = self.route()
+        if endpoint is not None and self.fail():
+            return
+        if endpoint is None:
+            return self.send(404, {'detail': 'Not found.'})
+        body = self.read_body()
+        if resource_id is not None:
+            resource = self.netbox.update(endpoint, resource_id, body)
+            return self.send(200, resource) if resource else self.send(404, {'detail': 'Not found.'})
+
+        updated = [
+            self.netbox.update(endpoint, values['id'], values) for values in body]
+        if None in updated:
+            return self.send(400, [{'id': ['Object not found.']}])
+        self.send(200, updated)
+
+    def do_DELETE(self) -> None:
+        url, endpoint, resource_id = self.route()
+        if endpoint is not None and self.fail():
+            return
+        if url.path == '/_stats/':
+            self.netbox.reset_stats()
+            return self.send(204)
+        if endpoint is None:
+            return self.send(404, {'detail': 'Not found.'})
+        if resource_id is not None:
+            if not self.netbox.delete(endpoint, resource_id):
+                return self.send(404, {'detail': 'Not found.'})
+            return self.send(204)
+
+        for values in self.read_body():
+            self.netbox.delete(endpoint, values['id'])
+        self.send(204)
+
+
+def create_server(netbox: FakeNetBox, host: str = '127.0.0.1', port: int = 0) -> ThreadingHTTPServer:
+    """ Create a server for a fake NetBox. Every request is handled
+        in its own thread.
+
+        Parameters
+        ----------
+        netbox: FakeNetBox
+            The fake NetBox with the fixtures
+
+        host: str
+            The address to listen on
+
+        port: int
+            The port to listen on; 0 picks a free port
+
+        Returns
+        -------
+        ThreadingHTTPServer
+            The server
+    """
+    handler = type('Handler', (RequestHandler,), {'netbox': netbox})
+    server_class = type('Server', (ThreadingHTTPServer,), {
+        # Many clients connect at the same time when the workers
+        # and the pool size are high
+        'request_queue_size': 1024,
+        'daemon_threads': True})
+    return server_class((host, port), handler)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='A local stand-in for the NetBox API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=0, help='0 picks a free port')
+    parser.add_argument('--sites', type=int, default=1000)
+    parser.add_argument('--regions', type=int, help='by default as many as sites')
+    parser.add_argument('--related-per-site', type=int, default=2)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds per request')
+    parser.add_argument('--max-page-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    netbox = FakeNetBox(
+        sites=args.sites,
+        regions=args.regions,
+        related_per_site=args.related_per_site,
+        latency=args.latency,
+        max_page_size=args.max_page_size)
+    server = create_server(netbox, args.host, args.port)
+    print(f'http://{server.server_address[0]}:{server.server_address[1]}', flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
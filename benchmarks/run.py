@@ -0,0 +1,293 @@
+""" Benchmarks for nbcli. Every fixture size gets its own fake NetBox
+    server (see `fake_netbox.py`) and its own home directory with an
+    instance that points to it. The real commands run in a new Python
+    process, so the results include the startup time, like for a user.
+
+    For every command, the wall time of every run, the peak RSS and
+    the number of requests NetBox received are recorded. The results
+    are saved as JSON; `--compare` prints the changes against an
+    earlier result file.
+
+    Usage:
+
+        python benchmarks/run.py --sizes 1000,10000 --output results.json
+        python benchmarks/run.py --compare old.json --output new.json """
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from typing import Optional
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY_DIR = os.path.dirname(BENCHMARK_DIR)
+CLI_SCRIPT = os.path.join(REPOSITORY_DIR, 'src', 'nbcli_cli.py')
+
+# The commands that are measured, with a name and the arguments.
+# The list commands skip the cache, so every run talks to NetBox.
+COMMANDS = [
+    ('startup', ['--help']),
+    ('status', ['status']),
+    ('config list-instances', ['config', 'list-instances']),
+    ('sites list', ['organization', 'sites', 'list', '--no-cache']),
+    ('regions list', ['organization', 'regions', 'list', '--no-cache']),
+    ('sites inspect', ['organization', 'sites', 'inspect', 'site1', '--no-cache']),
+    ('sites inspect --deep', [
+        'organization', 'sites', 'inspect', 'site1', 'site2', '--deep', '--no-cache'])
+]
+
+DEFAULT_SIZES = '1000,10000,100000'
+
+# Changes smaller than this are reported as unchanged
+COMPARE_THRESHOLD = 0.1
+
+
+class FakeServer:
+    def __init__(self, size: int, latency: float, max_page_size: int) -> None:
+        """ The initiator starts a fake NetBox in a new process and
+            waits until it listens
+
+            Parameters
+            ----------
+            size: int
+                The number of sites and regions
+
+            latency: float
+                The latency per request in seconds
+
+            max_page_size: int
+                The largest page the server returns
+
+            Returns
+            -------
+            None
+        """
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.join(BENCHMARK_DIR, 'fake_netbox.py'),
+             '--sites', str(size), '--latency', str(latency),
+             '--max-page-size', str(max_page_size)],
+            stdout=subprocess.PIPE, text=True)
+        self.url = self.process.stdout.readline().strip()
+        if not self.url:
+            raise RuntimeError('The fake NetBox did not start')
+
+    def request(self, method: str) -> Optional[dict]:
+        request = urllib.request.Request(f'{self.url}/_stats/', method=method)
+        with urllib.request.urlopen(request) as response:
+            body = response.read()
+        return json.loads(body) if body else None
+
+    def stop(self) -> None:
+        self.process.terminate()
+        self.process.wait()
+
+
+def run_command(arguments: list, environment: dict) -> dict:
+    """ Run nbcli in a new process
+
+        Parameters
+        ----------
+        arguments: list
+            The arguments for nbcli
+
+        environment: dict
+            The environment for the process
+
+        Returns
+        -------
+        dict
+            The wall time in seconds, the peak RSS in KiB and the
+            exit code
+    """
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, CLI_SCRIPT, *arguments],
+        env=environment, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    _, status, usage = os.wait4(process.pid, 0)
+    wall_time = time.perf_counter() - start
+    errors = process.stderr.read().decode(errors='replace')
+    process.stderr.close()
+    process.returncode = os.waitstatus_to_exitcode(status)
+
+    # `ru_maxrss` is in bytes on macOS and in KiB elsewhere
+    max_rss = usage.ru_maxrss // 1024 if sys.platform == 'darwin' else usage.ru_maxrss
+    return {
+        'wall_time': wall_time,
+        'max_rss_kib': max_rss,
+        'returncode': process.returncode,
+        'stderr': errors[-2000:]}
+
+
+def create_home(server: FakeServer, extra_arguments: list) -> dict:
+    """ Create a home directory with an instance for the fake NetBox
+        and get the environment that uses it
+
+        Parameters
+        ----------
+        server: FakeServer
+            The fake NetBox
+
+        extra_arguments: list
+            Extra arguments for `config create-instance`
+
+        Returns
+        -------
+        dict
+            The environment for nbcli
+    """
+    home = tempfile.mkdtemp(prefix='nbcli-benchmark-')
+    environment = {**os.environ, 'HOME': home, 'COLUMNS': '120'}
+    host, port = server.url.rsplit('//', 1)[1].split(':')
+    for arguments in (
+            ['config', 'create-instance', '--name', 'benchmark', '--server', host,
+             '--port', port, '--api-key', '0123456789abcdef', '--no-tls', *extra_arguments],
+            ['config', 'activate-instance', 'benchmark']):
+        result = run_command(arguments, environment)
+        if result['returncode'] != 0:
+            raise RuntimeError(f'Could not configure nbcli: {result["stderr"]}')
+    return environment
+
+
+def run_size(size: int, args: argparse.Namespace) -> list:
+    """ Run all commands against a fake NetBox with `size` sites
+        and regions
+
+        Parameters
+        ----------
+        size: int
+            The number of sites and regions
+
+        args: argparse.Namespace
+            The command line arguments
+
+        Returns
+        -------
+        list
+            The results per command
+    """
+    instance_arguments = []
+    if args.workers:
+        instance_arguments += ['--workers', str(args.workers)]
+    if args.backend:
+        instance_arguments += ['--backend', args.backend]
+
+    server = FakeServer(size, args.latency, args.max_page_size)
+    results = []
+    try:
+        environment = create_home(server, instance_arguments)
+        global_arguments = ['--output', args.format] if args.format != 'table' else []
+        for name, arguments in COMMANDS:
+            if args.commands and name not in args.commands:
+                continue
+            runs = []
+            for _ in range(args.repeat):
+                server.request('DELETE')
+                run = run_command([*global_arguments, *arguments], environment)
+                run['requests'] = server.request('GET')['requests']
+                runs.append(run)
+                if run['returncode'] != 0:
+                    break
+
+            wall_times = [run['wall_time'] for run in runs]
+            result = {
+                'size': size,
+                'command': name,
+                'wall_times': wall_times,
+                'wall_time': statistics.median(wall_times),
+                'max_rss_kib': max(run['max_rss_kib'] for run in runs),
+                'requests': runs[-1]['requests'],
+                'returncode': runs[-1]['returncode']}
+            if result['returncode'] != 0:
+                result['stderr'] = runs[-1]['stderr']
+            results.append(result)
+            print_result(result)
+    finally:
+        server.stop()
+    return results
+
+
+def print_result(result: dict, previous: Optional[dict] = None) -> None:
+    line = (f'{result["size"]:>7}  {result["command"]:<24} '
+            f'{result["wall_time"]:8.3f}s {result["max_rss_kib"] / 1024:8.1f} MiB '
+            f'{result["requests"]:>6} requests')
+    if result['returncode'] != 0:
+        line += f'  FAILED ({result["returncode"]})'
+    if previous:
+        change = result['wall_time'] / previous['wall_time'] - 1
+        marker = ''
+        if change > COMPARE_THRESHOLD:
+            marker = ' slower'
+        elif change < -COMPARE_THRESHOLD:
+            marker = ' faster'
+        line += f'  {change:+.0%} vs {previous["wall_time"]:.3f}s{marker}'
+    print(line, flush=True)
+
+
+def get_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'describe', '--always', '--dirty'], cwd=REPOSITORY_DIR,
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmarks for nbcli')
+    parser.add_argument('--sizes', default=DEFAULT_SIZES,
+                        help='comma-separated numbers of sites and regions')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='latency per request in seconds')
+    parser.add_argument('--max-page-size', type=int, default=1000,
+                        help='largest page the server returns')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per command')
+    parser.add_argument('--workers', type=int, help='workers setting of the instance')
+    parser.add_argument('--backend', help='backend setting of the instance')
+    parser.add_argument('--format', default='table', choices=['table', 'jsonl', 'csv', 'tsv'],
+                        help='output format of the list commands')
+    parser.add_argument('--commands', nargs='*', help='only run these commands')
+    parser.add_argument('--output', help='file to save the results as JSON')
+    parser.add_argument('--compare', help='earlier result file to compare with')
+    args = parser.parse_args()
+
+    results = []
+    for size in [int(size) for size in args.sizes.split(',')]:
+        results += run_size(size, args)
+
+    report = {
+        'revision': get_revision(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'settings': {
+            'latency': args.latency,
+            'max_page_size': args.max_page_size,
+            'repeat': args.repeat,
+            'workers': args.workers,
+            'backend': args.backend,
+            'format': args.format},
+        'results': results}
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(report, output_file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as compare_file:
+            earlier = json.load(compare_file)
+        previous = {
+            (result['size'], result['command']): result for result in earlier['results']}
+        print(f'\nCompared with {earlier.get("revision")} ({earlier.get("created")})')
+        for result in results:
+            print_result(result, previous.get((result['size'], result['command'])))
+
+    if any(result['returncode'] != 0 for result in results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,22 @@
 from .cli import cli
-from .config import config
-from .organization import organization
-from .organization_sites import sites
-from .organization_regions import regions
-from .status import status
+
+# The command modules are imported when they are used, so importing
+# the package does not import `pynetbox` and `rich.table`
+lazy_exports = {
+    'config': 'nbcli.config',
+    'flush': 'nbcli.journal',
+    'organization': 'nbcli.organization',
+    'sites': 'nbcli.organization_sites',
+    'regions': 'nbcli.organization_regions',
+    'resources': 'nbcli.resources',
+    'status': 'nbcli.status',
+    'summary': 'nbcli.summary',
+    'sync': 'nbcli.sync'
+}
+
+
+def __getattr__(name: str):
+    if name in lazy_exports:
+        from importlib import import_module
+        return getattr(import_module(lazy_exports[name]), name)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -0,0 +1,1019 @@
+""" Module with the backends that send the requests to NetBox. All
+    backends return the resources as dicts with the JSON that NetBox
+    returns, so the commands work the same with every backend.
+
+    - `pynetbox`: the synchronous pynetbox client. Concurrent
+      requests use a thread pool.
+    - `async`: an asyncio client based on httpx. The event loop runs
+      in a background thread, so the commands stay synchronous
+      while hundreds of requests can be in flight. HTTP/2 is used
+      for HTTPS when the `h2` package is installed.
+    - `graphql`: the pynetbox client, but lists that select fields
+      use one GraphQL query per page, which includes the fields of
+      related objects. Everything else uses the REST API. """
+import asyncio
+import atexit
+import logging
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import cycle, islice
+from typing import Any, Iterator, Optional, Union
+from .exceptions import BackendUnavailable, GraphQLUnsupported, NetBoxRequestError, SchemaError
+from .fetch import DEFAULT_PAGE_SIZE
+from .nbcli import nbcli_object
+from .timings import timings
+
+# The prefix of v2 API tokens, which use a different header
+V2_TOKEN_PREFIX = 'nbt_'
+
+# The number of connections per httpx client. Finding a free
+# connection in a large httpx pool costs time for every connection,
+# so large pools are split over several clients.
+CLIENT_CONNECTIONS = 10
+
+# The URL of a resource in the REST API, like `/api/dcim/regions/3/`
+RESOURCE_URL_PATTERN = re.compile(r'/api/([a-z0-9-]+)/([a-z0-9-]+)/(\d+)/?$')
+
+logger = logging.getLogger('backends')
+
+
+def get_auth_header(token: str) -> dict:
+    """ Get the authorization header for an API token
+
+        Parameters
+        ----------
+        token: str
+            The API token
+
+        Returns
+        -------
+        dict
+            The header, or an empty dict if there is no token
+    """
+    if not token:
+        return {}
+    if token.startswith(V2_TOKEN_PREFIX) and '.' in token[len(V2_TOKEN_PREFIX):]:
+        return {'Authorization': f'Bearer {token}'}
+    return {'Authorization': f'Token {token}'}
+
+
+class Backend:
+    # If set, fields of related objects like `region.parent` can be
+    # selected with the `fields` filter
+    field_selection = False
+
+    def __init__(self, url: str, token: str, settings: dict) -> None:
+        """ The initiator sets the connection details
+
+            Parameters
+            ----------
+            url: str
+                The URL of NetBox, like `http://netbox:8000/`
+
+            token: str
+                The API token
+
+            settings: dict
+                The instance settings, like `pool_size` and
+                `read_timeout`
+
+            Returns
+            -------
+            None
+        """
+        self.url = url.rstrip('/')
+        self.token = token
+        self.settings = settings
+        self.executor: Optional[ThreadPoolExecutor] = None
+
+    def list_page(self, endpoint: str, filters: dict, limit: int, offset: int) -> tuple:
+        """ Method to retrieve one page of resources
+
+            Parameters
+            ----------
+            endpoint: str
+                The endpoint, like `dcim.sites`
+
+            filters: dict
+                The filters for the resources
+
+            limit: int
+                The size of the page
+
+            offset: int
+                The offset of the page
+
+            Returns
+            -------
+            tuple
+                The resources on the page and the total count
+        """
+        raise NotImplementedError
+
+    def count(self, endpoint: str, filters: dict) -> int:
+        """ Method to get the number of resources that match filters.
+            Only one resource is requested; NetBox returns the total
+            count with every page.
+
+            Parameters
+            ----------
+            endpoint: str
+                The endpoint, like `dcim.sites`
+
+            filters: dict
+                The filters for the resources
+
+            Returns
+            -------
+            int
+                The number of resources
+        """
+        return self.list_page(endpoint, filters, 1, 0)[1]
+
+    def get(self, endpoint: str, resource_id: Optional[int] = None, **filters) -> Optional[dict]:
+        """ Method to retrieve one resource by its ID or by filters
+
+            Parameters
+            ----------
+            endpoint: str
+                The endpoint
+
+            resource_id: Optional[int]
+                The ID of the resource
+
+            **filters: dict
+                Filters that match one resource, like `name`
+
+            Returns
+            -------
+            Optional[dict]
+                The resource, or None if it does not exist
+        """
+        raise NotImplementedError
+
+    def create(self, endpoint: str, data: Union[dict, list]) -> Union[dict, list]:
+        """ Method to create one resource, or a list of resources
+            with one request
+
+            Parameters
+            ----------
+            endpoint: str
+                The endpoint
+
+            data: Union[dict, list]
+                The resource or the resources
+
+            Returns
+            -------
+            Union[dict, list]
+                The created resource or resources
+        """
+        raise NotImplementedError
+
+    def update(self,
+               endpoint: str,
+               data: Union[dict, list],
+               resource_id: Optional[int] = None) -> Union[dict, list]:
+        """ Method to update one resource, or a list of resources
+            with one request. For a list, every item has an `id`.
+
+            Parameters
+            ----------
+            endpoint: str
+                The endpoint
+
+            data: Union[dict, list]
+                The values to update
+
+            resource_id: Optional[int]
+                The ID of the resource, for a single resource
+
+            Returns
+            -------
+            Union[dict, list]
+                The updated resource or resources
+        """
+        raise NotImplementedError
+
+    def delete(self, endpoint: str, resource_ids: Union[int, list]) -> bool:
+        """ Method to delete one resource, or a list of resources
+            with one request
+
+            Parameters
+            ----------
+            endpoint: str
+                The endpoint
+
+            resource_ids: Union[int, list]
+                The ID or the IDs
+
+            Returns
+            -------
+            bool
+                True if the resources are deleted
+        """
+        raise NotImplementedError
+
+    def status(self) -> dict:
+        """ Method to retrieve the status of NetBox
+
+            Parameters
+            ----------
+            None
+
+            Returns
+            -------
+            dict
+                The status
+        """
+        raise NotImplementedError
+
+    def schema(self) -> dict:
+        """ Method to retrieve the OpenAPI schema of NetBox
+
+            Parameters
+            ----------
+            None
+
+            Returns
+            -------
+            dict
+                The schema
+        """
+        raise NotImplementedError
+
+    def version(self) -> str:
+        """ Method to retrieve the API version of NetBox
+
+            Parameters
+            ----------
+            None
+
+            Returns
+            -------
+            str
+                The version, like `4.1`, or an empty string
+        """
+        raise NotImplementedError
+
+    def submit(self, method: str, *args, **kwargs) -> Future:
+        """ Method to start a call of one of the methods above
+            without waiting for it. The call uses the instance of the
+            current thread.
+
+            Parameters
+            ----------
+            method: str
+                The name of the method, like `get`
+
+            *args: list
+                Arguments for the method
+
+            **kwargs: dict
+                Keyword arguments for the method
+
+            Returns
+            -------
+            Future
+                The future for the result
+        """
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.settings['pool_size'])
+        return self.executor.submit(nbcli_object.bind_instance(getattr(self, method)), *args, **kwargs)
+
+    def gather(self, calls: list) -> list:
+        """ Method to run calls at the same time
+
+            Parameters
+            ----------
+            calls: list
+                Tuples with the name of the method and its arguments,
+                like `('get', 'dcim.sites', 1)`
+
+            Returns
+            -------
+            list
+                The results in the order of the calls
+        """
+        futures = [self.submit(method, *args) for method, *args in calls]
+        return [future.result() for future in futures]
+
+    def resolve_nested(self, resources: list, paths: list) -> None:
+        """ Method to add the fields of related objects, given as
+            paths like `region.parent`. The REST API only returns the
+            brief form of related objects, so they are retrieved by
+            their URL. The related objects of one level are retrieved
+            at the same time.
+
+            Parameters
+            ----------
+            resources: list
+                The resources, which are updated in place
+
+            paths: list
+                The paths of the fields
+
+            Returns
+            -------
+            None
+        """
+        level = [(resource, path.split('.')) for resource in resources for path in paths]
+        while level:
+            # Collect the related objects by endpoint and ID
+            wanted = {}
+            for resource, parts in level:
+                related = resource.get(parts[0])
+                match = RESOURCE_URL_PATTERN.search(related.get('url') or '') if (
+                    isinstance(related, dict)) else None
+                if match is not None:
+                    app, name, resource_id = match.groups()
+                    key = (f'{app}.{name}'.replace('-', '_'), int(resource_id))
+                    wanted.setdefault(key, []).append(related)
+
+            keys = [*wanted]
+            for key, full in zip(keys, self.gather([('get', *key) for key in keys])):
+                for related in wanted[key]:
+                    related.update(full or {})
+
+            level = [
+                (resource[parts[0]], parts[1:]) for resource, parts in level
+                if len(parts) > 2 and isinstance(resource.get(parts[0]), dict)]
+
+    def list(self,
+             endpoint: str,
+             filters: dict,
+             workers: int = 1,
+             page_size: int = DEFAULT_PAGE_SIZE,
+             max_results: Optional[int] = None) -> Iterator[dict]:
+        """ Method to retrieve the resources from an endpoint. The
+            first page gives the total count; the other pages are
+            retrieved by offset with at most `workers` requests at
+            the same time. The resources are returned in the order
+            NetBox returns them and only `workers` pages are kept in
+            memory.
+
+            Parameters
+            ----------
+            endpoint: str
+                The endpoint, like `dcim.sites`
+
+            filters: dict
+                The filters for the resources
+
+            workers: int
+                The number of pages to retrieve at the same time
+
+            page_size: int
+                The requested page size. NetBox can return smaller
+                pages.
+
+            max_results: Optional[int]
+                The maximum number of resources. No pages are
+                retrieved after this number is reached.
+
+            Returns
+            -------
+            Iterator[dict]
+                The resources
+        """
+        if max_results is not None:
+            page_size = min(page_size, max_results)
+        records, count = self.list_page(endpoint, filters, page_size, 0)
+        if max_results is not None:
+            count = min(count, max_results)
+        yield from records[:count]
+
+        # NetBox can return less than the requested page size
+        if len(records) == 0 or count <= len(records):
+            return
+        page_size = len(records)
+        offsets = iter(range(page_size, count, page_size))
+        logger.debug(
+            f'Retrieving {count} resources in pages of {page_size} with {workers} workers')
+
+        def get_limit(offset: int) -> int:
+            # The last page only asks for the remaining resources
+            return min(page_size, count - offset)
+
+        if workers <= 1:
+            for offset in offsets:
+                yield from self.list_page(endpoint, filters, get_limit(offset), offset)[0]
+            return
+
+        # Keep `workers` pages in flight and return them in order
+        pending = deque(
+            self.submit('list_page', endpoint, filters, get_limit(offset), offset)
+            for offset in islice(offsets, workers))
+        try:
+            while pending:
+                page = pending.popleft().result()[0]
+                offset = next(offsets, None)
+                if offset is not None:
+                    pending.append(self.submit(
+                        'list_page', endpoint, filters, get_limit(offset), offset))
+                yield from page
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+class PynetboxBackend(Backend):
+    def __init__(self, url: str, token: str, settings: dict, nb: Any) -> None:
+        """ The initiator sets the PyNetBox object
+
+            Parameters
+            ----------
+            url: str
+                The URL of NetBox
+
+            token: str
+                The API token
+
+            settings: dict
+                The instance settings
+
+            nb: Any
+                The PyNetBox object
+
+            Returns
+            -------
+            None
+        """
+        super().__init__(url, token, settings)
+
+        import pynetbox
+        import requests
+        self.request_errors = (pynetbox.RequestError, requests.exceptions.RequestException)
+        self.nb = nb
+
+    def get_endpoint(self, endpoint: str) -> Any:
+        """ Method to get a pynetbox endpoint by its name
+
+            Parameters
+            ----------
+            endpoint: str
+                The name of the endpoint, like `dcim.sites`
+
+            Returns
+            -------
+            Any
+                The pynetbox endpoint
+        """
+        app, name = endpoint.split('.')
+        return getattr(getattr(self.nb, app), name)
+
+    def get_request(self, endpoint: str, resource_id: int) -> Any:
+        """ Method to get a pynetbox request for one resource
+
+            Parameters
+            ----------
+            endpoint: str
+                The name of the endpoint
+
+            resource_id: int
+                The ID of the resource
+
+            Returns
+            -------
+            Any
+                The request
+        """
+        from pynetbox.core.query import Request
+        return Request(
+            key=resource_id,
+            base=self.get_endpoint(endpoint).url,
+            token=self.token,
+            http_session=self.nb.http_session)
+
+    def call(self, function: Any, *args, **kwargs) -> Any:
+        """ Method to call a pynetbox function and convert its
+            errors
+
+            Parameters
+            ----------
+            function: Any
+                The function
+
+            *args: list
+                Arguments for the function
+
+            **kwargs: dict
+                Keyword arguments for the function
+
+            Returns
+            -------
+            Any
+                The result of the function
+        """
+        try:
+            return function(*args, **kwargs)
+        except self.request_errors as error:
+            response = getattr(error, 'req', None)
+            if response is None:
+                raise NetBoxRequestError(str(error)) from error
+            raise NetBoxRequestError(
+                str(error), response.status_code, response.text) from error
+
+    def list_page(self, endpoint: str, filters: dict, limit: int, offset: int) -> tuple:
+        logger.debug(f'Retrieving page at offset {offset} from "{endpoint}"')
+        start = time.perf_counter()
+        latency = timings.get_thread_latency()
+        records = self.get_endpoint(endpoint).filter(**filters, limit=limit, offset=offset)
+        resources = self.call(lambda: [dict(record) for record in records])
+
+        # pynetbox decodes the page while it reads the records; the
+        # time that was not spent in requests went to decoding
+        if timings.enabled:
+            duration = time.perf_counter() - start
+            timings.add_span('page', start, duration, endpoint=endpoint, offset=offset)
+            timings.add_span(
+                'decode', start, duration - (timings.get_thread_latency() - latency))
+        return resources, records.request.count
+
+    def get(self, endpoint: str, resource_id: Optional[int] = None, **filters) -> Optional[dict]:
+        if resource_id is None:
+            record = self.call(self.get_endpoint(endpoint).get, **filters)
+        else:
+            record = self.call(self.get_endpoint(endpoint).get, resource_id)
+        return None if record is None else dict(record)
+
+    def create(self, endpoint: str, data: Union[dict, list]) -> Union[dict, list]:
+        result = self.call(self.get_endpoint(endpoint).create, data)
+        if isinstance(result, list):
+            return [dict(record) for record in result]
+        return dict(result)
+
+    def update(self,
+               endpoint: str,
+               data: Union[dict, list],
+               resource_id: Optional[int] = None) -> Union[dict, list]:
+        if resource_id is None:
+            return [
+                dict(record)
+                for record in self.call(self.get_endpoint(endpoint).update, data)]
+        return self.call(self.get_request(endpoint, resource_id).patch, data)
+
+    def delete(self, endpoint: str, resource_ids: Union[int, list]) -> bool:
+        if isinstance(resource_ids, list):
+            return self.call(self.get_endpoint(endpoint).delete, resource_ids)
+        return self.call(self.get_request(endpoint, resource_ids).delete)
+
+    def status(self) -> dict:
+        return self.call(self.nb.status)
+
+    def schema(self) -> dict:
+        return self.call(self.nb.openapi)
+
+    def version(self) -> str:
+        return self.call(lambda: self.nb.version)
+
+
+class AsyncBackend(Backend):
+    def __init__(self, url: str, token: str, settings: dict) -> None:
+        """ The initiator starts the event loop in a background
+            thread and creates the httpx client in it
+
+            Parameters
+            ----------
+            url: str
+                The URL of NetBox
+
+            token: str
+                The API token
+
+            settings: dict
+                The instance settings
+
+            Returns
+            -------
+            None
+        """
+        super().__init__(url, token, settings)
+        try:
+            import httpx
+        except ImportError:
+            raise BackendUnavailable('The async backend requires httpx')
+        self.httpx = httpx
+
+        self.loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        thread.start()
+        self.clients = asyncio.run_coroutine_threadsafe(
+            self.create_clients(), self.loop).result()
+        self.next_client = cycle(self.clients)
+        atexit.register(self.close)
+
+    async def create_clients(self) -> list:
+        """ Method to create the httpx clients. Together they have
+            `pool_size` connections. They are created in the event
+            loop that uses them.
+
+            Parameters
+            ----------
+            None
+
+            Returns
+            -------
+            list
+                The clients
+        """
+        try:
+            import h2  # noqa: F401
+            http2 = self.url.startswith('https://')
+        except ImportError:
+            http2 = False
+        pool_size = self.settings['pool_size']
+        connections = min(CLIENT_CONNECTIONS, pool_size)
+        count = -(-pool_size // connections)
+        logger.debug(
+            f'Creating {count} httpx clients for "{self.url}" (HTTP/2: {http2})')
+
+        # Requests wait for a free connection instead of failing
+        # when many are in flight
+        timeout = self.httpx.Timeout(
+            self.settings['read_timeout'],
+            connect=self.settings['connect_timeout'],
+            pool=None)
+        limits = self.httpx.Limits(
+            max_connections=connections, max_keepalive_connections=connections)
+        return [
+            self.httpx.AsyncClient(
+                base_url=f'{self.url}/api/',
+                headers={'Accept': 'application/json', **get_auth_header(self.token)},
+                timeout=timeout,
+                transport=self.httpx.AsyncHTTPTransport(
+                    retries=self.settings['retries'], http2=http2, limits=limits))
+            for _ in range(count)]
+
+    async def close_clients(self) -> None:
+        await asyncio.gather(*(client.aclose() for client in self.clients))
+
+    def close(self) -> None:
+        """ Method to close the clients and stop the event loop
+
+            Parameters
+            ----------
+            None
+
+            Returns
+            -------
+            None
+        """
+        if self.loop.is_running():
+            asyncio.run_coroutine_threadsafe(self.close_clients(), self.loop).result()
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+    async def request(self,
+                      method: str,
+                      path: str,
+                      params: Optional[dict] = None,
+                      data: Any = None) -> Any:
+        """ Method to send a request. Server errors are retried
+            with an exponential backoff, like the synchronous
+            session does.
+
+            Parameters
+            ----------
+            method: str
+                The HTTP method
+
+            path: str
+                The path below `/api/`, like `dcim/sites/`
+
+            params: Optional[dict]
+                The query parameters. None values are sent as
+                `null`, like pynetbox does.
+
+            data: Any
+                The JSON body
+
+            Returns
+            -------
+            Any
+                The response
+        """
+        if params:
+            params = {
+                name: 'null' if value is None else value
+                for name, value in params.items()}
+
+        for attempt in range(self.settings['retries'] + 1):
+            start = time.perf_counter()
+            try:
+                # The requests are spread over the clients. This
+                # runs in the event loop, so no lock is needed.
+                response = await next(self.next_client).request(
+                    method, path, params=params, json=data)
+            except self.httpx.HTTPError as error:
+                if timings.enabled:
+                    timings.add_request(
+                        method, path, None, start, time.perf_counter() - start, 0)
+                raise NetBoxRequestError(f'{method} {path}: {error}') from error
+            if timings.enabled:
+                timings.add_request(
+                    method, str(response.url), response.status_code, start,
+                    time.perf_counter() - start, len(response.content))
+            # Like urllib3, only idempotent methods are retried
+            if response.status_code < 500 or attempt == self.settings['retries'] or \
+                    method not in ('GET', 'PUT', 'DELETE'):
+                break
+            await asyncio.sleep(self.settings['retry_backoff'] * 2 ** attempt)
+
+        if response.is_error:
+            raise NetBoxRequestError(
+                f'The request failed with code {response.status_code}: {response.text}',
+                response.status_code, response.text)
+        return response
+
+    @staticmethod
+    def get_path(endpoint: str, resource_id: Optional[int] = None) -> str:
+        """ Method to get the path of an endpoint or a resource
+
+            Parameters
+            ----------
+            endpoint: str
+                The endpoint, like `dcim.sites`
+
+            resource_id: Optional[int]
+                The ID of a resource
+
+            Returns
+            -------
+            str
+                The path, like `dcim/sites/1/`
+        """
+        path = f'{endpoint.replace(".", "/").replace("_", "-")}/'
+        return path if resource_id is None else f'{path}{resource_id}/'
+
+    async def async_list_page(self, endpoint: str, filters: dict, limit: int, offset: int) -> tuple:
+        logger.debug(f'Retrieving page at offset {offset} from "{endpoint}"')
+        start = time.perf_counter()
+        response = await self.request(
+            'GET', self.get_path(endpoint), {**filters, 'limit': limit, 'offset': offset})
+        with timings.span('decode'):
+            body = response.json()
+        if timings.enabled:
+            timings.add_span(
+                'page', start, time.perf_counter() - start, endpoint=endpoint, offset=offset)
+        return body['results'], body['count']
+
+    async def async_count(self, endpoint: str, filters: dict) -> int:
+        return (await self.async_list_page(endpoint, filters, 1, 0))[1]
+
+    async def async_get(self,
+                        endpoint: str,
+                        resource_id: Optional[int] = None,
+                        **filters) -> Optional[dict]:
+        try:
+            if resource_id is not None:
+                response = await self.request('GET', self.get_path(endpoint, resource_id))
+                return response.json()
+        except NetBoxRequestError as error:
+            if error.status_code == 404:
+                return None
+            raise
+
+        resources, count = await self.async_list_page(endpoint, filters, 2, 0)
+        if count > 1:
+            raise ValueError('get() returned more than one result')
+        return resources[0] if resources else None
+
+    async def async_create(self, endpoint: str, data: Union[dict, list]) -> Union[dict, list]:
+        response = await self.request('POST', self.get_path(endpoint), data=data)
+        return response.json()
+
+    async def async_update(self,
+                           endpoint: str,
+                           data: Union[dict, list],
+                           resource_id: Optional[int] = None) -> Union[dict, list]:
+        response = await self.request(
+            'PATCH', self.get_path(endpoint, resource_id), data=data)
+        return response.json()
+
+    async def async_delete(self, endpoint: str, resource_ids: Union[int, list]) -> bool:
+        if isinstance(resource_ids, list):
+            await self.request(
+                'DELETE', self.get_path(endpoint),
+                data=[{'id': resource_id} for resource_id in resource_ids])
+        else:
+            await self.request('DELETE', self.get_path(endpoint, resource_ids))
+        return True
+
+    async def async_status(self) -> dict:
+        response = await self.request('GET', 'status/')
+        return response.json()
+
+    async def async_schema(self) -> dict:
+        response = await self.request('GET', 'schema/', {'format': 'json'})
+        return response.json()
+
+    async def async_version(self) -> str:
+        try:
+            response = await self.request('GET', '')
+        except NetBoxRequestError as error:
+            # Like pynetbox, a forbidden response still has the version
+            if error.status_code != 403:
+                raise
+            return ''
+        return response.headers.get('API-Version', '')
+
+    def submit(self, method: str, *args, **kwargs) -> Future:
+        return asyncio.run_coroutine_threadsafe(
+            getattr(self, f'async_{method}')(*args, **kwargs), self.loop)
+
+    def list_page(self, endpoint: str, filters: dict, limit: int, offset: int) -> tuple:
+        return self.submit('list_page', endpoint, filters, limit, offset).result()
+
+    def count(self, endpoint: str, filters: dict) -> int:
+        return self.submit('count', endpoint, filters).result()
+
+    def get(self, endpoint: str, resource_id: Optional[int] = None, **filters) -> Optional[dict]:
+        return self.submit('get', endpoint, resource_id, **filters).result()
+
+    def create(self, endpoint: str, data: Union[dict, list]) -> Union[dict, list]:
+        return self.submit('create', endpoint, data).result()
+
+    def update(self,
+               endpoint: str,
+               data: Union[dict, list],
+               resource_id: Optional[int] = None) -> Union[dict, list]:
+        return self.submit('update', endpoint, data, resource_id).result()
+
+    def delete(self, endpoint: str, resource_ids: Union[int, list]) -> bool:
+        return self.submit('delete', endpoint, resource_ids).result()
+
+    def status(self) -> dict:
+        return self.submit('status').result()
+
+    def schema(self) -> dict:
+        return self.submit('schema').result()
+
+    def version(self) -> str:
+        return self.submit('version').result()
+
+
+class GraphQLBackend(PynetboxBackend):
+    field_selection = True
+
+    def query(self, query: str) -> dict:
+        """ Method to run a GraphQL query
+
+            Parameters
+            ----------
+            query: str
+                The query
+
+            Returns
+            -------
+            dict
+                The data of the result
+        """
+        response = self.call(
+            self.nb.http_session.post, f'{self.url}/graphql/', json={'query': query},
+            headers={'Accept': 'application/json', **get_auth_header(self.token)})
+        if not response.ok:
+            raise NetBoxRequestError(
+                f'The GraphQL request failed with status {response.status_code}',
+                response.status_code, response.text)
+        result = response.json()
+
+        # Errors in the query are usually fields or filters that this
+        # NetBox version does not have, so the REST API can be used
+        if result.get('errors'):
+            from .schema import expire_models
+            expire_models()
+            messages = '; '.join(error.get('message', '') for error in result['errors'])
+            raise GraphQLUnsupported(f'The GraphQL query failed: {messages}')
+        return result['data']
+
+    def get_graphql_model(self) -> dict:
+        """ Method to get the GraphQL model of NetBox. The types are
+            introspected once and stored like the OpenAPI model.
+
+            Parameters
+            ----------
+            None
+
+            Returns
+            -------
+            dict
+                The GraphQL model
+        """
+        from .graphql import INTROSPECTION_QUERY, compile_introspection
+        from .schema import get_compiled
+        return get_compiled('graphql', lambda: compile_introspection(self.query(INTROSPECTION_QUERY)))
+
+    def get_labels(self, endpoint: str) -> dict:
+        """ Method to get the labels of the choice fields of an
+            endpoint, which GraphQL does not return
+
+            Parameters
+            ----------
+            endpoint: str
+                The endpoint
+
+            Returns
+            -------
+            dict
+                The labels by field and value
+        """
+        from .schema import get_model
+        try:
+            return get_model().get(endpoint, {}).get('labels', {})
+        except (NetBoxRequestError, SchemaError) as error:
+            logger.debug(f'Choice fields are shown without labels: {error}')
+            return {}
+
+    def query_page(self, endpoint: str, filters: dict, limit: int, offset: int) -> Optional[list]:
+        """ Method to retrieve one page of resources with GraphQL. The
+            `fields` filter selects the fields.
+
+            Parameters
+            ----------
+            endpoint: str
+                The endpoint, like `dcim.sites`
+
+            filters: dict
+                The filters for the resources, with `fields`
+
+            limit: int
+                The size of the page
+
+            offset: int
+                The offset of the page
+
+            Returns
+            -------
+            Optional[list]
+                The resources, or None if the query cannot be
+                expressed in GraphQL
+        """
+        from .graphql import build_query, convert_resource
+        fields = filters['fields'].split(',')
+        rest_filters = {name: value for name, value in filters.items() if name != 'fields'}
+        try:
+            list_query, query = build_query(
+                self.get_graphql_model(), endpoint, rest_filters, fields, limit, offset)
+            logger.debug(f'Retrieving page at offset {offset} from "{endpoint}" with GraphQL')
+            with timings.span('page', endpoint=endpoint, offset=offset):
+                data = self.query(query)
+        except GraphQLUnsupported as error:
+            logger.debug(f'Using the REST API for "{endpoint}": {error}')
+            return None
+
+        labels = self.get_labels(endpoint)
+        return [convert_resource(resource, labels) for resource in data[list_query]]
+
+    def list_page(self, endpoint: str, filters: dict, limit: int, offset: int) -> tuple:
+        if 'fields' not in filters:
+            return super().list_page(endpoint, filters, limit, offset)
+        resources = self.query_page(endpoint, filters, limit, offset)
+
+        # The REST API returns the related objects in brief, so their
+        # fields are retrieved afterwards
+        if resources is None:
+            fields = filters['fields'].split(',')
+            top_fields = ','.join(dict.fromkeys(field.split('.')[0] for field in fields))
+            resources, count = super().list_page(
+                endpoint, {**filters, 'fields': top_fields}, limit, offset)
+            self.resolve_nested(resources, [field for field in fields if '.' in field])
+            return resources, count
+
+        # GraphQL returns no count. It is only known without another
+        # request if the first page is not full; the count of later
+        # pages is not used.
+        count = offset + len(resources)
+        if offset == 0 and len(resources) == limit:
+            count = self.count(endpoint, filters)
+        return resources, count
+
+    def list(self,
+             endpoint: str,
+             filters: dict,
+             workers: int = 1,
+             page_size: int = DEFAULT_PAGE_SIZE,
+             max_results: Optional[int] = None) -> Iterator[dict]:
+        # One page is enough when it can hold all results, so the
+        # count is not needed
+        if 'fields' in filters and max_results is not None and max_results <= page_size:
+            resources = self.query_page(endpoint, filters, max_results, 0)
+            if resources is not None:
+                yield from resources
+                return
+        yield from super().list(
+            endpoint, filters, workers=workers, page_size=page_size, max_results=max_results)
+
+    def count(self, endpoint: str, filters: dict) -> int:
+        filters = {name: value for name, value in filters.items() if name != 'fields'}
+        return super().list_page(endpoint, {**filters, 'fields': 'id'}, 1, 0)[1]
+
+
+# The available backends
+BACKENDS = {
+    'pynetbox': PynetboxBackend,
+    'async': AsyncBackend,
+    'graphql': GraphQLBackend
+}
@@ -0,0 +1,489 @@
+""" Module with helpers to create, update and delete resources in
+    bulk. Rows are sent in chunks to the list endpoints of NetBox,
+    which handle a chunk in one request. """
+import csv
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, Optional
+import click
+from rich.table import Table
+from .nbcli import nbcli_object
+from .cli import console, tables
+from .exceptions import BulkInputError, NetBoxRequestError
+from .fetch import DEFAULT_CHUNK_SIZE, fetch_records
+from .ids import get_id_index
+
+logger = logging.getLogger('bulk')
+
+# The supported file formats with their file extensions
+FILE_FORMATS = {
+    'csv': ('.csv',),
+    'json': ('.json',),
+    'yaml': ('.yaml', '.yml')
+}
+
+# The number of matching resources that is shown for a dry run
+DRY_RUN_SAMPLE_SIZE = 10
+
+# The message for rows without errors in a bulk request that failed
+NOT_APPLIED_MESSAGE = 'Not applied; another row in the request failed'
+
+# The fields that two resources cannot have the same value for; a
+# filtered update cannot set them
+UNIQUE_FIELDS = ('name', 'slug')
+
+# The message for rows with a name that more than one resource has
+AMBIGUOUS_MESSAGE = 'More than one object has this name'
+
+
+def read_rows(path: str, file_format: Optional[str] = None) -> list:
+    """ Read the rows from a file. Empty values in CSV files are
+        left out, so they do not overwrite values in NetBox.
+
+        Parameters
+        ----------
+        path: str
+            The path of the file
+
+        file_format: Optional[str]
+            The format of the file. If not given, the extension of
+            the file is used.
+
+        Returns
+        -------
+        list
+            The rows as dicts
+    """
+    if file_format is None:
+        extension = os.path.splitext(path)[1].lower()
+        for name, extensions in FILE_FORMATS.items():
+            if extension in extensions:
+                file_format = name
+                break
+        else:
+            raise BulkInputError(
+                f'Cannot determine the format of "{path}"; use --format')
+
+    with open(path, 'r', newline='') as bulk_file:
+        if file_format == 'csv':
+            rows = [
+                {field: value for field, value in row.items() if value}
+                for row in csv.DictReader(bulk_file)]
+        elif file_format == 'json':
+            rows = json.load(bulk_file)
+        else:
+            try:
+                import yaml
+            except ImportError:
+                raise BulkInputError('Reading YAML files requires PyYAML')
+            rows = yaml.safe_load(bulk_file)
+
+    if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+        raise BulkInputError(f'"{path}" should contain a list of objects')
+    return rows
+
+
+def chunks(items: list, size: int) -> Iterator[list]:
+    """ Split a list in lists of `size` items
+
+        Parameters
+        ----------
+        items: list
+            The items to split
+
+        size: int
+            The size of the lists
+
+        Returns
+        -------
+        Iterator[list]
+            The lists
+    """
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def get_error_messages(error: Exception, count: int) -> list:
+    """ Get an error message for every row in a failed chunk. NetBox
+        returns a list with the errors per object for bulk requests
+        that fail validation. For other errors, all rows get the
+        same message.
+
+        Parameters
+        ----------
+        error: Exception
+            The error for the chunk
+
+        count: int
+            The number of rows in the chunk
+
+        Returns
+        -------
+        list
+            The error messages
+    """
+    try:
+        errors = json.loads(error.error)
+    except (AttributeError, TypeError, ValueError):
+        errors = None
+
+    if isinstance(errors, list) and len(errors) == count:
+        return [
+            '; '.join(f'{field}: {message}' for field, message in row_errors.items())
+            if row_errors else NOT_APPLIED_MESSAGE
+            for row_errors in errors]
+    return [str(error)] * count
+
+
+def resolve_ids(endpoint_name: str, rows: list) -> dict:
+    """ Look up the IDs for rows that only have a name. All names are
+        sent in one filter; the matches are retrieved page by page.
+
+        Parameters
+        ----------
+        endpoint_name: str
+            The name of the endpoint, like `dcim.sites`
+
+        rows: list
+            The rows
+
+        Returns
+        -------
+        dict
+            Mapping from name to ID. The ID is None if more than one
+            resource has the name.
+    """
+    names = [*dict.fromkeys(row['name'] for row in rows if 'id' not in row and 'name' in row)]
+    if len(names) == 0:
+        return {}
+    ids = {}
+    for resource in fetch_records(endpoint_name, {'name': names, 'brief': True}):
+        ids[resource['name']] = None if resource['name'] in ids else resource['id']
+    return ids
+
+
+def get_name_error(ids: dict, name: Optional[str]) -> Optional[str]:
+    """ Get the error for a name that has no single ID
+
+        Parameters
+        ----------
+        ids: dict
+            Mapping from name to ID, like the result of `resolve_ids`
+
+        name: Optional[str]
+            The name
+
+        Returns
+        -------
+        Optional[str]
+            The error message, or None if the name has one ID
+    """
+    if name not in ids:
+        return 'Not found'
+    if ids[name] is None:
+        return AMBIGUOUS_MESSAGE
+    return None
+
+
+def process_chunk(endpoint_name: str, action: str, rows: list) -> list:
+    """ Send one chunk of rows to NetBox
+
+        Parameters
+        ----------
+        endpoint_name: str
+            The name of the endpoint, like `dcim.sites`
+
+        action: str
+            The action; `create`, `update` or `delete`
+
+        rows: list
+            The rows in the chunk
+
+        Returns
+        -------
+        list
+            A tuple per row with the ID, or None, and an error
+            message, or None
+    """
+    backend = nbcli_object.get_backend()
+    results = [(row.get('id'), None) for row in rows]
+    valid = [*enumerate(rows)]
+    try:
+        # Rows for updates and deletes are identified by their ID
+        # or their name
+        if action != 'create':
+            ids = resolve_ids(endpoint_name, rows)
+            for index, row in enumerate(rows):
+                if 'id' not in row:
+                    results[index] = (
+                        ids.get(row.get('name')), get_name_error(ids, row.get('name')))
+            valid = [
+                (index, row) for index, row in enumerate(rows)
+                if results[index][1] is None]
+
+        if len(valid) == 0:
+            return results
+
+        if action == 'create':
+            created = backend.create(endpoint_name, [row for _, row in valid])
+            for (index, _), resource in zip(valid, created):
+                results[index] = (resource['id'], None)
+        elif action == 'update':
+            backend.update(endpoint_name, [
+                {**row, 'id': results[index][0]} for index, row in valid])
+        else:
+            backend.delete(endpoint_name, [results[index][0] for index, _ in valid])
+    except NetBoxRequestError as error:
+        # Without a response, the request did not reach NetBox
+        if error.status_code is None:
+            return [(row_id, str(error)) for row_id, _ in results]
+        messages = get_error_messages(error, len(valid))
+        for (index, _), message in zip(valid, messages):
+            results[index] = (results[index][0], message)
+    return results
+
+
+def run_bulk(endpoint_name: str,
+             action: str,
+             rows: list,
+             chunk_size: int = DEFAULT_CHUNK_SIZE,
+             workers: int = 1) -> list:
+    """ Create, update or delete resources in chunks. At most
+        `workers` chunks are sent at the same time.
+
+        Parameters
+        ----------
+        endpoint_name: str
+            The name of the endpoint, like `dcim.sites`
+
+        action: str
+            The action; `create`, `update` or `delete`
+
+        rows: list
+            The rows
+
+        chunk_size: int
+            The number of rows in one request
+
+        workers: int
+            The number of requests at the same time
+
+        Returns
+        -------
+        list
+            A tuple per row with the ID, or None, and an error
+            message, or None
+    """
+    logger.debug(
+        f'Sending {len(rows)} rows in chunks of {chunk_size} with {workers} workers')
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        results = executor.map(
+            lambda chunk: process_chunk(endpoint_name, action, chunk),
+            chunks(rows, chunk_size))
+        results = [result for chunk_results in results for result in chunk_results]
+
+    # Keep the name index up to date with the new names and IDs
+    index = get_id_index(endpoint_name)
+    for row, (resource_id, error) in zip(rows, results):
+        if error or resource_id is None:
+            continue
+        if action == 'delete':
+            index.remove(resource_id)
+        elif row.get('name'):
+            index.add({'id': resource_id, 'name': row['name']})
+    index.save()
+    return results
+
+
+def print_report(action: str, rows: list, results: list, only_failed: bool = False) -> None:
+    """ Print the result for every row
+
+        Parameters
+        ----------
+        action: str
+            The action that was done
+
+        rows: list
+            The rows
+
+        results: list
+            The results from `run_bulk`
+
+        only_failed: bool
+            If set, only the rows that failed are printed
+
+        Returns
+        -------
+        None
+    """
+    table = Table(**tables)
+    table.add_column('Row', justify='right')
+    table.add_column('ID', style='item_identification', justify='right')
+    table.add_column('Name', style='item_identification')
+    table.add_column('Result')
+
+    for number, (row, (resource_id, error)) in enumerate(zip(rows, results), start=1):
+        if only_failed and not error:
+            continue
+        table.add_row(
+            str(number),
+            str(resource_id) if resource_id else '',
+            str(row.get('name', '')),
+            f'[error]{error}[/]' if error else f'[item_activated]{action}d[/]')
+    if table.row_count:
+        console.print(table)
+
+    failed = len([error for _, error in results if error])
+    console.print(
+        f'{len(rows) - failed} of {len(rows)} rows {action}d, {failed} failed')
+
+
+def parse_assignments(assignments: tuple) -> dict:
+    """ Parse `FIELD=VALUE` options to a dict. Fields that are
+        given more than once get a list of values.
+
+        Parameters
+        ----------
+        assignments: tuple
+            The options
+
+        Returns
+        -------
+        dict
+            The fields with their values
+    """
+    parsed = {}
+    for assignment in assignments:
+        field, separator, value = assignment.partition('=')
+        if not separator or not field:
+            raise BulkInputError(f'"{assignment}" should be in the form FIELD=VALUE')
+        if field in parsed:
+            if not isinstance(parsed[field], list):
+                parsed[field] = [parsed[field]]
+            parsed[field].append(value)
+        else:
+            parsed[field] = value
+    return parsed
+
+
+def find_matches(endpoint_name: str, filters: dict, workers: int = 1) -> list:
+    """ Find the resources that match filters. The resources are
+        retrieved in brief mode, so only the identifying fields are
+        downloaded.
+
+        Parameters
+        ----------
+        endpoint_name: str
+            The name of the endpoint, like `dcim.sites`
+
+        filters: dict
+            The filters for the resources
+
+        workers: int
+            The number of pages to retrieve at the same time
+
+        Returns
+        -------
+        list
+            A dict with the `id` and `name` of every resource
+    """
+    return [
+        {'id': resource['id'], 'name': resource['name']}
+        for resource in fetch_records(
+            endpoint_name, {**filters, 'brief': True}, workers=workers)]
+
+
+def print_matches(matches: list) -> None:
+    """ Print a sample of the resources that match filters
+
+        Parameters
+        ----------
+        matches: list
+            The matches, like the result of `find_matches`
+
+        Returns
+        -------
+        None
+    """
+    table = Table(**tables)
+    table.add_column('ID', style='item_identification', justify='right')
+    table.add_column('Name', style='item_identification')
+    for match in matches[:DRY_RUN_SAMPLE_SIZE]:
+        table.add_row(str(match['id']), str(match['name']))
+    if table.row_count:
+        console.print(table)
+
+
+def run_filtered(endpoint_name: str,
+                 action: str,
+                 where: tuple,
+                 changes: dict,
+                 dry_run: bool = False,
+                 confirm: bool = False,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 workers: int = 1) -> bool:
+    """ Update or delete all resources that match filters, with a
+        few bulk requests
+
+        Parameters
+        ----------
+        endpoint_name: str
+            The name of the endpoint, like `dcim.sites`
+
+        action: str
+            The action; `update` or `delete`
+
+        where: tuple
+            The filters as `FIELD=VALUE` options
+
+        changes: dict
+            The values to set for updates
+
+        dry_run: bool
+            If set, the matching resources are shown but not changed
+
+        confirm: bool
+            If set, the number of matches and a sample are shown, and
+            the user confirms before they are changed
+
+        chunk_size: int
+            The number of resources in one request
+
+        workers: int
+            The number of requests at the same time
+
+        Returns
+        -------
+        bool
+            True if resources were changed
+    """
+    try:
+        filters = parse_assignments(where)
+    except BulkInputError as error:
+        console.print(f'[error]{error}[/]')
+        return False
+    if action == 'update' and not changes:
+        console.print('[error]Give the values to update[/]')
+        return False
+
+    matches = find_matches(endpoint_name, filters, workers)
+
+    if dry_run or len(matches) == 0:
+        print_matches(matches)
+        console.print(f'{len(matches)} objects match; nothing is {action}d')
+        return False
+
+    if confirm:
+        print_matches(matches)
+        click.confirm(f'{action.capitalize()} the {len(matches)} objects that match?', abort=True)
+
+    if action == 'update':
+        rows = [{**changes, 'id': match['id']} for match in matches]
+    else:
+        rows = [{'id': match['id']} for match in matches]
+
+    results = run_bulk(endpoint_name, action, rows, chunk_size, workers)
+    print_report(action, matches, results, only_failed=True)
+    return True
@@ -0,0 +1,294 @@
+""" Module with an on-disk cache for responses from NetBox. Entries
+    are JSON Lines files, one row per line, so they can be written
+    and read while rows are streamed. """
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, Iterable, Iterator, Optional
+import click
+from .nbcli import nbcli_object, NBCLI_DATA_DIR
+
+NBCLI_CACHE_DIR = f'{NBCLI_DATA_DIR}/cache'
+
+# Default time-to-live, in seconds, for the cached commands
+CACHE_TTL = {
+    'sites list': 60,
+    'sites inspect': 60,
+    'regions list': 300
+}
+
+# Name of the file that marks the moment an endpoint got invalidated
+INVALIDATED_MARKER = '.invalidated'
+
+logger = logging.getLogger('cache')
+
+
+class ResponseCache:
+    def __init__(self, instance_name: str, instance: dict) -> None:
+        """ The initiator sets the directory for the instance
+
+            Parameters
+            ----------
+            instance_name: str
+                The name of the NetBox instance
+
+            instance: dict
+                The configuration of the NetBox instance
+
+            Returns
+            -------
+            None
+        """
+        self.instance = instance
+        self.directory = os.path.join(NBCLI_CACHE_DIR, instance_name)
+
+    def get_path(self, endpoint: str, filters: dict) -> str:
+        """ Method to get the path of a cache entry. The key is a
+            hash of the server, the API token and the filters that
+            are set, so results retrieved with another token are not
+            used.
+
+            Parameters
+            ----------
+            endpoint: str
+                The endpoint, like `dcim.sites`
+
+            filters: dict
+                The filters for the request
+
+            Returns
+            -------
+            str
+                The path for the cache entry
+        """
+        key = json.dumps({
+            'server': [self.instance[item] for item in ('server', 'port', 'base_path')],
+            'token': hashlib.sha256(
+                str(self.instance.get('api_key') or '').encode()).hexdigest(),
+            'filters': {
+                setting: value for setting, value in filters.items()
+                if value is not None}
+        }, sort_keys=True, default=str)
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return os.path.join(self.directory, endpoint, f'{digest}.jsonl')
+
+    def get_invalidated(self, endpoint: str) -> float:
+        """ Method to get the last time the endpoint got invalidated
+
+            Parameters
+            ----------
+            endpoint: str
+                The endpoint
+
+            Returns
+            -------
+            float
+                The timestamp of the last invalidation, or 0
+        """
+        try:
+            return os.stat(os.path.join(
+                self.directory, endpoint, INVALIDATED_MARKER)).st_mtime
+        except FileNotFoundError:
+            return 0
+
+    def read(self, endpoint: str, filters: dict, ttl: int) -> Optional[Iterator[dict]]:
+        """ Method to read rows from the cache
+
+            Parameters
+            ----------
+            endpoint: str
+                The endpoint
+
+            filters: dict
+                The filters for the request
+
+            ttl: int
+                The maximum age of the entry in seconds
+
+            Returns
+            -------
+            Optional[Iterator[dict]]
+                The cached rows, or None if there is no fresh entry
+        """
+        path = self.get_path(endpoint, filters)
+        try:
+            cache_file = open(path, 'r')
+        except FileNotFoundError:
+            logger.debug(f'No cache entry for "{endpoint}"')
+            return None
+
+        age = time.time() - os.fstat(cache_file.fileno()).st_mtime
+        if age > ttl:
+            logger.debug(f'Cache entry for "{endpoint}" expired')
+            cache_file.close()
+            return None
+
+        logger.debug(f'Using cache entry for "{endpoint}" ({age:.0f}s old)')
+
+        def rows() -> Iterator[dict]:
+            with cache_file:
+                for line in cache_file:
+                    yield json.loads(line)
+        return rows()
+
+    def write(self, endpoint: str, filters: dict, rows: Iterable[dict]) -> Iterator[dict]:
+        """ Method that writes rows to the cache while passing them
+            through. The entry is only stored when all rows are
+            consumed and the endpoint was not invalidated while
+            the rows were retrieved.
+
+            Parameters
+            ----------
+            endpoint: str
+                The endpoint
+
+            filters: dict
+                The filters for the request
+
+            rows: Iterable[dict]
+                The rows to store
+
+            Returns
+            -------
+            Iterator[dict]
+                The rows
+        """
+        path = self.get_path(endpoint, filters)
+        # Threads of one process can store the same entry at once
+        temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        started = time.time()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        try:
+            with open(temp_path, 'w') as cache_file:
+                for row in rows:
+                    cache_file.write(json.dumps(row) + '\n')
+                    yield row
+
+            # Only store the entry if nobody changed the endpoint
+            # while we were retrieving it
+            if self.get_invalidated(endpoint) < started:
+                os.replace(temp_path, path)
+                logger.debug(f'Stored cache entry for "{endpoint}"')
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def invalidate(self, *endpoints: str) -> None:
+        """ Method to remove all entries for endpoints
+
+            Parameters
+            ----------
+            *endpoints: str
+                The endpoints to invalidate
+
+            Returns
+            -------
+            None
+        """
+        for endpoint in endpoints:
+            directory = os.path.join(self.directory, endpoint)
+            os.makedirs(directory, exist_ok=True)
+
+            # Mark the invalidation first, so running writers do
+            # not store their entries
+            with open(os.path.join(directory, INVALIDATED_MARKER), 'w'):
+                pass
+            for filename in os.listdir(directory):
+                if filename.endswith('.jsonl'):
+                    try:
+                        os.remove(os.path.join(directory, filename))
+                    except FileNotFoundError:
+                        pass
+            logger.debug(f'Invalidated cache for "{endpoint}"')
+
+
+def get_cache() -> ResponseCache:
+    """ Get the cache for the active instance
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        ResponseCache
+            The cache for the active instance
+    """
+    return ResponseCache(
+        nbcli_object.get_active_instance_name(),
+        nbcli_object.get_active_instance())
+
+
+def cache_options(command: str) -> Callable:
+    """ Decorator that adds the cache options to a command
+
+        Parameters
+        ----------
+        command: str
+            The name of the command; used for the default TTL
+
+        Returns
+        -------
+        Callable
+            The decorator
+    """
+    def decorator(function: Callable) -> Callable:
+        function = click.option(
+            '--cache-ttl', type=int, default=CACHE_TTL[command], show_default=True,
+            help='Maximum age in seconds of cached results')(function)
+        function = click.option(
+            '--no-cache', is_flag=True,
+            help='Do not read or write the cache')(function)
+        function = click.option(
+            '--refresh', is_flag=True,
+            help='Retrieve fresh results and update the cache')(function)
+        return function
+    return decorator
+
+
+def cached_rows(endpoint: str,
+                filters: dict,
+                fetch: Callable[[], Iterable[dict]],
+                cache_ttl: int,
+                refresh: bool = False,
+                no_cache: bool = False) -> Iterable[dict]:
+    """ Get rows from the cache, or fetch them and store them
+
+        Parameters
+        ----------
+        endpoint: str
+            The endpoint, like `dcim.sites`
+
+        filters: dict
+            The filters for the request
+
+        fetch: Callable[[], Iterable[dict]]
+            Function that retrieves the rows from NetBox
+
+        cache_ttl: int
+            The maximum age of a cache entry in seconds
+
+        refresh: bool
+            If set, the cache is not read but is updated
+
+        no_cache: bool
+            If set, the cache is not used at all
+
+        Returns
+        -------
+        Iterable[dict]
+            The rows
+    """
+    if no_cache:
+        return fetch()
+
+    cache = get_cache()
+    if not refresh:
+        rows = cache.read(endpoint, filters, cache_ttl)
+        if rows is not None:
+            return rows
+    return cache.write(endpoint, filters, fetch())
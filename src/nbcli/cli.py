@@ -1,7 +1,7 @@
+from importlib import import_module
 import click
 from rich.console import Console
 from rich.theme import Theme
-from rich.logging import RichHandler
 from rich import box
 import logging
 
@@ -22,10 +22,155 @@ theme = Theme({
 # Create a reusable Rich-console
 console = Console(theme=theme)
 
+# Console for messages that must not mix with the output, like
+# errors next to machine-readable output
+error_console = Console(theme=theme, stderr=True)
 
-@click.group()
+# Values of the global options
+options = {
+    'output': 'table'
+}
+
+
+class LazyGroup(click.Group):
+    def __init__(self, *args, lazy_subcommands: dict = None, **kwargs) -> None:
+        """ A click group that imports its subcommands when they
+            are used. This keeps modules like `pynetbox` and
+            `rich.table` out of the startup of the CLI.
+
+            Parameters
+            ----------
+            *args: list
+                Arguments for `click.Group`
+
+            lazy_subcommands: dict
+                Mapping from the command name to a tuple with the
+                import path of the command, like
+                `nbcli.status.status`, and the help text that is
+                shown in the command list
+
+            **kwargs: dict
+                Arguments for `click.Group`
+
+            Returns
+            -------
+            None
+        """
+        super().__init__(*args, **kwargs)
+        self.lazy_subcommands = lazy_subcommands or {}
+
+    def list_commands(self, ctx: click.Context) -> list:
+        """ Method that returns the names of all subcommands
+
+            Parameters
+            ----------
+            ctx: click.Context
+                The click context
+
+            Returns
+            -------
+            list
+                The names of the subcommands
+        """
+        return sorted([*super().list_commands(ctx), *self.lazy_subcommands])
+
+    def get_command(self, ctx: click.Context, cmd_name: str) -> click.Command:
+        """ Method that returns a subcommand, importing it if it
+            is a lazy subcommand
+
+            Parameters
+            ----------
+            ctx: click.Context
+                The click context
+
+            cmd_name: str
+                The name of the subcommand
+
+            Returns
+            -------
+            click.Command
+                The subcommand, or None if it does not exist
+        """
+        if cmd_name in self.lazy_subcommands:
+            import_path = self.lazy_subcommands[cmd_name][0]
+            module_name, command_name = import_path.rsplit('.', 1)
+            return getattr(import_module(module_name), command_name)
+        return super().get_command(ctx, cmd_name)
+
+    def format_commands(self, ctx: click.Context, formatter: click.HelpFormatter) -> None:
+        """ Method that writes the command list for the help page.
+            Lazy subcommands use their registered help text, so
+            they are not imported for `--help`.
+
+            Parameters
+            ----------
+            ctx: click.Context
+                The click context
+
+            formatter: click.HelpFormatter
+                The formatter for the help page
+
+            Returns
+            -------
+            None
+        """
+        commands = self.list_commands(ctx)
+        if len(commands) == 0:
+            return
+        limit = formatter.width - 6 - max(len(name) for name in commands)
+
+        rows = []
+        for name in commands:
+            if name in self.lazy_subcommands:
+                help = self.lazy_subcommands[name][1]
+            else:
+                command = self.commands[name]
+                if command.hidden:
+                    continue
+                help = command.get_short_help_str(limit)
+            rows.append((name, help))
+
+        with formatter.section('Commands'):
+            formatter.write_dl(rows)
+
+
+@click.group(cls=LazyGroup, lazy_subcommands={
+    'config': ('nbcli.config.config', 'NetBox CLI configuration'),
+    'flush': ('nbcli.journal.flush', 'Send the changes that were queued with --queue to NetBox'),
+    'organization': ('nbcli.organization.organization', 'Organization management'),
+    'resources': ('nbcli.resources.resources',
+                  'Commands for every NetBox endpoint, generated from the OpenAPI schema'),
+    'shell': ('nbcli.shell.shell', 'Interactive shell that keeps the connection open'),
+    'status': ('nbcli.status.status', 'NetBox status'),
+    'summary': ('nbcli.summary.summary', 'Count the objects in NetBox per type and status'),
+    'sync': ('nbcli.sync.sync', 'Copy sites and regions to a local database for --offline')
+})
 @click.option('-v', '--verbose', count=True)
-def cli(verbose):
+@click.option('-o', '--output', type=click.Choice(['table', 'jsonl', 'csv', 'tsv']),
+              default='table', show_default=True,
+              help='Output format for list commands')
+@click.option('--backend', type=click.Choice(['pynetbox', 'async', 'graphql']),
+              help='Client for the requests to NetBox; overrides the instance setting')
+@click.option('--timings', is_flag=True,
+              help='Print the requests and where the time went when the command ends')
+@click.option('--timings-file', type=click.Path(dir_okay=False, writable=True),
+              help='Write the requests and timings as a Chrome trace to this file')
+@click.pass_context
+def cli(ctx, verbose, output, backend, timings, timings_file):
+    # Save the global options
+    options['output'] = output
+
+    # Record the timings until the command ends
+    if timings or timings_file:
+        from .timings import timings as recorder
+        recorder.enable()
+        ctx.call_on_close(lambda: recorder.finish(timings, timings_file))
+
+    # The backend is set for every command, so a choice does not
+    # stick in the interactive shell
+    from .nbcli import nbcli_object
+    nbcli_object.backend_name = backend
+
     # Set the default logging level
     default_level = logging.ERROR
     if verbose == 1:
@@ -35,12 +180,15 @@ def cli(verbose):
     elif verbose > 2:
         default_level = logging.DEBUG
 
-    # Configure logging
-    logging.basicConfig(
-        level=default_level,
-        format='%(message)s',
-        datefmt='[%X]',
-        handlers=[RichHandler()])
+    # Configure logging. In the interactive shell this runs for
+    # every command, so the handler is only added once
+    if not logging.getLogger().handlers:
+        from rich.logging import RichHandler
+        logging.basicConfig(
+            format='%(message)s',
+            datefmt='[%X]',
+            handlers=[RichHandler()])
+    logging.getLogger().setLevel(default_level)
 
     # Create a logger
     logger = logging.getLogger('cli')
@@ -3,17 +3,39 @@ import click
 from rich.table import Table
 
 from nbcli.exceptions import ConfigInstancesLastDeleted
-from .nbcli import nbcli_object
-from .cli import cli, console, tables
+from .nbcli import nbcli_object, INSTANCE_DEFAULTS
+from .cli import console, options, tables
+from .render import write_records
 
 logger = logging.getLogger('config')
 
+# Columns for machine-readable output of `list-instances`
+list_instances_columns = [
+    {'key': 'name', 'header': 'Name'},
+    {'key': 'active', 'header': 'Active'},
+    {'key': 'server', 'header': 'Server'},
+    {'key': 'port', 'header': 'Port'}
+]
+
+# Labels for the optional instance settings
+instance_settings = {
+    'workers': 'Workers',
+    'tls': 'TLS',
+    'pool_size': 'Pool size',
+    'connect_timeout': 'Connect timeout',
+    'read_timeout': 'Read timeout',
+    'retries': 'Retries',
+    'retry_backoff': 'Retry backoff',
+    'backend': 'Backend',
+    'queue': 'Queue changes'
+}
+
 
 def get_config() -> dict:
     """ retrieve configuration from configfile """
 
 
-@cli.group(help='NetBox CLI configuration')
+@click.group(help='NetBox CLI configuration')
 def config() -> None:
     pass
 
@@ -23,7 +45,26 @@ def config() -> None:
 @click.option('--server', type=str, prompt=True)
 @click.option('--api-key', type=str, prompt='API key')
 @click.option('--port', type=int, default=8000, prompt=True)
-def create_instance(name: str, server: str, api_key: str, port: int) -> None:
+@click.option('--workers', type=int, default=INSTANCE_DEFAULTS['workers'],
+              help='Number of pages to retrieve at the same time')
+@click.option('--tls/--no-tls', default=INSTANCE_DEFAULTS['tls'],
+              help='Connect with HTTPS')
+@click.option('--pool-size', type=int, default=INSTANCE_DEFAULTS['pool_size'],
+              help='Number of connections to keep open')
+@click.option('--connect-timeout', type=float, default=INSTANCE_DEFAULTS['connect_timeout'],
+              help='Connect timeout in seconds')
+@click.option('--read-timeout', type=float, default=INSTANCE_DEFAULTS['read_timeout'],
+              help='Read timeout in seconds')
+@click.option('--retries', type=int, default=INSTANCE_DEFAULTS['retries'],
+              help='Number of retries for connection errors and 5xx responses')
+@click.option('--retry-backoff', type=float, default=INSTANCE_DEFAULTS['retry_backoff'],
+              help='Backoff factor in seconds between retries')
+@click.option('--backend', type=click.Choice(['pynetbox', 'async', 'graphql']),
+              default=INSTANCE_DEFAULTS['backend'],
+              help='Client for the requests; async requires httpx')
+@click.option('--queue/--no-queue', default=INSTANCE_DEFAULTS['queue'],
+              help='Queue site changes in the journal until `nbcli flush`')
+def create_instance(name: str, server: str, api_key: str, port: int, **kwargs) -> None:
     """ The `create-instance` command can be used to add a
         NetBox instance.
 
@@ -41,32 +82,35 @@ def create_instance(name: str, server: str, api_key: str, port: int) -> None:
         port: int
             The port to connect to
 
+        **kwargs: dict
+            The connection settings, like `workers` and `tls`
+
         Returns
         -------
         None
     """
-    # Retrieve the config
-    config = nbcli_object.config
-
-    # Check if this instance is unique
-    if name in config['instances'].keys():
-        console.print(
-            f'[error]There is alrady an instance with the name "[error_highlight]{name}[/]"[/]')
-        return
-
-    # Create the instance dict
-    instance_dict = {
-        'server': server,
-        'port': port,
-        'base_path': '/',
-        'api_key': api_key
-    }
-
-    # Add it to the configuration
-    config['instances'][name] = instance_dict
-
-    # Save the new config
-    nbcli_object.save()
+    # Retrieve the config and keep it locked until it is saved
+    with nbcli_object.lock_config() as config:
+        # Check if this instance is unique
+        if name in config['instances'].keys():
+            console.print(
+                f'[error]There is alrady an instance with the name "[error_highlight]{name}[/]"[/]')
+            return
+
+        # Create the instance dict
+        instance_dict = {
+            'server': server,
+            'port': port,
+            'base_path': '/',
+            'api_key': api_key,
+            **kwargs
+        }
+
+        # Add it to the configuration
+        config['instances'][name] = instance_dict
+
+        # Save the new config
+        nbcli_object.save()
 
 
 @config.command(help='List configured NetBox instances')
@@ -85,6 +129,19 @@ def list_instances() -> None:
     # Retrieve the config
     config = nbcli_object.config
 
+    # Machine-readable output
+    if options['output'] != 'table':
+        rows = (
+            {
+                'name': name,
+                'active': name == config['active_instance'],
+                'server': instance_detail['server'],
+                'port': instance_detail['port']
+            }
+            for name, instance_detail in config['instances'].items())
+        write_records(list_instances_columns, rows, options['output'])
+        return
+
     # Create a table for the output
     table = Table(**tables)
     table.add_column('*', style='item_selected')
@@ -144,6 +201,9 @@ def inspect_instance(name: str) -> None:
     table.add_row('Port', str(instance_object['port']))
     table.add_row('Base path', instance_object['base_path'])
     table.add_row('API key', instance_object['api_key'])
+    for setting, label in instance_settings.items():
+        table.add_row(label, str(
+            instance_object.get(setting, INSTANCE_DEFAULTS[setting])))
 
     # Print the table
     console.print(table)
@@ -155,7 +215,16 @@ def inspect_instance(name: str) -> None:
 @click.option('--api-key', type=str)
 @click.option('--port', type=int)
 @click.option('--base-path', type=str)
-def update_instance(name: str, server: str, api_key: str, port: int, base_path: str) -> None:
+@click.option('--workers', type=int)
+@click.option('--tls/--no-tls', default=None)
+@click.option('--pool-size', type=int)
+@click.option('--connect-timeout', type=float)
+@click.option('--read-timeout', type=float)
+@click.option('--retries', type=int)
+@click.option('--retry-backoff', type=float)
+@click.option('--backend', type=click.Choice(['pynetbox', 'async', 'graphql']))
+@click.option('--queue/--no-queue', default=None)
+def update_instance(name: str, **kwargs) -> None:
     """ Update a instance
 
         Parameters
@@ -163,39 +232,29 @@ def update_instance(name: str, server: str, api_key: str, port: int, base_path:
         name: str
             The name of the instance
 
-        server: str
-            The name of the server
-
-        api_key: str
-            The API key to use for this server
-
-        port: int
-            The port to connect to
-
-        base_path: str
-            The base path on the server for NetBox
+        **kwargs: dict
+            The settings to update, like `server` and `port`
 
         Returns
         -------
         None
     """
-    # Retrieve the config
-    config = nbcli_object.config
+    # Retrieve the config and keep it locked until it is saved
+    with nbcli_object.lock_config() as config:
+        # Check if this instance is unique
+        if name not in config['instances'].keys():
+            logger.debug(
+                f'Possible instances: {list(config["instances"].keys())}')
+            console.print(
+                f'[error]No instance with name "[error_highlight]{name}[/]" found[/]')
+            return
 
-    # Check if this instance is unique
-    if name not in config['instances'].keys():
-        logger.debug(
-            f'Possible instances: {list(config["instances"].keys())}')
-        console.print(
-            f'[error]No instance with name "[error_highlight]{name}[/]" found[/]')
-        return
-
-    # Update the dict
-    for item in ('server', 'api_key', 'port', 'base_path'):
-        if locals()[item]:
-            config['instances'][name][item] = locals()[item]
+        # Update the dict
+        for setting, value in kwargs.items():
+            if value is not None:
+                config['instances'][name][setting] = value
 
-    nbcli_object.save()
+        nbcli_object.save()
 
 
 @config.command(help='Delete a configured NetBox instance')
@@ -211,31 +270,30 @@ def delete_instance(name: str) -> None:
         -------
         None
     """
-    # Retrieve the config
-    config = nbcli_object.config
-
-    # Check if this instance is unique
-    if name not in config['instances'].keys():
-        logger.debug(
-            f'Possible instances: {list(config["instances"].keys())}')
-        console.print(
-            f'[error]No instance with name "[error_highlight]{name}[/]" found[/]')
-        return
-
-    # If this instance is the selected one, we selected another
-    if config['active_instance'] == name:
-        other_instances = [
-            instance
-            for instance in config['instances'].keys()
-            if instance != name]
-        if len(other_instances) == 0:
-            raise ConfigInstancesLastDeleted(
-                'This instance cannot be deleted since it is the last available instance')
-        config['active_instance'] = other_instances[0]
-
-    # Remove the key from the dict
-    config['instances'].pop(name)
-    nbcli_object.save()
+    # Retrieve the config and keep it locked until it is saved
+    with nbcli_object.lock_config() as config:
+        # Check if this instance is unique
+        if name not in config['instances'].keys():
+            logger.debug(
+                f'Possible instances: {list(config["instances"].keys())}')
+            console.print(
+                f'[error]No instance with name "[error_highlight]{name}[/]" found[/]')
+            return
+
+        # If this instance is the selected one, we selected another
+        if config['active_instance'] == name:
+            other_instances = [
+                instance
+                for instance in config['instances'].keys()
+                if instance != name]
+            if len(other_instances) == 0:
+                raise ConfigInstancesLastDeleted(
+                    'This instance cannot be deleted since it is the last available instance')
+            config['active_instance'] = other_instances[0]
+
+        # Remove the key from the dict
+        config['instances'].pop(name)
+        nbcli_object.save()
 
 
 @config.command(help='Activate a specific NetBox instance')
@@ -252,17 +310,16 @@ def activate_instance(name: str) -> None:
         -------
         None
     """
-    # Retrieve the config
-    config = nbcli_object.config
-
-    # Check if this instance is unique
-    if name not in config['instances'].keys():
-        logger.debug(
-            f'Possible instances: {list(config["instances"].keys())}')
-        console.print(
-            f'[error]No instance with name "[error_highlight]{name}[/]" found[/]')
-        return
-
-    # Set the active instance
-    config['active_instance'] = name
-    nbcli_object.save()
+    # Retrieve the config and keep it locked until it is saved
+    with nbcli_object.lock_config() as config:
+        # Check if this instance is unique
+        if name not in config['instances'].keys():
+            logger.debug(
+                f'Possible instances: {list(config["instances"].keys())}')
+            console.print(
+                f'[error]No instance with name "[error_highlight]{name}[/]" found[/]')
+            return
+
+        # Set the active instance
+        config['active_instance'] = name
+        nbcli_object.save()
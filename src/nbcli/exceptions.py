@@ -1,3 +1,6 @@
+from typing import Optional
+
+
 class NetBoxCLIException(Exception):
     """ Base class for exceptions """
     pass
@@ -6,3 +9,55 @@ class NetBoxCLIException(Exception):
 class ConfigInstancesLastDeleted(NetBoxCLIException):
     """ Error when a instance gets deleted that is the last """
     pass
+
+
+class BulkInputError(NetBoxCLIException):
+    """ Error when the input for a bulk action is invalid """
+    pass
+
+
+class MirrorError(NetBoxCLIException):
+    """ Error when the local mirror cannot answer a query """
+    pass
+
+
+class BackendUnavailable(NetBoxCLIException):
+    """ Error when a backend cannot be used """
+    pass
+
+
+class SchemaError(NetBoxCLIException):
+    """ Error when the OpenAPI schema of NetBox cannot be used """
+    pass
+
+
+class GraphQLUnsupported(NetBoxCLIException):
+    """ Error when a query cannot be expressed in GraphQL """
+    pass
+
+
+class NetBoxRequestError(NetBoxCLIException):
+    def __init__(self,
+                 message: str,
+                 status_code: Optional[int] = None,
+                 error: Optional[str] = None) -> None:
+        """ Error when a request to NetBox fails
+
+            Parameters
+            ----------
+            message: str
+                The message
+
+            status_code: Optional[int]
+                The HTTP status code, or None if there is no response
+
+            error: Optional[str]
+                The body of the response
+
+            Returns
+            -------
+            None
+        """
+        super().__init__(message)
+        self.status_code = status_code
+        self.error = error
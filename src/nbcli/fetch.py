@@ -0,0 +1,243 @@
+""" Module with helpers to retrieve lists of resources from NetBox """
+import logging
+from datetime import datetime, timezone
+from typing import Any, Iterator, Optional
+from .cache import cached_rows
+from .nbcli import nbcli_object
+
+logger = logging.getLogger('fetch')
+
+# The page size that is requested from NetBox. NetBox caps this to
+# its `MAX_PAGE_SIZE`, which is 1000 by default.
+DEFAULT_PAGE_SIZE = 1000
+
+# The number of rows in one bulk request
+DEFAULT_CHUNK_SIZE = 100
+
+# The fields that NetBox returns in brief mode. Only the fields
+# that are the same in all versions are listed.
+BRIEF_FIELDS = {
+    'dcim.sites': ('id', 'url', 'display', 'name', 'slug'),
+    'dcim.regions': ('id', 'url', 'display', 'name', 'slug', 'site_count', '_depth')
+}
+
+# The first NetBox version that supports the `fields` parameter
+FIELDS_PARAMETER_VERSION = (4, 0)
+
+# The time in seconds the API version of an instance is cached
+API_VERSION_TTL = 86400
+
+
+def get_api_version() -> tuple:
+    """ Get the API version of the active instance as a tuple, like
+        `(4, 1)`. The version is cached.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        tuple
+            The version, or an empty tuple if it is unknown
+    """
+    rows = [*cached_rows(
+        'api', {'view': 'version'},
+        lambda: iter([{'version': nbcli_object.get_backend().version()}]),
+        API_VERSION_TTL)]
+    version = rows[0]['version'] or ''
+    return tuple(int(part) for part in version.split('.') if part.isdigit())
+
+
+def get_field_filters(endpoint_name: str, fields: list) -> dict:
+    """ Get the filters that make NetBox only return the given
+        fields. NetBox 4.0 and newer support the `fields` parameter.
+        Older versions only support brief mode, which can be used
+        if all fields are part of it. Fields of related objects, like
+        `region.parent`, are only passed on to backends that can
+        select them; for other backends only the related object
+        itself is selected.
+
+        Parameters
+        ----------
+        endpoint_name: str
+            The name of the endpoint, like `dcim.sites`
+
+        fields: list
+            The fields that are needed
+
+        Returns
+        -------
+        dict
+            The filters to add to the request
+    """
+    if nbcli_object.get_backend().field_selection:
+        return {'fields': ','.join(fields)}
+    fields = [*dict.fromkeys(field.split('.')[0] for field in fields)]
+    if get_api_version() >= FIELDS_PARAMETER_VERSION:
+        return {'fields': ','.join(fields)}
+    if all(field in BRIEF_FIELDS.get(endpoint_name, ()) for field in fields):
+        return {'brief': True}
+    return {}
+
+
+def fetch_records(endpoint: str,
+                  filters: dict,
+                  workers: int = 1,
+                  page_size: int = DEFAULT_PAGE_SIZE,
+                  max_results: Optional[int] = None) -> Iterator[dict]:
+    """ Retrieve the resources from an endpoint with the backend of
+        the active instance. The first page gives the total count;
+        the other pages are retrieved by offset with at most
+        `workers` requests at the same time. The resources are
+        returned in the order NetBox returns them.
+
+        Parameters
+        ----------
+        endpoint: str
+            The endpoint, like `dcim.sites`
+
+        filters: dict
+            The filters for the resources
+
+        workers: int
+            The number of pages to retrieve at the same time
+
+        page_size: int
+            The requested page size. NetBox can return smaller pages.
+
+        max_results: Optional[int]
+            The maximum number of resources; no more pages are
+            retrieved when it is reached
+
+        Returns
+        -------
+        Iterator[dict]
+            The resources
+    """
+    return nbcli_object.get_backend().list(
+        endpoint, filters, workers=workers, page_size=page_size, max_results=max_results)
+
+
+def count_records(endpoint: str, filters: dict) -> int:
+    """ Get the number of resources that match filters with one
+        request. The response only contains one resource, with
+        only its ID if the server supports it.
+
+        Parameters
+        ----------
+        endpoint: str
+            The endpoint, like `dcim.sites`
+
+        filters: dict
+            The filters for the resources
+
+        Returns
+        -------
+        int
+            The number of resources
+    """
+    return nbcli_object.get_backend().count(
+        endpoint, {**filters, **get_field_filters(endpoint, ['id'])})
+
+
+def fetch_resource(endpoint: str, filters: dict, fields: list) -> Optional[dict]:
+    """ Retrieve one resource with the given fields. Fields of related
+        objects are given as paths like `region.parent`. Backends that
+        select fields return them with the resource; for the other
+        backends, the related objects are retrieved afterwards.
+
+        Parameters
+        ----------
+        endpoint: str
+            The endpoint, like `dcim.sites`
+
+        filters: dict
+            The filters that match the resource
+
+        fields: list
+            The fields that are needed
+
+        Returns
+        -------
+        Optional[dict]
+            The resource, or None if no resource matches
+    """
+    backend = nbcli_object.get_backend()
+    resources = [*backend.list(
+        endpoint, {**filters, **get_field_filters(endpoint, fields)}, max_results=2)]
+    if len(resources) > 1:
+        raise ValueError('get() returned more than one result')
+    if not resources:
+        return None
+    if not backend.field_selection:
+        backend.resolve_nested(resources, [field for field in fields if '.' in field])
+    return resources[0]
+
+
+def get_path(resource: dict, path: str) -> Any:
+    """ Get the value of a field of a related object, like
+        `region.parent`
+
+        Parameters
+        ----------
+        resource: dict
+            The resource
+
+        path: str
+            The path of the field
+
+        Returns
+        -------
+        Any
+            The value, or None if a related object is missing
+    """
+    value = resource
+    for part in path.split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def parse_timestamp(value: str) -> datetime:
+    """ Parse a timestamp of NetBox, like `last_updated`. Timestamps
+        without a timezone are in UTC.
+
+        Parameters
+        ----------
+        value: str
+            The timestamp in ISO 8601
+
+        Returns
+        -------
+        datetime
+            The timestamp with a timezone
+    """
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def get_newest(newest: Optional[str], value: Optional[str]) -> Optional[str]:
+    """ Get the newer of two timestamps. The timestamps are compared
+        as times, because the precision of the fractional seconds and
+        the timezone offsets can differ.
+
+        Parameters
+        ----------
+        newest: Optional[str]
+            The newest timestamp so far
+
+        value: Optional[str]
+            Another timestamp
+
+        Returns
+        -------
+        Optional[str]
+            The newer timestamp, as it was given
+    """
+    if not value:
+        return newest
+    if not newest or parse_timestamp(value) > parse_timestamp(newest):
+        return value
+    return newest
@@ -0,0 +1,391 @@
+""" Module to build GraphQL queries for the GraphQL backend. A query
+    is built from the fields a command shows, so one request returns
+    exactly those fields, including fields of related objects like
+    `region.parent`. The types of the GraphQL API are read once with
+    an introspection query and stored like the OpenAPI model.
+
+    The results are converted to the JSON the REST API returns: IDs
+    are numbers, and choice fields have a value and a label. Counts
+    like `device_count` are annotated by the REST API and have no
+    GraphQL field, so pages with counts use the REST API. """
+import json
+from typing import Any, Optional
+from .exceptions import GraphQLUnsupported
+
+# The query that reads the types of the GraphQL API
+INTROSPECTION_QUERY = '''
+query {
+  __schema {
+    queryType { name }
+    types {
+      kind
+      name
+      fields { name args { name type { ...TypeRef } } type { ...TypeRef } }
+      inputFields { name type { ...TypeRef } }
+    }
+  }
+}
+fragment TypeRef on __Type {
+  kind name ofType { kind name ofType { kind name ofType { kind name } } }
+}
+'''
+
+# Filter lookups of the REST API and the lookups of NetBox 4.3 and
+# newer, where filters are input objects
+LOOKUPS = {
+    'exact': 'exact',
+    'ic': 'i_contains',
+    'ie': 'i_exact',
+    'isw': 'i_starts_with',
+    'iew': 'i_ends_with',
+    'gt': 'gt',
+    'gte': 'gte',
+    'lt': 'lt',
+    'lte': 'lte'
+}
+
+# The fields that are selected for related objects without
+# subfields, in the order `to_value` shows them
+RELATED_FIELDS = ('name', 'label', 'display')
+
+
+def get_type(node: dict) -> list:
+    """ Get a compact type from an introspected type reference
+
+        Parameters
+        ----------
+        node: dict
+            The type reference
+
+        Returns
+        -------
+        list
+            If the type is a list, the kind like `OBJECT` and the
+            name of the type
+    """
+    is_list = False
+    while node.get('ofType') is not None:
+        is_list = is_list or node['kind'] == 'LIST'
+        node = node['ofType']
+    return [is_list, node['kind'], node['name']]
+
+
+def compile_introspection(result: dict) -> dict:
+    """ Compile the result of the introspection query to the model
+        the query builder uses
+
+        Parameters
+        ----------
+        result: dict
+            The data of the introspection query
+
+        Returns
+        -------
+        dict
+            The fields of the object types, the fields of the input
+            types and the list queries with their type and arguments
+    """
+    model = {'objects': {}, 'inputs': {}, 'lists': {}}
+    query_type = result['__schema']['queryType']['name']
+    for node in result['__schema']['types']:
+        if node['name'].startswith('__'):
+            continue
+        if node['kind'] == 'OBJECT' and node['name'] != query_type:
+            model['objects'][node['name']] = {
+                field['name']: get_type(field['type']) for field in node['fields'] or ()}
+        elif node['kind'] == 'INPUT_OBJECT':
+            model['inputs'][node['name']] = {
+                field['name']: get_type(field['type']) for field in node['inputFields'] or ()}
+        elif node['name'] == query_type:
+            for field in node['fields'] or ():
+                if not field['name'].endswith('_list'):
+                    continue
+                arguments = {argument['name']: get_type(argument['type']) for argument in field['args']}
+                model['lists'][field['name']] = {
+                    'type': get_type(field['type'])[2],
+                    'filters': arguments['filters'][2] if 'filters' in arguments else None,
+                    'pagination': 'pagination' in arguments}
+    return model
+
+
+def get_list_query(model: dict, endpoint: str) -> str:
+    """ Get the list query of an endpoint, like `site_list` for
+        `dcim.sites`
+
+        Parameters
+        ----------
+        model: dict
+            The GraphQL model
+
+        endpoint: str
+            The endpoint
+
+        Returns
+        -------
+        str
+            The name of the list query
+    """
+    name = endpoint.split('.')[1]
+    candidates = [name[:-1]]
+    if name.endswith('ies'):
+        candidates.insert(0, f'{name[:-3]}y')
+    if name.endswith('es'):
+        candidates.append(name[:-2])
+    for candidate in candidates:
+        if f'{candidate}_list' in model['lists']:
+            return f'{candidate}_list'
+    raise GraphQLUnsupported(f'There is no GraphQL query for "{endpoint}"')
+
+
+def to_literal(value: Any) -> str:
+    """ Convert a value to a GraphQL literal
+
+        Parameters
+        ----------
+        value: Any
+            The value; dicts become input objects
+
+        Returns
+        -------
+        str
+            The literal
+    """
+    if isinstance(value, dict):
+        return '{' + ', '.join(f'{key}: {to_literal(item)}' for key, item in value.items()) + '}'
+    if isinstance(value, (list, tuple)):
+        return '[' + ', '.join(to_literal(item) for item in value) + ']'
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if value is None:
+        return 'null'
+    return json.dumps(value if isinstance(value, (int, float)) else str(value))
+
+
+def convert_scalar(value: Any, type_name: str) -> Any:
+    """ Convert a filter value to a GraphQL scalar type
+
+        Parameters
+        ----------
+        value: Any
+            The value from the REST filters
+
+        type_name: str
+            The GraphQL scalar, like `Int`
+
+        Returns
+        -------
+        Any
+            The converted value
+    """
+    if type_name == 'Int' and str(value).lstrip('-').isdigit():
+        return int(value)
+    if type_name == 'Boolean':
+        return str(value).lower() in ('true', '1')
+    return str(value)
+
+
+def get_filters(model: dict, input_type: Optional[str], filters: dict) -> dict:
+    """ Convert REST filters to the `filters` argument of a list
+        query. NetBox 4.2 and older have a filter per lookup, like
+        `name__ic`; newer versions have an input object per field
+        with the lookups.
+
+        Parameters
+        ----------
+        model: dict
+            The GraphQL model
+
+        input_type: Optional[str]
+            The input type of the `filters` argument
+
+        filters: dict
+            The REST filters
+
+        Returns
+        -------
+        dict
+            The filters argument
+    """
+    if not filters:
+        return {}
+    inputs = model['inputs'].get(input_type) if input_type else None
+    if inputs is None:
+        raise GraphQLUnsupported('The list query has no filters')
+
+    converted = {}
+    for name, value in filters.items():
+        values = value if isinstance(value, list) else [value]
+
+        # Filters per lookup
+        if name in inputs:
+            is_list, kind, type_name = inputs[name]
+            if kind == 'ENUM':
+                raise GraphQLUnsupported(f'The filter "{name}" takes an enum')
+            if kind != 'SCALAR':
+                field, lookup = name, 'exact'
+            else:
+                values = [convert_scalar(item, type_name) for item in values]
+                if not is_list and len(values) > 1:
+                    raise GraphQLUnsupported(f'The filter "{name}" takes one value')
+                converted[name] = values if is_list else values[0]
+                continue
+        else:
+            field, _, lookup = name.partition('__')
+            if field not in inputs or inputs[field][1] != 'INPUT_OBJECT':
+                raise GraphQLUnsupported(f'There is no GraphQL filter for "{name}"')
+
+        # Input objects with the lookups
+        lookups = model['inputs'].get(inputs[field][2], {})
+        lookup = LOOKUPS.get(lookup or 'exact')
+        if len(values) > 1:
+            lookup = 'in_list'
+        if lookup not in lookups:
+            raise GraphQLUnsupported(f'There is no GraphQL lookup for "{name}"')
+        if lookups[lookup][1] == 'ENUM':
+            raise GraphQLUnsupported(f'The filter "{name}" takes an enum')
+        type_name = lookups[lookup][2]
+        values = [convert_scalar(item, type_name) for item in values]
+        converted[field] = {lookup: values if lookup == 'in_list' else values[0]}
+    return converted
+
+
+def get_selection(model: dict, type_name: str, fields: list) -> str:
+    """ Build the selection of fields for a type. Fields of related
+        objects are given as paths like `region.parent`; related
+        objects always get their ID and name, like the nested objects
+        of the REST API.
+
+        Parameters
+        ----------
+        model: dict
+            The GraphQL model
+
+        type_name: str
+            The GraphQL type
+
+        fields: list
+            The fields to select
+
+        Returns
+        -------
+        str
+            The selection, without braces
+    """
+    type_fields = model['objects'][type_name]
+
+    # Group the paths by their first field
+    tree = {}
+    for field in fields:
+        first, _, rest = field.partition('.')
+        tree.setdefault(first, [])
+        if rest:
+            tree[first].append(rest)
+
+    selections = []
+    for field, subfields in tree.items():
+        if field not in type_fields:
+            # Counts are annotated by the REST API; selecting the
+            # counted objects would return all of their IDs
+            raise GraphQLUnsupported(f'There is no GraphQL field "{field}" in {type_name}')
+
+        _, kind, target = type_fields[field]
+        if kind != 'OBJECT':
+            if subfields:
+                raise GraphQLUnsupported(f'The GraphQL field "{field}" has no fields')
+            selections.append(field)
+            continue
+        target_fields = model['objects'][target]
+        subfields = [*dict.fromkeys([
+            'id', *(name for name in RELATED_FIELDS if name in target_fields), *subfields])]
+        selections.append(f'{field} {{ {get_selection(model, target, subfields)} }}')
+    return ' '.join(selections)
+
+
+def build_query(model: dict,
+                endpoint: str,
+                filters: dict,
+                fields: list,
+                limit: int,
+                offset: int) -> tuple:
+    """ Build the query for a page of resources
+
+        Parameters
+        ----------
+        model: dict
+            The GraphQL model
+
+        endpoint: str
+            The endpoint, like `dcim.sites`
+
+        filters: dict
+            The REST filters, without `fields`
+
+        fields: list
+            The fields to select; paths like `region.parent` for
+            fields of related objects
+
+        limit: int
+            The number of resources
+
+        offset: int
+            The number of resources to skip
+
+        Returns
+        -------
+        tuple
+            The name of the list query and the query
+    """
+    list_query = get_list_query(model, endpoint)
+    definition = model['lists'][list_query]
+    if not definition['pagination']:
+        raise GraphQLUnsupported(f'The GraphQL query "{list_query}" has no pagination')
+
+    arguments = {'pagination': {'offset': offset, 'limit': limit}}
+    query_filters = get_filters(model, definition['filters'], filters)
+    if query_filters:
+        arguments = {'filters': query_filters, **arguments}
+    selection = get_selection(model, definition['type'], fields)
+    argument_list = ', '.join(f'{name}: {to_literal(value)}' for name, value in arguments.items())
+    return list_query, f'query {{ {list_query}({argument_list}) {{ {selection} }} }}'
+
+
+def convert_resource(resource: Any, labels: dict, top: bool = True) -> Any:
+    """ Convert a resource from GraphQL to the JSON of the REST API
+
+        Parameters
+        ----------
+        resource: Any
+            The resource, or a value in it
+
+        labels: dict
+            The labels of the choice fields by field and value, from
+            the OpenAPI model
+
+        top: bool
+            If set, the value is the resource itself, so choice
+            fields are converted
+
+        Returns
+        -------
+        Any
+            The converted value
+    """
+    if isinstance(resource, list):
+        return [convert_resource(item, labels, False) for item in resource]
+    if not isinstance(resource, dict):
+        return resource
+
+    converted = {}
+    for field, value in resource.items():
+        if field == 'id' and isinstance(value, str) and value.isdigit():
+            value = int(value)
+        elif top and field in labels and isinstance(value, str):
+            # Enums can be the value, or the name like `STATUS_ACTIVE`
+            choice = next((
+                choice for choice in labels[field]
+                if value.lower() == choice or value.lower().endswith(f'_{choice}')), value.lower())
+            value = {'value': choice, 'label': labels[field].get(choice, value)}
+        else:
+            value = convert_resource(value, labels, False)
+        converted[field] = value
+    return converted
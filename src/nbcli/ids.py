@@ -0,0 +1,215 @@
+""" Module with a persistent index from names to IDs. Commands that
+    change a single resource use it to find the URL of the resource
+    without filtering by name. Another client can rename or delete a
+    resource and reuse its name, so the resource behind an ID is
+    checked before the PATCH or DELETE is sent. """
+import json
+import logging
+import os
+from typing import Any, Optional
+from .nbcli import nbcli_object, NBCLI_DATA_DIR
+from .exceptions import NetBoxRequestError
+
+NBCLI_IDS_DIR = f'{NBCLI_DATA_DIR}/ids'
+
+# The fields that identify a resource
+ID_FIELDS = ('name',)
+
+logger = logging.getLogger('ids')
+
+
+class IdIndex:
+    def __init__(self, instance_name: str, endpoint: str) -> None:
+        """ The initiator loads the index of the endpoint
+
+            Parameters
+            ----------
+            instance_name: str
+                The name of the NetBox instance
+
+            endpoint: str
+                The endpoint, like `dcim.sites`
+
+            Returns
+            -------
+            None
+        """
+        self.endpoint = endpoint
+        self.path = os.path.join(NBCLI_IDS_DIR, instance_name, f'{endpoint}.json')
+        try:
+            with open(self.path, 'r') as index_file:
+                self.entries = json.load(index_file)
+        except (FileNotFoundError, ValueError):
+            self.entries = {}
+        for field in ID_FIELDS:
+            self.entries.setdefault(field, {})
+            # Indexes of older versions store the ID with a time
+            self.entries[field] = {
+                value: entry[0] if isinstance(entry, list) else entry
+                for value, entry in self.entries[field].items()}
+
+    def get(self, field: str, value: str) -> Optional[int]:
+        """ Method to get the ID for a name
+
+            Parameters
+            ----------
+            field: str
+                The field, `name`
+
+            value: str
+                The name
+
+            Returns
+            -------
+            Optional[int]
+                The ID, or None if there is no entry
+        """
+        return self.entries[field].get(value)
+
+    def add(self, resource: dict) -> None:
+        """ Method to add the entries for a resource. Old entries
+            for the same ID are replaced, so renames are picked up.
+
+            Parameters
+            ----------
+            resource: dict
+                The resource with its `id` and the fields in
+                `ID_FIELDS`
+
+            Returns
+            -------
+            None
+        """
+        self.remove(resource['id'])
+        for field in ID_FIELDS:
+            if resource.get(field):
+                self.entries[field][resource[field]] = resource['id']
+
+    def remove(self, resource_id: int) -> None:
+        """ Method to remove the entries for an ID
+
+            Parameters
+            ----------
+            resource_id: int
+                The ID of the resource
+
+            Returns
+            -------
+            None
+        """
+        for field in ID_FIELDS:
+            self.entries[field] = {
+                value: entry for value, entry in self.entries[field].items()
+                if entry != resource_id}
+
+    def clear(self) -> None:
+        """ Method to remove all entries
+
+            Parameters
+            ----------
+            None
+
+            Returns
+            -------
+            None
+        """
+        self.entries = {field: {} for field in ID_FIELDS}
+
+    def save(self) -> None:
+        """ Method to save the index. The index is written to a
+            temporary file that replaces the index, so other
+            processes never read a partly written index.
+
+            Parameters
+            ----------
+            None
+
+            Returns
+            -------
+            None
+        """
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(temp_path, 'w') as index_file:
+            json.dump(self.entries, index_file)
+        os.replace(temp_path, self.path)
+
+
+def get_id_index(endpoint: str) -> IdIndex:
+    """ Get the index of an endpoint for the active instance
+
+        Parameters
+        ----------
+        endpoint: str
+            The endpoint, like `dcim.sites`
+
+        Returns
+        -------
+        IdIndex
+            The index
+    """
+    return IdIndex(nbcli_object.get_active_instance_name(), endpoint)
+
+
+def write_by_name(endpoint_name: str, name: str, changes: Optional[dict] = None) -> Any:
+    """ Update or delete a resource by its name. The ID comes from
+        the index if possible; the resource with that ID is retrieved
+        and only used if it still has the name. Otherwise the
+        resource is looked up by its name and added to the index.
+
+        Parameters
+        ----------
+        endpoint_name: str
+            The name of the endpoint, like `dcim.sites`
+
+        name: str
+            The name of the resource
+
+        changes: Optional[dict]
+            The values to update. If not given, the resource is
+            deleted.
+
+        Returns
+        -------
+        Any
+            The updated resource as dict, True for a delete, or None
+            if there is no resource with the name
+    """
+    backend = nbcli_object.get_backend()
+    index = get_id_index(endpoint_name)
+
+    # The resource can be renamed or deleted, and another resource
+    # can have its name now
+    resource_id = index.get('name', name)
+    if resource_id is not None:
+        resource = backend.get(endpoint_name, resource_id)
+        if resource is None or resource.get('name') != name:
+            logger.debug(f'ID {resource_id} of "{name}" is stale')
+            index.remove(resource_id)
+            resource_id = None
+
+    if resource_id is None:
+        logger.debug(f'Looking up the ID of "{name}" in "{endpoint_name}"')
+        resource = backend.get(endpoint_name, name=name)
+        if resource is None:
+            index.save()
+            return None
+        resource_id = resource['id']
+        index.add(resource)
+
+    try:
+        if changes is None:
+            result = backend.delete(endpoint_name, resource_id)
+            index.remove(resource_id)
+        else:
+            result = backend.update(endpoint_name, changes, resource_id)
+            index.add(result)
+    except NetBoxRequestError as error:
+        if error.status_code != 404:
+            raise
+        # The resource was deleted after it was retrieved
+        index.remove(resource_id)
+        result = None
+
+    index.save()
+    return result
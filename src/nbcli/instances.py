@@ -0,0 +1,120 @@
+""" Module to run read commands on several NetBox instances at the
+    same time. Every instance is queried in its own thread that uses
+    the instance instead of the active instance; the configuration
+    file is not changed. """
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+import click
+from .nbcli import nbcli_object
+from .cli import error_console
+
+# The column that shows the instance of a row
+INSTANCE_COLUMN = {'key': 'instance', 'header': 'Instance', 'style': 'item_selected'}
+
+logger = logging.getLogger('instances')
+
+
+def instance_options(function: Callable) -> Callable:
+    """ Decorator that adds the options to choose instances to a
+        command
+
+        Parameters
+        ----------
+        function: Callable
+            The command function
+
+        Returns
+        -------
+        Callable
+            The command function with the options
+    """
+    function = click.option(
+        '--all-instances', is_flag=True,
+        help='Query all configured instances at the same time')(function)
+    function = click.option(
+        '--instance', 'instances', type=str, multiple=True,
+        help='Query this instance instead of the active one; can be repeated')(function)
+    return function
+
+
+def get_instance_names(instances: tuple, all_instances: bool) -> list:
+    """ Get the names of the instances that are chosen with the
+        instance options
+
+        Parameters
+        ----------
+        instances: tuple
+            The names given with `--instance`
+
+        all_instances: bool
+            If set, all configured instances are used
+
+        Returns
+        -------
+        list
+            The names of the instances, or an empty list if no
+            instances are chosen and the active instance is used
+    """
+    configured = nbcli_object.config['instances']
+    if all_instances:
+        return [*configured]
+
+    unknown = [name for name in instances if name not in configured]
+    if unknown:
+        raise click.BadParameter(
+            f'Unknown instance "{unknown[0]}"; choose from {", ".join(configured)}',
+            param_hint='--instance')
+    return [*dict.fromkeys(instances)]
+
+
+def run_on_instances(names: list, function: Callable[[], Any]) -> list:
+    """ Run a function for every instance at the same time. Errors,
+        like an instance that cannot be reached, are returned
+        instead of raised, so they do not stop the other instances.
+
+        Parameters
+        ----------
+        names: list
+            The names of the instances
+
+        function: Callable[[], Any]
+            The function; it uses the instance through
+            `nbcli_object`
+
+        Returns
+        -------
+        list
+            A tuple for every instance, in the given order, with the
+            name, the result and the error. Either the result or the
+            error is None.
+    """
+    def run(name: str) -> tuple:
+        with nbcli_object.use_instance(name):
+            try:
+                return name, function(), None
+            except Exception as error:
+                logger.debug(f'Query on instance "{name}" failed', exc_info=True)
+                return name, None, error
+
+    with ThreadPoolExecutor(max_workers=max(len(names), 1)) as executor:
+        return [*executor.map(run, names)]
+
+
+def print_errors(results: list) -> None:
+    """ Print the errors of the instances that failed. They are
+        printed to stderr, so they do not mix with the rows.
+
+        Parameters
+        ----------
+        results: list
+            The results of `run_on_instances`
+
+        Returns
+        -------
+        None
+    """
+    for name, _, error in results:
+        if error is not None:
+            error_console.print(
+                f'[error]Instance "[error_highlight]{name}[/]" failed: {error}[/]')
@@ -0,0 +1,617 @@
+""" Module with the write-behind journal. With `--queue`, commands that
+    create, update or delete a site append the change to the journal
+    of the instance and return without sending a request to NetBox.
+    The `flush` command sends the journal later: the changes to one
+    object are combined, the combined changes are sent in bulk
+    requests, and the changes of one object are applied in the order
+    they were queued.
+
+    Changes that NetBox rejects go to a dead-letter file. Changes that
+    did not reach NetBox, or that failed with a server error, stay in
+    the journal for the next flush. """
+import json
+import logging
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+import click
+from rich.table import Table
+from .nbcli import nbcli_object, NBCLI_DATA_DIR
+from .cli import console, tables
+from .cache import get_cache
+from .fetch import DEFAULT_CHUNK_SIZE
+from .exceptions import NetBoxRequestError
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+NBCLI_JOURNAL_DIR = f'{NBCLI_DATA_DIR}/journal'
+
+# The order of the actions in one round of the flush. Deletes and
+# updates go first, so creates can use the names and slugs that they
+# free; updates also find their objects by name before a create
+# reuses it.
+ACTION_ORDER = ('delete', 'update', 'create')
+
+# Other endpoints whose cached results change with an endpoint
+RELATED_CACHES = {
+    'dcim.sites': ('dcim.regions',)
+}
+
+# Status codes of errors that are retried by the next flush
+RETRY_STATUS_CODES = (408, 429)
+
+logger = logging.getLogger('journal')
+
+
+def queue_option(function: Callable) -> Callable:
+    """ Decorator that adds the `--queue/--no-queue` option to a
+        command that changes resources
+
+        Parameters
+        ----------
+        function: Callable
+            The command function
+
+        Returns
+        -------
+        Callable
+            The command function with the option
+    """
+    return click.option(
+        '--queue/--no-queue', default=None,
+        help='Add the change to the journal and send it later with `nbcli flush`; '
+             'overrides the instance setting')(function)
+
+
+def use_queue(queue: Optional[bool]) -> bool:
+    """ Check if changes are queued, from the option or the instance
+        setting
+
+        Parameters
+        ----------
+        queue: Optional[bool]
+            The value of the `--queue` option
+
+        Returns
+        -------
+        bool
+            True if the change goes to the journal
+    """
+    return nbcli_object.get_instance_setting('queue') if queue is None else queue
+
+
+def get_journal_path(name: str) -> str:
+    """ Get the path of a journal file of the active instance
+
+        Parameters
+        ----------
+        name: str
+            The name of the file, like `journal` or `dead-letter`
+
+        Returns
+        -------
+        str
+            The path
+    """
+    return os.path.join(
+        NBCLI_JOURNAL_DIR, nbcli_object.get_active_instance_name(), f'{name}.jsonl')
+
+
+@contextmanager
+def lock_journal(name: str = 'journal', blocking: bool = True) -> Iterator[bool]:
+    """ Context manager that holds an exclusive lock on the journal of
+        the active instance, so changes that are queued while the
+        journal is flushed are not lost
+
+        Parameters
+        ----------
+        name: str
+            The name of the lock; `flush` is held while flushing
+
+        blocking: bool
+            If not set, the lock is not waited for
+
+        Returns
+        -------
+        Iterator[bool]
+            True if the lock is held
+    """
+    path = get_journal_path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f'{path[:-len(".jsonl")]}.lock', 'a') as lock_file:
+        if fcntl is None:
+            yield True
+            return
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def read_entries(path: str) -> list:
+    """ Read the entries of a journal file. A line that was only
+        partly written, because the process was stopped, is skipped.
+
+        Parameters
+        ----------
+        path: str
+            The path of the file
+
+        Returns
+        -------
+        list
+            The entries
+    """
+    entries = []
+    try:
+        with open(path, 'r') as journal_file:
+            for line in journal_file:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    logger.warning(f'Skipping an incomplete line in "{path}"')
+    except FileNotFoundError:
+        pass
+    return entries
+
+
+def write_entries(path: str, entries: list, append: bool = False) -> None:
+    """ Write entries to a journal file. The data is synced to disk
+        before the function returns. Without `append`, the entries
+        are written to a temporary file that replaces the file.
+
+        Parameters
+        ----------
+        path: str
+            The path of the file
+
+        entries: list
+            The entries
+
+        append: bool
+            If set, the entries are added to the end of the file
+
+        Returns
+        -------
+        None
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    target = path if append else f'{path}.{os.getpid()}.tmp'
+    with open(target, 'a' if append else 'w') as journal_file:
+        journal_file.write(''.join(f'{json.dumps(entry)}\n' for entry in entries))
+        journal_file.flush()
+        os.fsync(journal_file.fileno())
+    if not append:
+        os.replace(target, path)
+
+
+def queue_change(endpoint: str, action: str, name: str, data: Optional[dict] = None) -> dict:
+    """ Add a change to the journal of the active instance
+
+        Parameters
+        ----------
+        endpoint: str
+            The endpoint, like `dcim.sites`
+
+        action: str
+            The action; `create`, `update` or `delete`
+
+        name: str
+            The name of the resource
+
+        data: Optional[dict]
+            The values for a create or update
+
+        Returns
+        -------
+        dict
+            The journal entry
+    """
+    entry = {
+        'id': uuid.uuid4().hex,
+        'queued_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'endpoint': endpoint,
+        'action': action,
+        'name': name,
+        'data': data or {}
+    }
+    with lock_journal():
+        write_entries(get_journal_path('journal'), [entry], append=True)
+    logger.debug(f'Queued {action} of "{name}" in "{endpoint}"')
+    return entry
+
+
+def combine(entries: list) -> tuple:
+    """ Combine the entries per object. Updates are merged into the
+        create or update before them, a delete replaces the updates
+        before it and cancels a create. A create after a delete is
+        kept as a second operation, so the object is created again
+        after it was deleted.
+
+        Parameters
+        ----------
+        entries: list
+            The journal entries in the order they were queued
+
+        Returns
+        -------
+        tuple
+            The objects, each with its name in NetBox and its
+            operations, and the entries that conflict with the
+            entries before them, with a message
+    """
+    objects = []
+    current = {}
+    conflicts = []
+    for entry in entries:
+        endpoint, action, data = entry['endpoint'], entry['action'], entry['data']
+        key = (endpoint, entry['name'])
+        if key not in current:
+            current[key] = {'endpoint': endpoint, 'name': entry['name'], 'operations': []}
+            objects.append(current[key])
+        item = current[key]
+        last = item['operations'][-1] if item['operations'] else None
+
+        if action == 'create':
+            if last is not None and last['action'] != 'delete':
+                conflicts.append((entry, 'The object is created or updated before in the journal'))
+                continue
+            item['operations'].append({'action': action, 'data': dict(data), 'entries': [entry]})
+        elif last is not None and last['action'] == 'delete':
+            conflicts.append((entry, 'The object is deleted before in the journal'))
+            continue
+        elif action == 'update':
+            if last is None:
+                item['operations'].append({'action': action, 'data': dict(data), 'entries': [entry]})
+            else:
+                last['data'].update(data)
+                last['entries'].append(entry)
+        elif last is not None and last['action'] == 'create':
+            # The object is never created
+            item['operations'].pop()
+            item.setdefault('cancelled', []).extend([*last['entries'], entry])
+        elif last is not None:
+            last.update(action='delete', data={})
+            last['entries'].append(entry)
+        else:
+            item['operations'].append({'action': action, 'data': {}, 'entries': [entry]})
+
+        # A new name moves the object to that name
+        new_name = data.get('name')
+        if action != 'delete' and new_name and new_name != entry['name']:
+            del current[key]
+            current[(endpoint, new_name)] = item
+    return objects, conflicts
+
+
+def is_retried(error: NetBoxRequestError) -> bool:
+    """ Check if a failed request is tried again by the next flush
+
+        Parameters
+        ----------
+        error: NetBoxRequestError
+            The error
+
+        Returns
+        -------
+        bool
+            True if the request did not reach NetBox, or failed
+            because of the server
+    """
+    return (error.status_code is None or error.status_code >= 500
+            or error.status_code in RETRY_STATUS_CODES)
+
+
+def apply_chunk(endpoint: str, action: str, items: list) -> list:
+    """ Send one chunk of operations to NetBox. If NetBox rejects
+        some objects of a bulk request, the request is sent again
+        without them.
+
+        Parameters
+        ----------
+        endpoint: str
+            The endpoint, like `dcim.sites`
+
+        action: str
+            The action of the operations
+
+        items: list
+            Tuples with the object and its operation
+
+        Returns
+        -------
+        list
+            The result per operation: None if it was applied,
+            otherwise if it is retried and the error message
+    """
+    from .bulk import NOT_APPLIED_MESSAGE, get_error_messages, get_name_error, resolve_ids
+
+    backend = nbcli_object.get_backend()
+    results = [None] * len(items)
+    pending = [*range(len(items))]
+    try:
+        # Updates and deletes need the IDs of the objects
+        ids = {}
+        if action != 'create':
+            ids = resolve_ids(endpoint, [{'name': item['name']} for item, _ in items])
+            for index in pending:
+                message = get_name_error(ids, items[index][0]['name'])
+                if message is not None:
+                    results[index] = (False, message)
+            pending = [index for index in pending if results[index] is None]
+
+        while pending:
+            try:
+                if action == 'create':
+                    backend.create(endpoint, [items[index][1]['data'] for index in pending])
+                elif action == 'update':
+                    backend.update(endpoint, [
+                        {**items[index][1]['data'], 'id': ids[items[index][0]['name']]}
+                        for index in pending])
+                else:
+                    backend.delete(endpoint, [ids[items[index][0]['name']] for index in pending])
+                pending = []
+            except NetBoxRequestError as error:
+                if is_retried(error):
+                    raise
+                messages = get_error_messages(error, len(pending))
+                for index, message in zip(pending, messages):
+                    if message != NOT_APPLIED_MESSAGE:
+                        results[index] = (False, message)
+                remaining = [index for index in pending if results[index] is None]
+                if len(remaining) == len(pending):
+                    for index in pending:
+                        results[index] = (False, str(error))
+                    remaining = []
+                pending = remaining
+    except NetBoxRequestError as error:
+        for index in pending:
+            results[index] = (True, str(error))
+    return results
+
+
+def apply_operations(operations: list, chunk_size: int, workers: int) -> list:
+    """ Apply the operations of one round. The actions are sent one
+        after the other in the order of `ACTION_ORDER`; the chunks of
+        one action are sent at the same time.
+
+        Parameters
+        ----------
+        operations: list
+            Tuples with the object and its operation
+
+        chunk_size: int
+            The number of objects in one request
+
+        workers: int
+            The number of requests at the same time
+
+        Returns
+        -------
+        list
+            The result per operation, like `apply_chunk`
+    """
+    from .bulk import chunks
+
+    results = {}
+    for action in ACTION_ORDER:
+        groups = {}
+        for index, (item, operation) in enumerate(operations):
+            if operation['action'] == action:
+                groups.setdefault(item['endpoint'], []).append(index)
+        jobs = [
+            (endpoint, chunk) for endpoint, indexes in groups.items()
+            for chunk in chunks(indexes, chunk_size)]
+        if not jobs:
+            continue
+
+        logger.debug(f'Sending {sum(len(chunk) for _, chunk in jobs)} {action}s in {len(jobs)} requests')
+        with ThreadPoolExecutor(max_workers=max(min(workers, len(jobs)), 1)) as executor:
+            chunk_results = executor.map(
+                nbcli_object.bind_instance(lambda job: apply_chunk(
+                    job[0], action, [operations[index] for index in job[1]])),
+                jobs)
+            for (_, chunk), chunk_result in zip(jobs, chunk_results):
+                results.update(zip(chunk, chunk_result))
+    return [results[index] for index in range(len(operations))]
+
+
+def print_operations(objects: list) -> None:
+    """ Print the combined operations of a flush
+
+        Parameters
+        ----------
+        objects: list
+            The objects from `combine`
+
+        Returns
+        -------
+        None
+    """
+    table = Table(**tables)
+    table.add_column('Endpoint')
+    table.add_column('Name', style='item_identification')
+    table.add_column('Action')
+    table.add_column('Changes')
+    table.add_column('Entries', justify='right')
+    for item in objects:
+        for operation in item['operations']:
+            table.add_row(
+                item['endpoint'], item['name'], operation['action'],
+                ', '.join(f'{field}={value}' for field, value in operation['data'].items()),
+                str(len(operation['entries'])))
+    console.print(table)
+
+
+def print_failures(failures: list) -> None:
+    """ Print the entries that went to the dead-letter file
+
+        Parameters
+        ----------
+        failures: list
+            The dead-letter entries
+
+        Returns
+        -------
+        None
+    """
+    table = Table(**tables)
+    table.add_column('Queued at')
+    table.add_column('Endpoint')
+    table.add_column('Name', style='item_identification')
+    table.add_column('Action')
+    table.add_column('Error')
+    for entry in failures:
+        table.add_row(
+            entry['queued_at'], entry['endpoint'], entry['name'], entry['action'],
+            f'[error]{entry["error"]}[/]')
+    console.print(table)
+
+
+@click.command(help='Send the changes that were queued with --queue to NetBox')
+@click.option('--chunk-size', type=click.IntRange(min=1), default=DEFAULT_CHUNK_SIZE,
+              show_default=True, help='Number of objects in one request')
+@click.option('--workers', type=click.IntRange(min=1),
+              help='Number of requests at the same time; overrides the instance setting')
+@click.option('--dry-run', is_flag=True,
+              help='Show the combined changes without sending them')
+def flush(chunk_size: int, workers: Optional[int], dry_run: bool) -> None:
+    """ The `flush` command sends the journal of the active instance
+        to NetBox. The journal is moved aside first, so changes that
+        are queued during the flush wait for the next one. Entries
+        that are still in the journal after a flush was stopped are
+        recognized by their ID and sent once. The IDs of the applied
+        entries are recorded after every round, so a flush that was
+        stopped is continued without sending them again.
+
+        Parameters
+        ----------
+        chunk_size: int
+            The number of objects in one request
+
+        workers: Optional[int]
+            The number of requests at the same time
+
+        dry_run: bool
+            If set, the combined changes are only shown
+
+        Returns
+        -------
+        None
+    """
+    journal_path = get_journal_path('journal')
+    flushing_path = get_journal_path('flushing')
+    applied_path = get_journal_path('applied')
+    dead_letter_path = get_journal_path('dead-letter')
+    if workers is None:
+        workers = nbcli_object.get_instance_setting('workers')
+
+    with lock_journal('flush', blocking=False) as locked:
+        if not locked:
+            console.print('[error]Another flush of this instance is running[/]')
+            return
+
+        # Move the queued entries aside, without the entries that a
+        # stopped flush applied
+        with lock_journal():
+            applied = {entry['id'] for entry in read_entries(applied_path)}
+            entries = {
+                entry['id']: entry
+                for entry in [*read_entries(flushing_path), *read_entries(journal_path)]
+                if entry['id'] not in applied}
+            entries = [*entries.values()]
+            if not entries:
+                for path in (flushing_path, applied_path):
+                    if os.path.exists(path):
+                        os.remove(path)
+                console.print('The journal is empty')
+                return
+            if dry_run:
+                objects, conflicts = combine(entries)
+                print_operations(objects)
+                if conflicts:
+                    print_failures([{**entry, 'error': message} for entry, message in conflicts])
+                return
+            write_entries(flushing_path, entries)
+            for path in (journal_path, applied_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+        objects, conflicts = combine(entries)
+        failures = [
+            {**entry, 'error': message} for entry, message in conflicts]
+        kept = []
+
+        # The nth operations of all objects are applied together
+        rounds = max((len(item['operations']) for item in objects), default=0)
+        operations = [(item, item['operations'][0]) for item in objects if item['operations']]
+        count = len(operations)
+        for number in range(rounds):
+            results = apply_operations(operations, chunk_size, workers)
+            write_entries(applied_path, [
+                {'id': entry['id']}
+                for (_, operation), result in zip(operations, results) if result is None
+                for entry in operation['entries']], append=True)
+
+            next_operations = []
+            for (item, operation), result in zip(operations, results):
+                later = item['operations'][number + 1:]
+                if result is None:
+                    if later:
+                        next_operations.append((item, later[0]))
+                    continue
+
+                # The later operations of the object wait for this one
+                retried, message = result
+                later_entries = [entry for other in later for entry in other['entries']]
+                if retried:
+                    kept.extend([*operation['entries'], *later_entries])
+                else:
+                    failures.extend({**entry, 'error': message} for entry in operation['entries'])
+                    failures.extend(
+                        {**entry, 'error': 'A change before it in the journal failed'}
+                        for entry in later_entries)
+            operations = next_operations
+            count += len(operations)
+
+        # Entries that are tried again go before the entries that
+        # were queued during the flush
+        failed_at = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+        if failures:
+            write_entries(
+                dead_letter_path, [{**entry, 'failed_at': failed_at} for entry in failures],
+                append=True)
+        with lock_journal():
+            order = {entry['id']: index for index, entry in enumerate(entries)}
+            kept.sort(key=lambda entry: order[entry['id']])
+            queued = read_entries(journal_path)
+            if kept or queued:
+                write_entries(journal_path, [*kept, *queued])
+            for path in (flushing_path, applied_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    # Cached results of the endpoints are outdated
+    endpoints = {item['endpoint'] for item in objects}
+    get_cache().invalidate(*endpoints, *(
+        related for endpoint in endpoints for related in RELATED_CACHES.get(endpoint, ())))
+
+    if failures:
+        print_failures(failures)
+        console.print(f'Failed changes were added to "{dead_letter_path}"')
+    cancelled = sum(len(item.get('cancelled', ())) for item in objects)
+    applied = len(entries) - len(failures) - len(kept) - cancelled
+    console.print(
+        f'{applied} of {len(entries)} queued changes applied as {count} operations, '
+        f'{cancelled} cancelled out, {len(failures)} failed, {len(kept)} kept for the next flush')
@@ -0,0 +1,301 @@
+""" Module with a local SQLite mirror of NetBox resources. `nbcli
+    sync` fills the mirror; commands with `--offline` read from it
+    without talking to NetBox. Every endpoint has its own table with
+    indexed columns for the fields that can be filtered on and the
+    complete row as JSON. """
+import json
+import logging
+import os
+import sqlite3
+import time
+from typing import Iterator, Optional
+from .nbcli import nbcli_object, NBCLI_DATA_DIR
+from .exceptions import MirrorError
+from .fetch import get_newest
+
+NBCLI_MIRROR_DIR = f'{NBCLI_DATA_DIR}/mirror'
+
+# The endpoints that are mirrored
+MIRROR_ENDPOINTS = ('dcim.regions', 'dcim.sites')
+
+# The fields that get their own indexed column. These are the
+# fields the list commands can filter on.
+INDEXED_FIELDS = ('name', 'description')
+
+# The fields that rows can be ordered by
+ORDERING_FIELDS = ('id', 'last_updated', *INDEXED_FIELDS)
+
+logger = logging.getLogger('mirror')
+
+
+def get_table(endpoint: str) -> str:
+    """ Get the name of the table for an endpoint
+
+        Parameters
+        ----------
+        endpoint: str
+            The endpoint, like `dcim.sites`
+
+        Returns
+        -------
+        str
+            The name of the table, like `dcim_sites`
+    """
+    return endpoint.replace('.', '_')
+
+
+class Mirror:
+    def __init__(self, instance_name: str) -> None:
+        """ The initiator opens the database for the instance
+
+            Parameters
+            ----------
+            instance_name: str
+                The name of the NetBox instance
+
+            Returns
+            -------
+            None
+        """
+        self.path = os.path.join(NBCLI_MIRROR_DIR, f'{instance_name}.sqlite3')
+        os.makedirs(NBCLI_MIRROR_DIR, exist_ok=True)
+
+        # Readers are not blocked while a sync writes
+        self.connection = sqlite3.connect(self.path)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS sync_state ('
+            'endpoint TEXT PRIMARY KEY, last_updated TEXT, synced_at REAL)')
+
+    def create_table(self, endpoint: str) -> None:
+        """ Method to create the table for an endpoint
+
+            Parameters
+            ----------
+            endpoint: str
+                The endpoint
+
+            Returns
+            -------
+            None
+        """
+        table = get_table(endpoint)
+        columns = ''.join(f', {field} TEXT' for field in INDEXED_FIELDS)
+        self.connection.execute(
+            f'CREATE TABLE IF NOT EXISTS {table} ('
+            f'id INTEGER PRIMARY KEY, last_updated TEXT{columns}, row TEXT NOT NULL)')
+        for field in INDEXED_FIELDS:
+            self.connection.execute(
+                f'CREATE INDEX IF NOT EXISTS {table}_{field} ON {table} ({field})')
+
+    def get_state(self, endpoint: str) -> Optional[tuple]:
+        """ Method to get the sync state of an endpoint
+
+            Parameters
+            ----------
+            endpoint: str
+                The endpoint
+
+            Returns
+            -------
+            Optional[tuple]
+                The newest `last_updated` and the time of the last
+                sync, or None if the endpoint was never synced
+        """
+        return self.connection.execute(
+            'SELECT last_updated, synced_at FROM sync_state WHERE endpoint = ?',
+            (endpoint,)).fetchone()
+
+    def store(self, endpoint: str, rows: Iterator[dict], full: bool = False) -> int:
+        """ Method to insert or update rows. With `full`, the rows
+            replace all rows of the endpoint.
+
+            Parameters
+            ----------
+            endpoint: str
+                The endpoint
+
+            rows: Iterator[dict]
+                The rows, as returned by `to_row`
+
+            full: bool
+                If set, rows that are not given are removed
+
+            Returns
+            -------
+            int
+                The number of stored rows
+        """
+        table = get_table(endpoint)
+        state = self.get_state(endpoint)
+        newest = state[0] if state and not full else None
+        count = 0
+
+        with self.connection:
+            self.create_table(endpoint)
+            if full:
+                self.connection.execute(f'DELETE FROM {table}')
+            for row in rows:
+                self.connection.execute(
+                    f'INSERT OR REPLACE INTO {table} '
+                    f'(id, last_updated, {", ".join(INDEXED_FIELDS)}, row) '
+                    f'VALUES (?, ?{", ?" * len(INDEXED_FIELDS)}, ?)',
+                    (row['id'], row.get('last_updated'),
+                     *(row.get(field) for field in INDEXED_FIELDS), json.dumps(row)))
+                newest = get_newest(newest, row.get('last_updated'))
+                count += 1
+            self.connection.execute(
+                'INSERT OR REPLACE INTO sync_state (endpoint, last_updated, synced_at) '
+                'VALUES (?, ?, ?)', (endpoint, newest, time.time()))
+        return count
+
+    def remove_missing(self, endpoint: str, ids: set) -> int:
+        """ Method to remove the rows that no longer exist in NetBox
+
+            Parameters
+            ----------
+            endpoint: str
+                The endpoint
+
+            ids: set
+                The IDs of all resources in NetBox
+
+            Returns
+            -------
+            int
+                The number of removed rows
+        """
+        table = get_table(endpoint)
+        local_ids = {
+            row_id for row_id, in self.connection.execute(f'SELECT id FROM {table}')}
+        missing = [(row_id,) for row_id in local_ids - ids]
+        with self.connection:
+            self.connection.executemany(f'DELETE FROM {table} WHERE id = ?', missing)
+        return len(missing)
+
+    def get_where(self, endpoint: str, filters: dict) -> tuple:
+        """ Method to convert filters to a WHERE clause. The filters
+            work like the NetBox filters: `FIELD` is an exact match
+            and `FIELD__ic` a case-insensitive substring match.
+
+            Parameters
+            ----------
+            endpoint: str
+                The endpoint
+
+            filters: dict
+                The filters for the rows
+
+            Returns
+            -------
+            tuple
+                The clause, or an empty string if there are no
+                filters, and the list of parameters
+        """
+        if self.get_state(endpoint) is None:
+            raise MirrorError(
+                f'There is no local copy of "{endpoint}"; run `nbcli sync` first')
+
+        conditions = []
+        parameters = []
+        for setting, value in filters.items():
+            field, _, lookup = setting.partition('__')
+            if field not in INDEXED_FIELDS or lookup not in ('', 'ic'):
+                raise MirrorError(f'Filter "{setting}" is not available offline')
+            if lookup == 'ic':
+                escaped = value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+                conditions.append(f"{field} LIKE ? ESCAPE '\\'")
+                parameters.append(f'%{escaped}%')
+            else:
+                conditions.append(f'{field} = ?')
+                parameters.append(value)
+
+        where = f' WHERE {" AND ".join(conditions)}' if conditions else ''
+        return where, parameters
+
+    def count(self, endpoint: str, filters: Optional[dict] = None) -> int:
+        """ Method to get the number of rows of an endpoint
+
+            Parameters
+            ----------
+            endpoint: str
+                The endpoint
+
+            filters: Optional[dict]
+                The filters for the rows, like for `query`
+
+            Returns
+            -------
+            int
+                The number of rows
+        """
+        if filters is None:
+            return self.connection.execute(
+                f'SELECT COUNT(*) FROM {get_table(endpoint)}').fetchone()[0]
+        where, parameters = self.get_where(endpoint, filters)
+        return self.connection.execute(
+            f'SELECT COUNT(*) FROM {get_table(endpoint)}{where}', parameters).fetchone()[0]
+
+    def query(self,
+              endpoint: str,
+              filters: dict,
+              ordering: Optional[str] = None,
+              limit: Optional[int] = None) -> Iterator[dict]:
+        """ Method to get the rows that match filters
+
+            Parameters
+            ----------
+            endpoint: str
+                The endpoint
+
+            filters: dict
+                The filters for the rows; see `get_where`
+
+            ordering: Optional[str]
+                Comma-separated fields to order by, like the NetBox
+                `ordering` parameter; a `-` orders descending. By
+                default the rows are ordered by name.
+
+            limit: Optional[int]
+                The maximum number of rows
+
+            Returns
+            -------
+            Iterator[dict]
+                The rows
+        """
+        where, parameters = self.get_where(endpoint, filters)
+
+        order_by = 'name, id'
+        if ordering:
+            order_fields = []
+            for field in ordering.split(','):
+                column = field.strip().lstrip('-')
+                if column not in ORDERING_FIELDS:
+                    raise MirrorError(f'Ordering by "{column}" is not available offline')
+                order_fields.append(f'{column} DESC' if field.strip().startswith('-') else column)
+            order_by = ', '.join([*order_fields, 'id'])
+
+        limit_clause = ''
+        if limit is not None:
+            limit_clause = ' LIMIT ?'
+            parameters.append(limit)
+        cursor = self.connection.execute(
+            f'SELECT row FROM {get_table(endpoint)}{where} ORDER BY {order_by}{limit_clause}',
+            parameters)
+        return (json.loads(row) for row, in cursor)
+
+
+def get_mirror() -> Mirror:
+    """ Get the mirror for the active instance
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        Mirror
+            The mirror for the active instance
+    """
+    return Mirror(nbcli_object.get_active_instance_name())
@@ -1,12 +1,43 @@
 from genericpath import isfile
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Optional
+from typing import Any, Callable, Iterator, Optional, TYPE_CHECKING
 import logging
 import json
 import os
-import pynetbox
+import tempfile
+import threading
+from .timings import timings
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+if TYPE_CHECKING:
+    from .backends import Backend
+    from .session import TimeoutSession
 
 NBCLI_CONFIG_FILE = f'{Path.home()}/.nbcli.json'
+NBCLI_CONFIG_LOCK_FILE = f'{NBCLI_CONFIG_FILE}.lock'
+NBCLI_DATA_DIR = f'{Path.home()}/.nbcli'
+
+# Defaults for settings that are optional in the instance dict
+INSTANCE_DEFAULTS = {
+    'workers': 4,
+    'tls': False,
+    'pool_size': 10,
+    'connect_timeout': 5,
+    'read_timeout': 60,
+    'retries': 3,
+    'retry_backoff': 0.5,
+    'backend': 'pynetbox',
+    'queue': False
+}
+
+# Settings that are used to create the HTTP session
+SESSION_SETTINGS = (
+    'pool_size', 'connect_timeout', 'read_timeout', 'retries', 'retry_backoff')
 
 
 class NetBoxCLI:
@@ -24,9 +55,77 @@ class NetBoxCLI:
         # Default configuration is nothing
         self.config_dict: Optional[dict] = None
 
+        # The inode, modification time and size of the file the
+        # configuration was parsed from
+        self.config_key: Optional[tuple] = None
+
+        # The HTTP sessions by their settings. A session is shared
+        # by all requests with the same settings.
+        self.sessions: dict = {}
+
+        # The backends by instance name and backend name, with the
+        # instance settings they were created for, and the backend
+        # that is chosen on the command line
+        self.backends: dict = {}
+        self.backend_name: Optional[str] = None
+        self.backend_lock = threading.Lock()
+
+        # The instance that a thread uses instead of the active
+        # instance; see `use_instance`
+        self.local = threading.local()
+
         # Create a logger
         self.logger = logging.getLogger('NetBoxCLI')
 
+    def write_config(self, config: dict, replace: bool = True) -> bool:
+        """ Method to write the configuration. The configuration is
+            written to a temporary file that is renamed to the
+            configuration file, so other processes never read a
+            partly written file.
+
+            Parameters
+            ----------
+            config: dict
+                The configuration to write
+
+            replace: bool
+                If not set, the file is only written if it does not
+                exist yet.
+
+            Returns
+            -------
+            bool
+                True if the file was written
+        """
+        config_dir = os.path.dirname(NBCLI_CONFIG_FILE)
+        temp_fd, temp_path = tempfile.mkstemp(
+            prefix='.nbcli.json.', suffix='.tmp', dir=config_dir)
+        try:
+            self.logger.debug(f'Opening "{temp_path}" for writing')
+            with os.fdopen(temp_fd, 'w') as config_file:
+                config_file.write(json.dumps(config))
+                config_file.flush()
+                os.fsync(config_file.fileno())
+                stat = os.fstat(config_file.fileno())
+
+            if replace:
+                os.replace(temp_path, NBCLI_CONFIG_FILE)
+            else:
+                # Linking fails if the file exists, so a config that
+                # another process just created is not overwritten
+                try:
+                    os.link(temp_path, NBCLI_CONFIG_FILE)
+                except FileExistsError:
+                    self.logger.debug(f'File "{NBCLI_CONFIG_FILE}" already exists')
+                    return False
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        self.config_dict = config
+        self.config_key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        return True
+
     def create_default_config(self, force: bool = False) -> None:
         """ Method to create the default config
 
@@ -58,35 +157,37 @@ class NetBoxCLI:
             }
         }
 
-        self.logger.debug(f'Opening "{NBCLI_CONFIG_FILE}" for writing')
-        with open(NBCLI_CONFIG_FILE, 'w') as config_file:
-            config_file.write(json.dumps(default_config))
-        self.config_dict = default_config
+        self.write_config(default_config, replace=force)
 
     def get_configuration(self) -> Optional[dict]:
         """ Method to retrieve the configuration ad save it
-            into the object.
+            into the object. The file is only parsed again if its
+            inode, modification time or size changed.
 
             Parameters
             ----------
-            force: bool
-                If set, forces the method to create the
-                default config even if there alrady is a
-                config file.
+            None
 
             Returns
             -------
-            None
+            Optional[dict]
+                The configuration
         """
         self.create_default_config()
         self.logger.debug(f'Opening "{NBCLI_CONFIG_FILE}" for reading')
         with open(NBCLI_CONFIG_FILE, 'r') as config_file:
-            config = json.loads(config_file.read())
+            stat = os.fstat(config_file.fileno())
+            config_key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            if self.config_dict is not None and config_key == self.config_key:
+                return self.config_dict
+            with timings.span('config load'):
+                config = json.loads(config_file.read())
 
         self.logger.debug('Loaded config')
 
         # Save it
         self.config_dict = config
+        self.config_key = config_key
         return config
 
     @property
@@ -102,9 +203,34 @@ class NetBoxCLI:
             dict
                 The configuration
         """
-        if not self.config_dict:
-            self.get_configuration()
-        return self.config_dict
+        return self.get_configuration()
+
+    @contextmanager
+    def lock_config(self) -> Iterator[dict]:
+        """ Context manager for commands that change the
+            configuration. It holds an exclusive lock, so changes
+            from other processes are not lost, and returns the
+            latest configuration. Reading the configuration does not
+            need the lock.
+
+            Parameters
+            ----------
+            None
+
+            Returns
+            -------
+            Iterator[dict]
+                The configuration
+        """
+        with open(NBCLI_CONFIG_LOCK_FILE, 'a') as lock_file:
+            if fcntl is not None:
+                self.logger.debug(f'Locking "{NBCLI_CONFIG_LOCK_FILE}"')
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield self.get_configuration()
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
 
     def save(self) -> None:
         """ Save the configuration
@@ -117,9 +243,68 @@ class NetBoxCLI:
             -------
             None
         """
-        self.logger.debug(f'Opening "{NBCLI_CONFIG_FILE}" for writing')
-        with open(NBCLI_CONFIG_FILE, 'w') as config_file:
-            config_file.write(json.dumps(self.config_dict))
+        self.write_config(self.config_dict)
+
+    @contextmanager
+    def use_instance(self, name: str) -> Iterator[None]:
+        """ Context manager that makes the current thread use an
+            instance instead of the active instance. The
+            configuration file is not changed, so other threads and
+            processes still use the active instance.
+
+            Parameters
+            ----------
+            name: str
+                The name of the instance
+
+            Returns
+            -------
+            Iterator[None]
+                Nothing; the instance is used inside the block
+        """
+        previous = getattr(self.local, 'instance_name', None)
+        self.local.instance_name = name
+        try:
+            yield
+        finally:
+            self.local.instance_name = previous
+
+    def bind_instance(self, function: Callable) -> Callable:
+        """ Method to bind a function to the instance the current
+            thread uses, so thread pools started from a thread that
+            uses another instance keep using it
+
+            Parameters
+            ----------
+            function: Callable
+                The function
+
+            Returns
+            -------
+            Callable
+                A function that calls `function` with the instance
+        """
+        instance_name = self.get_active_instance_name()
+
+        def bound(*args, **kwargs) -> Any:
+            with self.use_instance(instance_name):
+                return function(*args, **kwargs)
+        return bound
+
+    def get_active_instance_name(self) -> str:
+        """ Method to get the name of the instance the current
+            thread uses
+
+            Parameters
+            ----------
+            None
+
+            Returns
+            -------
+            str
+                The name of the instance
+        """
+        return getattr(self.local, 'instance_name', None) or self.config['active_instance']
 
     def get_active_instance(self) -> dict:
         """ Method to get the active instance
@@ -132,11 +317,28 @@ class NetBoxCLI:
             -------
             None
         """
-        config = self.config
-        return config['instances'][config['active_instance']]
+        return self.config['instances'][self.get_active_instance_name()]
 
-    def create_pynetbox_object(self) -> None:
-        """ Method to create a PyNetBox object
+    def get_instance_setting(self, setting: str) -> Any:
+        """ Method to get a setting of the active instance. If the
+            instance does not have the setting, the default is
+            returned.
+
+            Parameters
+            ----------
+            setting: str
+                The name of the setting
+
+            Returns
+            -------
+            Any
+                The value of the setting
+        """
+        return self.get_active_instance().get(
+            setting, INSTANCE_DEFAULTS[setting])
+
+    def get_url(self) -> str:
+        """ Method to get the URL of the active instance
 
             Parameters
             ----------
@@ -144,13 +346,124 @@ class NetBoxCLI:
 
             Returns
             -------
+            str
+                The URL, like `http://localhost:8000/`
+        """
+        instance = self.get_active_instance()
+        scheme = 'https' if self.get_instance_setting('tls') else 'http'
+        return f'{scheme}://{instance["server"]}:{instance["port"]}{instance["base_path"]}'
+
+    def get_session_settings(self) -> dict:
+        """ Method to get the connection settings of the active
+            instance
+
+            Parameters
+            ----------
             None
+
+            Returns
+            -------
+            dict
+                The settings in `SESSION_SETTINGS`
+        """
+        settings = {
+            setting: self.get_instance_setting(setting)
+            for setting in SESSION_SETTINGS}
+
+        # Parallel requests need a connection each
+        settings['pool_size'] = max(
+            settings['pool_size'], self.get_instance_setting('workers'))
+        return settings
+
+    def get_session(self) -> 'TimeoutSession':
+        """ Method to get the HTTP session for the active instance.
+            The session is reused, so the connections in its pool
+            are kept alive, until the session settings change.
+
+            Parameters
+            ----------
+            None
+
+            Returns
+            -------
+            TimeoutSession
+                The session
+        """
+        settings = self.get_session_settings()
+        session_key = json.dumps(settings, sort_keys=True)
+        if session_key not in self.sessions:
+            from .session import create_session
+            self.logger.debug(f'Creating HTTP session with settings {settings}')
+            self.sessions[session_key] = create_session(**settings)
+        return self.sessions[session_key]
+
+    def create_pynetbox_object(self) -> Any:
+        """ Method to create a PyNetBox object for the active
+            instance
+
+            Parameters
+            ----------
+            None
+
+            Returns
+            -------
+            Any
+                The PyNetBox object
         """
         instance = self.get_active_instance()
-        nb_url = f'http://{instance["server"]}:{instance["port"]}{instance["base_path"]}'
-        self.nb = pynetbox.api(
+
+        # Imported here; commands that do not talk to NetBox do
+        # not need it
+        import pynetbox
+
+        nb_url = self.get_url()
+        self.logger.debug(f'Creating PyNetBox object for "{nb_url}"')
+        nb = pynetbox.api(
             nb_url,
             token=instance["api_key"])
+        nb.http_session = self.get_session()
+        return nb
+
+    def get_backend(self) -> 'Backend':
+        """ Method to get the backend for the active instance. The
+            backend comes from the command line or from the
+            instance settings. It is reused until the settings of
+            the instance change. This keeps the backend warm in the
+            interactive shell.
+
+            Parameters
+            ----------
+            None
+
+            Returns
+            -------
+            Backend
+                The backend
+        """
+        instance_name = self.get_active_instance_name()
+        instance = self.get_active_instance()
+        name = self.backend_name or self.get_instance_setting('backend')
+        backend_key = json.dumps(instance, sort_keys=True)
+
+        # Threads that query several instances create their
+        # backends at the same time
+        with self.backend_lock:
+            backend = self.backends.get((instance_name, name))
+            if backend is not None and backend[0] == backend_key:
+                return backend[1]
+
+            with timings.span('client creation', backend=name, instance=instance_name):
+                from .backends import BACKENDS, PynetboxBackend
+                self.logger.debug(f'Creating the "{name}" backend for "{instance_name}"')
+                if issubclass(BACKENDS[name], PynetboxBackend):
+                    backend = BACKENDS[name](
+                        self.get_url(), instance['api_key'], self.get_session_settings(),
+                        self.create_pynetbox_object())
+                else:
+                    backend = BACKENDS[name](
+                        self.get_url(), instance['api_key'], self.get_session_settings())
+            self.backends[(instance_name, name)] = (backend_key, backend)
+        return backend
 
 
 nbcli_object = NetBoxCLI()
@@ -1,7 +1,10 @@
 import click
-from .cli import cli
+from .cli import LazyGroup
 
 
-@cli.group(help='Organization management')
+@click.group(cls=LazyGroup, help='Organization management', lazy_subcommands={
+    'regions': ('nbcli.organization_regions.regions', 'Region management'),
+    'sites': ('nbcli.organization_sites.sites', 'Site management')
+})
 def organization():
     pass
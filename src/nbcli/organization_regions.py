@@ -1,12 +1,38 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, Optional
 import click
-from ctypes import alignment
 from .nbcli import nbcli_object
-from .organization import organization
-from .cli import cli, console, tables
-from rich.table import Table
-
-
-@organization.group(help='Region management')
+from .cli import console, options, tables
+from .fetch import DEFAULT_CHUNK_SIZE, DEFAULT_PAGE_SIZE, fetch_records, get_field_filters
+from .cache import cache_options, cached_rows, get_cache
+from .exceptions import BulkInputError, MirrorError
+from .instances import (
+    INSTANCE_COLUMN, get_instance_names, instance_options, print_errors, run_on_instances)
+from .render import print_rows, select_columns, to_value
+from .watch import watch_option
+
+# Columns for the `list` command
+list_columns = [
+    {'key': 'id', 'header': 'ID', 'style': 'item_identification', 'justify': 'right'},
+    {'key': 'name', 'header': 'Name', 'style': 'item_identification'},
+    {'key': 'site_count', 'header': 'Sites'},
+    {'key': 'description', 'header': 'Description'}
+]
+
+# Columns for the `tree` command. Sites, devices and prefixes are
+# counted for the region and all regions below it.
+tree_columns = [
+    {'key': 'id', 'header': 'ID', 'style': 'item_identification', 'justify': 'right'},
+    {'key': 'name', 'header': 'Name', 'style': 'item_identification'},
+    {'key': 'parent', 'header': 'Parent'},
+    {'key': 'depth', 'header': 'Depth', 'justify': 'right'},
+    {'key': 'sites', 'header': 'Sites', 'justify': 'right'},
+    {'key': 'devices', 'header': 'Devices', 'justify': 'right'},
+    {'key': 'prefixes', 'header': 'Prefixes', 'justify': 'right'}
+]
+
+
+@click.group(help='Region management')
 def regions():
     pass
 
@@ -27,77 +53,470 @@ def create(**kwargs) -> None:
         -------
         None
     """
-
-    # Create the object
-    nbcli_object.create_pynetbox_object()
-
-    # Get the resources
-    resource_object = nbcli_object.nb.dcim.regions
+    from .ids import get_id_index
 
     # Add the new resource. We remove all fields that are set
     # to None in a dict-comprehension
-    resource_object.create(
+    created = nbcli_object.get_backend().create(
+        'dcim.regions',
         {setting: value for setting, value in kwargs.items() if value is not None})
 
+    # Remember the ID for updates and deletes
+    index = get_id_index('dcim.regions')
+    index.add(created)
+    index.save()
+
+    # Sites show the name of their region
+    get_cache().invalidate('dcim.regions', 'dcim.sites')
+
+
+def fetch_rows(filters: dict,
+               fields: list,
+               workers: int,
+               page_size: int = DEFAULT_PAGE_SIZE,
+               max_results: Optional[int] = None) -> Iterator[dict]:
+    """ Retrieve the regions from NetBox and convert them to rows
+        for the `list` command. Only the given fields are requested
+        from NetBox, if the server supports it.
+
+        Parameters
+        ----------
+        filters: dict
+            The filters for the regions
+
+        fields: list
+            The fields for the rows
+
+        workers: int
+            The number of pages to retrieve at the same time
+
+        page_size: int
+            The number of resources per request
+
+        max_results: Optional[int]
+            The maximum number of rows
+
+        Returns
+        -------
+        Iterator[dict]
+            The rows
+    """
+    # Get the resources
+    field_filters = get_field_filters('dcim.regions', fields)
+    resources = fetch_records(
+        'dcim.regions', {**filters, **field_filters}, workers=workers,
+        page_size=page_size, max_results=max_results)
+
+    for resource in resources:
+        yield {field: to_value(resource.get(field)) for field in fields}
+
 
 @regions.command(help='List the regions in NetBox')
 @click.option('--name', type=str)
 @click.option('--name__ic', type=str)
 @click.option('--description__ic', type=str)
-def list(**kwargs) -> None:
+@click.option('--stream', is_flag=True,
+              help='Print the rows while the pages are retrieved')
+@click.option('--column-width', type=int,
+              help='Fixed column width for streaming; by default the first page sets the widths')
+@click.option('--workers', type=int,
+              help='Number of pages to retrieve at the same time; overrides the instance setting')
+@click.option('--fields', type=str,
+              help='Comma-separated columns to show; only these are retrieved')
+@click.option('--page-size', type=click.IntRange(min=1), default=DEFAULT_PAGE_SIZE,
+              show_default=True,
+              help='Number of results per request; NetBox caps it to its MAX_PAGE_SIZE')
+@click.option('--max-results', '--limit', 'max_results', type=click.IntRange(min=1),
+              help='Stop after this number of results')
+@click.option('--ordering', type=str,
+              help='Comma-separated fields NetBox sorts by, like `name` or `-id`')
+@click.option('--count', is_flag=True,
+              help='Only print the number of results; NetBox returns a single result')
+@click.option('--offline', is_flag=True,
+              help='Answer from the local copy that `nbcli sync` made')
+@watch_option
+@cache_options('regions list')
+@instance_options
+def list(stream: bool,
+         column_width: Optional[int],
+         workers: Optional[int],
+         fields: Optional[str],
+         page_size: int,
+         max_results: Optional[int],
+         ordering: Optional[str],
+         count: bool,
+         offline: bool,
+         watch: Optional[float],
+         refresh: bool,
+         no_cache: bool,
+         cache_ttl: int,
+         instances: tuple,
+         all_instances: bool,
+         **kwargs) -> None:
     """ Lists the regions in the NetBox database
 
         Parameters
         ----------
-        Parameters and their types
+        stream: bool
+            If set, the rows are printed in chunks while the
+            pages are retrieved from NetBox
+
+        column_width: Optional[int]
+            Fixed width for the columns in streaming mode
+
+        workers: Optional[int]
+            The number of pages to retrieve at the same time
+
+        fields: Optional[str]
+            Comma-separated keys of the columns to show
+
+        page_size: int
+            The number of results per request
+
+        max_results: Optional[int]
+            The maximum number of results
+
+        ordering: Optional[str]
+            The fields to sort by; the sorting is done by NetBox
+
+        count: bool
+            If set, only the number of results is printed
+
+        offline: bool
+            If set, the rows come from the local mirror
+
+        watch: Optional[float]
+            If set, the rows are kept up to date by polling NetBox
+            for changes every this many seconds
+
+        refresh: bool
+            If set, the cache is refreshed
+
+        no_cache: bool
+            If set, the cache is not used
+
+        cache_ttl: int
+            The maximum age of cached results
+
+        instances: tuple
+            The instances to query instead of the active instance
+
+        all_instances: bool
+            If set, all instances are queried
+
+        **kwargs: dict
+            Filters for the regions
 
         Returns
         -------
-        Return values
+        None
     """
-    # Create the object
-    nbcli_object.create_pynetbox_object()
+    from .mirror import get_mirror
+    from .summary import print_count
+    from .watch import watch_rows
+
+    # Only use the filters that are set
+    filters = {
+        setting: value for setting, value in kwargs.items() if value is not None}
+
+    # Only the number of results is requested
+    instance_names = get_instance_names(instances, all_instances)
+    if count:
+        print_count('dcim.regions', filters, offline, instance_names)
+        return
+
+    # The columns to show
+    columns = select_columns(list_columns, fields)
+    keys = [column['key'] for column in columns]
+
+    # Keep polling NetBox for changed regions
+    if watch is not None:
+        if offline or instance_names or options['output'] != 'table':
+            console.print(
+                '[error]--watch only works online, on the active instance and with table output[/]')
+            return
+        instance_workers = workers or nbcli_object.get_instance_setting('workers')
+        watch_keys = [*dict.fromkeys([*keys, 'id', 'last_updated'])]
+        watch_rows(
+            'dcim.regions', {**filters, 'ordering': ordering} if ordering else filters, columns,
+            lambda query: fetch_rows(query, watch_keys, instance_workers, page_size),
+            instance_workers, watch)
+        return
+
+    def get_rows() -> Iterator[dict]:
+        if offline:
+            return (
+                {key: row.get(key) for key in keys}
+                for row in get_mirror().query(
+                    'dcim.regions', filters, ordering=ordering, limit=max_results))
+        instance_workers = workers or nbcli_object.get_instance_setting('workers')
+        query = {**filters, 'ordering': ordering} if ordering else filters
+        return cached_rows(
+            'dcim.regions', {**query, 'columns': keys, 'max_results': max_results},
+            lambda: fetch_rows(query, keys, instance_workers, page_size, max_results),
+            cache_ttl, refresh=refresh, no_cache=no_cache)
+
+    # Query the chosen instances at the same time and merge the
+    # rows, or stream the rows of the active instance
+    if instance_names:
+        results = run_on_instances(instance_names, lambda: [*get_rows()])
+        print_errors(results)
+        columns = [INSTANCE_COLUMN, *columns]
+        rows = (
+            {'instance': instance_name, **row}
+            for instance_name, result, _ in results for row in result or [])
+    else:
+        try:
+            rows = get_rows()
+        except MirrorError as error:
+            console.print(f'[error]{error}[/]')
+            return
 
-    # Create a table for the output
-    table = Table(**tables)
-    table.add_column('ID', style='item_identification', justify='right')
-    table.add_column('Name', style='item_identification')
-    table.add_column('Sites')
-    table.add_column('Description')
+    # Print the rows
+    print_rows(columns, rows, stream=stream, column_width=column_width)
 
-    # Get the resources
-    resource_object = nbcli_object.nb.dcim.regions
 
-    # Filter resources if needed
-    if len(kwargs) == 0:
-        resources = resource_object.all()
-    else:
-        resources = resource_object.filter(**kwargs)
+def get_id(value: Optional[dict]) -> Optional[int]:
+    """ Get the ID of a nested object
 
-    for resource in resources:
-        table.add_row(
-            str(resource.id),
-            str(resource.name),
-            str(resource.site_count),
-            str(resource.description)
-        )
+        Parameters
+        ----------
+        value: Optional[dict]
+            The nested object, like the parent of a region
+
+        Returns
+        -------
+        Optional[int]
+            The ID, or None if the object is not set
+    """
+    return value.get('id') if isinstance(value, dict) else None
+
+
+def count_per_region(workers: int, devices: bool, prefixes: bool) -> dict:
+    """ Count the sites, and optionally the devices and prefixes, of
+        every region. The sites are retrieved once with their region
+        and the device and prefix counts that NetBox adds to every
+        site, and the counts are added up per region.
+
+        Parameters
+        ----------
+        workers: int
+            The number of pages to retrieve at the same time
+
+        devices: bool
+            If set, the devices are counted
+
+        prefixes: bool
+            If set, the prefixes are counted
+
+        Returns
+        -------
+        dict
+            A dict per column key, like `sites`, with the number of
+            objects per region ID
+    """
+    count_fields = {'sites': None}
+    if devices:
+        count_fields['devices'] = 'device_count'
+    if prefixes:
+        count_fields['prefixes'] = 'prefix_count'
+    fields = ['id', 'region', *(field for field in count_fields.values() if field)]
+
+    counts = {key: {} for key in count_fields}
+    for site in fetch_records(
+            'dcim.sites', get_field_filters('dcim.sites', fields), workers=workers):
+        region_id = get_id(site.get('region'))
+        if region_id is None:
+            continue
+        for key, field in count_fields.items():
+            counts[key][region_id] = counts[key].get(region_id, 0) + (
+                1 if field is None else site.get(field) or 0)
+    return counts
+
+
+def build_tree(regions: list, counts: dict, root: Optional[str], depth: Optional[int]) -> list:
+    """ Build the region tree and add up the counts of every region
+        and the regions below it. Every region is visited a fixed
+        number of times, so this takes linear time.
+
+        Parameters
+        ----------
+        regions: list
+            All regions, with their ID, name and parent
+
+        counts: dict
+            A dict per column key with the number of objects per
+            region ID, from `count_per_region`
+
+        root: Optional[str]
+            The name or slug of the region to start at; by default
+            all top-level regions are shown
+
+        depth: Optional[int]
+            The number of levels to show below the top
+
+        Returns
+        -------
+        list
+            The rows, in tree order
+    """
+    # Group the regions by their parent
+    by_id = {region['id']: region for region in regions}
+    children = {}
+    for region in regions:
+        parent_id = get_id(region.get('parent'))
+        if parent_id not in by_id:
+            parent_id = None
+        children.setdefault(parent_id, []).append(region['id'])
+    for region_ids in children.values():
+        region_ids.sort(key=lambda region_id: by_id[region_id]['name'])
+
+    # Order the regions depth-first with their depth
+    order = []
+    stack = [(region_id, 0) for region_id in reversed(children.get(None, []))]
+    while stack:
+        region_id, level = stack.pop()
+        order.append((region_id, level))
+        stack.extend((child_id, level + 1) for child_id in reversed(children.get(region_id, [])))
+
+    # Add the counts of every region to its parent. Children come
+    # after their parent in the order, so walking it backwards
+    # finishes every region before its parent.
+    totals = {key: dict(region_counts) for key, region_counts in counts.items()}
+    for region_id, level in reversed(order):
+        if level == 0:
+            continue
+        parent_id = get_id(by_id[region_id].get('parent'))
+        for region_totals in totals.values():
+            region_totals[parent_id] = (
+                region_totals.get(parent_id, 0) + region_totals.get(region_id, 0))
+
+    # Cut the tree at the root and the depth
+    if root is not None:
+        start = next((
+            index for index, (region_id, _) in enumerate(order)
+            if root in (by_id[region_id]['name'], by_id[region_id].get('slug'))), None)
+        if start is None:
+            return []
+        root_level = order[start][1]
+        end = next((
+            index for index, (_, level) in enumerate(order[start + 1:], start + 1)
+            if level <= root_level), len(order))
+        order = [(region_id, level - root_level) for region_id, level in order[start:end]]
+
+    return [{
+        'id': region_id,
+        'name': by_id[region_id]['name'],
+        'parent': to_value(by_id[region_id].get('parent')),
+        'depth': level,
+        **{key: region_totals.get(region_id, 0) for key, region_totals in totals.items()}
+    } for region_id, level in order if depth is None or level <= depth]
+
+
+@regions.command(help='Show the regions as a tree with the number of sites below every region')
+@click.option('--root', type=str,
+              help='Name or slug of the region to start at')
+@click.option('--depth', type=click.IntRange(min=0),
+              help='Number of levels to show below the top')
+@click.option('--devices', is_flag=True,
+              help='Also count the devices, from the device counts of the sites')
+@click.option('--prefixes', is_flag=True,
+              help='Also count the prefixes, from the prefix counts of the sites')
+@click.option('--workers', type=int,
+              help='Number of pages to retrieve at the same time; overrides the instance setting')
+def tree(root: Optional[str],
+         depth: Optional[int],
+         devices: bool,
+         prefixes: bool,
+         workers: Optional[int]) -> None:
+    """ Show the regions as a tree. The regions are retrieved in one
+        pass with only their parent, and the sites in one pass with
+        their device and prefix counts, so the number of requests
+        does not grow with the number of regions.
+
+        Parameters
+        ----------
+        root: Optional[str]
+            The name or slug of the region to start at
 
-    # Print the table
-    console.print(table)
+        depth: Optional[int]
+            The number of levels to show below the top
 
+        devices: bool
+            If set, the devices are counted
 
-@regions.command(help='Update a region')
-@click.argument('name', type=str)
+        prefixes: bool
+            If set, the prefixes are counted
+
+        workers: Optional[int]
+            The number of pages to retrieve at the same time
+
+        Returns
+        -------
+        None
+    """
+    if workers is None:
+        workers = nbcli_object.get_instance_setting('workers')
+
+    # Retrieve the regions and the counts at the same time. The API
+    # version is looked up before the threads use it.
+    field_filters = get_field_filters('dcim.regions', ['id', 'name', 'slug', 'parent'])
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        regions_future = executor.submit(nbcli_object.bind_instance(lambda: [*fetch_records(
+            'dcim.regions', field_filters, workers=workers)]))
+        counts = count_per_region(workers, devices, prefixes)
+        rows = build_tree(regions_future.result(), counts, root, depth)
+
+    if root is not None and not rows:
+        console.print(
+            f'[error]No region with name or slug "[error_highlight]{root}[/]" found[/]')
+        return
+
+    # Tables show the tree by indenting the names; the other formats
+    # have the parent and depth
+    columns = [
+        column for column in tree_columns
+        if column['key'] in ('id', 'name', 'sites') or column['key'] in counts
+        or (options['output'] != 'table' and column['key'] in ('parent', 'depth'))]
+    if options['output'] == 'table':
+        rows = [{**row, 'name': '  ' * row['depth'] + row['name']} for row in rows]
+
+    # Print the rows
+    print_rows(columns, rows)
+
+
+@regions.command(help='Update a region, or all regions that match --where')
+@click.argument('name', type=str, required=False)
 @click.option('--slug', type=str)
 @click.option('--description', type=str)
-def update(name: str, **kwargs) -> None:
-    """ Method to update a region
+@click.option('--where', multiple=True,
+              help='Filter as FIELD=VALUE; updates all regions that match')
+@click.option('--set', 'assignments', multiple=True,
+              help='Extra value to set as FIELD=VALUE')
+@click.option('--dry-run', is_flag=True,
+              help='Show the regions that match --where without updating them')
+def update(name: Optional[str],
+           where: tuple,
+           assignments: tuple,
+           dry_run: bool,
+           **kwargs) -> None:
+    """ Method to update a region, or all regions that match the
+        filters in `where` with bulk requests
 
         Parameters
         ----------
-        name: str
+        name: Optional[str]
             The name of the region to update
 
+        where: tuple
+            Filters as `FIELD=VALUE`
+
+        assignments: tuple
+            Extra values to set as `FIELD=VALUE`
+
+        dry_run: bool
+            If set, the matching regions are only shown
+
         **kwargs: dict
             Values to update
 
@@ -105,42 +524,149 @@ def update(name: str, **kwargs) -> None:
         -------
         None
     """
+    from .bulk import UNIQUE_FIELDS, parse_assignments, run_filtered
+    from .ids import write_by_name
+
+    if (name is None) == (len(where) == 0):
+        console.print('[error]Give either a name or --where[/]')
+        return
+
+    try:
+        kwargs.update(parse_assignments(assignments))
+    except BulkInputError as error:
+        console.print(f'[error]{error}[/]')
+        return
+
+    if where:
+        changes = {
+            setting: value for setting, value in kwargs.items() if value is not None}
+        unique = [field for field in UNIQUE_FIELDS if field in changes]
+        if unique:
+            console.print(
+                f'[error]{", ".join(unique)} cannot be set with --where; all matching '
+                f'regions would get the same value[/]')
+            return
+        if run_filtered('dcim.regions', 'update', where, changes, dry_run=dry_run,
+                        workers=nbcli_object.get_instance_setting('workers')):
+            get_cache().invalidate('dcim.regions', 'dcim.sites')
+        return
+
+    # Update the resource by its ID
+    changes = {
+        setting: value for setting, value in kwargs.items() if value is not None}
+    if changes and write_by_name('dcim.regions', name, changes) is None:
+        console.print(
+            f'[error]No region with name "[error_highlight]{name}[/]" found[/]')
+        return
+
+    # Sites show the name of their region
+    get_cache().invalidate('dcim.regions', 'dcim.sites')
+
+
+@regions.command(help='Delete a region, or all regions that match --where')
+@click.argument('name', type=str, required=False)
+@click.option('--where', multiple=True,
+              help='Filter as FIELD=VALUE; deletes all regions that match')
+@click.option('--dry-run', is_flag=True,
+              help='Show the regions that match --where without deleting them')
+@click.option('--yes', is_flag=True,
+              help='Do not ask for confirmation when deleting with --where')
+def delete(name: Optional[str], where: tuple, dry_run: bool, yes: bool) -> None:
+    """ Method to delete a region, or all regions that match the
+        filters in `where` with bulk requests
 
-    # Create the object
-    nbcli_object.create_pynetbox_object()
-
-    # Get the resources
-    resource_object = nbcli_object.nb.dcim.regions.get(name=name)
+        Parameters
+        ----------
+        name: Optional[str]
+            The name of the region to delete
 
-    # Update the resource
-    for setting, value in kwargs.items():
-        if value is not None:
-            setattr(resource_object, setting, value)
+        where: tuple
+            Filters as `FIELD=VALUE`
 
-    # Update the resource
-    resource_object.save()
+        dry_run: bool
+            If set, the matching regions are only shown
 
+        yes: bool
+            If set, no confirmation is asked
 
-@regions.command(help='Delete a region')
-@click.argument('name', type=str)
-def delete(name: str) -> None:
-    """ Method to delete a region
+        Returns
+        -------
+        None
+    """
+    from .bulk import run_filtered
+    from .ids import write_by_name
+
+    if (name is None) == (len(where) == 0):
+        console.print('[error]Give either a name or --where[/]')
+        return
+
+    if where:
+        if run_filtered('dcim.regions', 'delete', where, {}, dry_run=dry_run, confirm=not yes,
+                        workers=nbcli_object.get_instance_setting('workers')):
+            get_cache().invalidate('dcim.regions', 'dcim.sites')
+        return
+
+    # Delete the resource by its ID
+    if write_by_name('dcim.regions', name) is None:
+        console.print(
+            f'[error]No region with name "[error_highlight]{name}[/]" found[/]')
+        return
+
+    # Sites show the name of their region
+    get_cache().invalidate('dcim.regions', 'dcim.sites')
+
+
+@regions.command(name='import', help='Create, update or delete regions from a CSV, JSON or YAML file')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--action', type=click.Choice(['create', 'update', 'delete']),
+              default='create', show_default=True)
+@click.option('--format', 'file_format', type=click.Choice(['csv', 'json', 'yaml']),
+              help='Format of the file; by default the file extension is used')
+@click.option('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, show_default=True,
+              help='Number of regions in one request')
+@click.option('--workers', type=int,
+              help='Number of requests at the same time; overrides the instance setting')
+def import_file(path: str,
+                action: str,
+                file_format: Optional[str],
+                chunk_size: int,
+                workers: Optional[int]) -> None:
+    """ Method to create, update or delete regions in bulk. For
+        updates and deletes, the regions are identified by their
+        `id` or `name`.
 
         Parameters
         ----------
-        name: str
-            The name of the region to delete
+        path: str
+            The file with the regions
+
+        action: str
+            The action to do for the regions
+
+        file_format: Optional[str]
+            The format of the file
+
+        chunk_size: int
+            The number of regions in one request
+
+        workers: Optional[int]
+            The number of requests at the same time
 
         Returns
         -------
         None
     """
+    from .bulk import read_rows, run_bulk, print_report
 
-    # Create the object
-    nbcli_object.create_pynetbox_object()
+    try:
+        rows = read_rows(path, file_format)
+    except BulkInputError as error:
+        console.print(f'[error]{error}[/]')
+        return
 
-    # Get the resources
-    resource_object = nbcli_object.nb.dcim.regions.get(name=name)
+    if workers is None:
+        workers = nbcli_object.get_instance_setting('workers')
 
-    # Delete the resource
-    resource_object.delete()
+    results = run_bulk('dcim.regions', action, rows, chunk_size, workers)
+    get_cache().invalidate('dcim.regions', 'dcim.sites')
+    print_report(action, rows, results)
@@ -1,12 +1,75 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, Optional
 import click
-from ctypes import alignment
 from .nbcli import nbcli_object
-from .organization import organization
-from .cli import cli, console, tables
+from .cli import console, options, tables
+from .fetch import (
+    DEFAULT_CHUNK_SIZE, DEFAULT_PAGE_SIZE, fetch_records, fetch_resource, get_field_filters, get_path)
+from .cache import cache_options, cached_rows, get_cache
+from .exceptions import BulkInputError, MirrorError
+from .instances import (
+    INSTANCE_COLUMN, get_instance_names, instance_options, print_errors, run_on_instances)
+from .render import print_rows, print_table, select_columns, to_row, to_value
+from .watch import watch_option
+from .journal import queue_option, use_queue
+from .timings import timings
 from rich.table import Table
 
-
-@organization.group(help='Site management')
+# Columns for the `list` command
+list_columns = [
+    {'key': 'id', 'header': 'ID', 'style': 'item_identification', 'justify': 'right'},
+    {'key': 'name', 'header': 'Name', 'style': 'item_identification'},
+    {'key': 'status', 'header': 'Status'},
+    {'key': 'region', 'header': 'Region'},
+    {'key': 'group', 'header': 'Group'},
+    {'key': 'description', 'header': 'Description'}
+]
+
+# Fields for the `inspect` command. Fields of related objects are
+# retrieved in the same query by the GraphQL backend.
+inspect_fields = [
+    'id', 'name', 'region', 'region.parent', 'status', 'tenant', 'tenant.group', 'facility',
+    'description', 'time_zone', 'physical_address', 'shipping_address', 'rack_count',
+    'device_count', 'virtualmachine_count', 'prefix_count', 'vlan_count', 'asns',
+    'circuit_count'
+]
+
+# Related objects for `inspect --deep`, with a title, the endpoint
+# and the columns
+related_objects = [
+    ('Racks', 'dcim.racks', [
+        {'key': 'id', 'header': 'ID', 'style': 'item_identification', 'justify': 'right'},
+        {'key': 'name', 'header': 'Name', 'style': 'item_identification'},
+        {'key': 'status', 'header': 'Status'}
+    ]),
+    ('Devices', 'dcim.devices', [
+        {'key': 'id', 'header': 'ID', 'style': 'item_identification', 'justify': 'right'},
+        {'key': 'name', 'header': 'Name', 'style': 'item_identification'},
+        {'key': 'device_type', 'header': 'Type'},
+        {'key': 'status', 'header': 'Status'}
+    ]),
+    ('Prefixes', 'ipam.prefixes', [
+        {'key': 'id', 'header': 'ID', 'style': 'item_identification', 'justify': 'right'},
+        {'key': 'prefix', 'header': 'Prefix', 'style': 'item_identification'},
+        {'key': 'status', 'header': 'Status'},
+        {'key': 'vlan', 'header': 'VLAN'}
+    ]),
+    ('VLANs', 'ipam.vlans', [
+        {'key': 'id', 'header': 'ID', 'style': 'item_identification', 'justify': 'right'},
+        {'key': 'vid', 'header': 'VID', 'justify': 'right'},
+        {'key': 'name', 'header': 'Name', 'style': 'item_identification'},
+        {'key': 'status', 'header': 'Status'}
+    ]),
+    ('Circuits', 'circuits.circuits', [
+        {'key': 'id', 'header': 'ID', 'style': 'item_identification', 'justify': 'right'},
+        {'key': 'cid', 'header': 'Circuit ID', 'style': 'item_identification'},
+        {'key': 'provider', 'header': 'Provider'},
+        {'key': 'status', 'header': 'Status'}
+    ])
+]
+
+
+@click.group(help='Site management')
 def sites():
     pass
 
@@ -22,11 +85,15 @@ def sites():
 @click.option('--physical-address', type=str)
 @click.option('--shipping-address', type=str)
 @click.option('--comments', type=str)
-def create(**kwargs) -> None:
+@queue_option
+def create(queue: Optional[bool], **kwargs) -> None:
     """ Method to create a new site
 
         Parameters
         ----------
+        queue: Optional[bool]
+            If set, the site is created by the next `flush`
+
         **kwargs: dict
             Values to update
 
@@ -34,104 +101,364 @@ def create(**kwargs) -> None:
         -------
         None
     """
+    from .ids import get_id_index
+    from .journal import queue_change
+
+    # We remove all fields that are set to None in a
+    # dict-comprehension
+    values = {setting: value for setting, value in kwargs.items() if value is not None}
+    if use_queue(queue):
+        queue_change('dcim.sites', 'create', values['name'], values)
+        return
+
+    # Add the new resource
+    created = nbcli_object.get_backend().create('dcim.sites', values)
+
+    # Remember the ID for updates and deletes
+    index = get_id_index('dcim.sites')
+    index.add(created)
+    index.save()
+
+    # Region site counts change as well
+    get_cache().invalidate('dcim.sites', 'dcim.regions')
+
+
+def fetch_rows(filters: dict,
+               fields: list,
+               workers: int,
+               page_size: int = DEFAULT_PAGE_SIZE,
+               max_results: Optional[int] = None) -> Iterator[dict]:
+    """ Retrieve the sites from NetBox and convert them to rows
+        for the `list` command. Only the given fields are requested
+        from NetBox, if the server supports it.
 
-    # Create the object
-    nbcli_object.create_pynetbox_object()
+        Parameters
+        ----------
+        filters: dict
+            The filters for the sites
+
+        fields: list
+            The fields for the rows
+
+        workers: int
+            The number of pages to retrieve at the same time
 
+        page_size: int
+            The number of resources per request
+
+        max_results: Optional[int]
+            The maximum number of rows
+
+        Returns
+        -------
+        Iterator[dict]
+            The rows
+    """
     # Get the resources
-    resource_object = nbcli_object.nb.dcim.sites
+    field_filters = get_field_filters('dcim.sites', fields)
+    resources = fetch_records(
+        'dcim.sites', {**filters, **field_filters}, workers=workers,
+        page_size=page_size, max_results=max_results)
 
-    # Add the new resource. We remove all fields that are set
-    # to None in a dict-comprehension
-    resource_object.create(
-        {setting: value for setting, value in kwargs.items() if value is not None})
+    for resource in resources:
+        yield {field: to_value(resource.get(field)) for field in fields}
 
 
 @sites.command(help='List the sites in NetBox')
 @click.option('--name', type=str)
 @click.option('--name__ic', type=str)
 @click.option('--description__ic', type=str)
-def list(**kwargs) -> None:
+@click.option('--status', type=click.Choice(
+    ['planned', 'staging', 'active', 'decommissioning', 'retired']
+))
+@click.option('--region', type=str,
+              help='Slug of a region; includes the sites in its child regions')
+@click.option('--stream', is_flag=True,
+              help='Print the rows while the pages are retrieved')
+@click.option('--column-width', type=int,
+              help='Fixed column width for streaming; by default the first page sets the widths')
+@click.option('--workers', type=int,
+              help='Number of pages to retrieve at the same time; overrides the instance setting')
+@click.option('--fields', type=str,
+              help='Comma-separated columns to show; only these are retrieved')
+@click.option('--page-size', type=click.IntRange(min=1), default=DEFAULT_PAGE_SIZE,
+              show_default=True,
+              help='Number of results per request; NetBox caps it to its MAX_PAGE_SIZE')
+@click.option('--max-results', '--limit', 'max_results', type=click.IntRange(min=1),
+              help='Stop after this number of results')
+@click.option('--ordering', type=str,
+              help='Comma-separated fields NetBox sorts by, like `name` or `-id`')
+@click.option('--count', is_flag=True,
+              help='Only print the number of results; NetBox returns a single result')
+@click.option('--offline', is_flag=True,
+              help='Answer from the local copy that `nbcli sync` made')
+@watch_option
+@cache_options('sites list')
+@instance_options
+def list(stream: bool,
+         column_width: Optional[int],
+         workers: Optional[int],
+         fields: Optional[str],
+         page_size: int,
+         max_results: Optional[int],
+         ordering: Optional[str],
+         count: bool,
+         offline: bool,
+         watch: Optional[float],
+         refresh: bool,
+         no_cache: bool,
+         cache_ttl: int,
+         instances: tuple,
+         all_instances: bool,
+         **kwargs) -> None:
     """ Lists the sites in the NetBox database
 
         Parameters
         ----------
-        Parameters and their types
+        stream: bool
+            If set, the rows are printed in chunks while the
+            pages are retrieved from NetBox
+
+        column_width: Optional[int]
+            Fixed width for the columns in streaming mode
+
+        workers: Optional[int]
+            The number of pages to retrieve at the same time
+
+        fields: Optional[str]
+            Comma-separated keys of the columns to show
+
+        page_size: int
+            The number of results per request
+
+        max_results: Optional[int]
+            The maximum number of results
+
+        ordering: Optional[str]
+            The fields to sort by; the sorting is done by NetBox
+
+        count: bool
+            If set, only the number of results is printed
+
+        offline: bool
+            If set, the rows come from the local mirror
+
+        watch: Optional[float]
+            If set, the rows are kept up to date by polling NetBox
+            for changes every this many seconds
+
+        refresh: bool
+            If set, the cache is refreshed
+
+        no_cache: bool
+            If set, the cache is not used
+
+        cache_ttl: int
+            The maximum age of cached results
+
+        instances: tuple
+            The instances to query instead of the active instance
+
+        all_instances: bool
+            If set, all instances are queried
+
+        **kwargs: dict
+            Filters for the sites
 
         Returns
         -------
-        Return values
+        None
     """
-    # Create the object
-    nbcli_object.create_pynetbox_object()
-
-    # Create a table for the output
-    table = Table(**tables)
-    table.add_column('ID', style='item_identification', justify='right')
-    table.add_column('Name', style='item_identification')
-    table.add_column('Status')
-    table.add_column('Region')
-    table.add_column('Group')
-    table.add_column('Description')
+    from .mirror import get_mirror
+    from .summary import print_count
+    from .watch import watch_rows
+
+    # Only use the filters that are set
+    filters = {
+        setting: value for setting, value in kwargs.items() if value is not None}
+
+    # Only the number of results is requested
+    instance_names = get_instance_names(instances, all_instances)
+    if count:
+        print_count('dcim.sites', filters, offline, instance_names)
+        return
+
+    # The columns to show
+    columns = select_columns(list_columns, fields)
+    keys = [column['key'] for column in columns]
+
+    # Keep polling NetBox for changed sites
+    if watch is not None:
+        if offline or instance_names or options['output'] != 'table':
+            console.print(
+                '[error]--watch only works online, on the active instance and with table output[/]')
+            return
+        instance_workers = workers or nbcli_object.get_instance_setting('workers')
+        watch_keys = [*dict.fromkeys([*keys, 'id', 'last_updated'])]
+        watch_rows(
+            'dcim.sites', {**filters, 'ordering': ordering} if ordering else filters, columns,
+            lambda query: fetch_rows(query, watch_keys, instance_workers, page_size),
+            instance_workers, watch)
+        return
+
+    def get_rows() -> Iterator[dict]:
+        if offline:
+            return (
+                {key: row.get(key) for key in keys}
+                for row in get_mirror().query(
+                    'dcim.sites', filters, ordering=ordering, limit=max_results))
+        instance_workers = workers or nbcli_object.get_instance_setting('workers')
+        query = {**filters, 'ordering': ordering} if ordering else filters
+        return cached_rows(
+            'dcim.sites', {**query, 'columns': keys, 'max_results': max_results},
+            lambda: fetch_rows(query, keys, instance_workers, page_size, max_results),
+            cache_ttl, refresh=refresh, no_cache=no_cache)
+
+    # Query the chosen instances at the same time and merge the
+    # rows, or stream the rows of the active instance
+    if instance_names:
+        results = run_on_instances(instance_names, lambda: [*get_rows()])
+        print_errors(results)
+        columns = [INSTANCE_COLUMN, *columns]
+        rows = (
+            {'instance': instance_name, **row}
+            for instance_name, result, _ in results for row in result or [])
+    else:
+        try:
+            rows = get_rows()
+        except MirrorError as error:
+            console.print(f'[error]{error}[/]')
+            return
 
-    # Get the resources
-    resource_object = nbcli_object.nb.dcim.sites
+    # Print the rows
+    print_rows(columns, rows, stream=stream, column_width=column_width)
 
-    # Filter resources if needed
-    if len(kwargs) == 0:
-        resources = resource_object.all()
-    else:
-        resources = resource_object.filter(**kwargs)
 
-    for resource in resources:
-        table.add_row(
-            str(resource.id),
-            str(resource.name),
-            str(resource.status),
-            str(resource.region),
-            str(resource.group),
-            str(resource.description)
-        )
+def get_details(row: dict) -> dict:
+    """ Convert a site to the row for the `inspect` command
 
-    # Print the table
-    console.print(table)
+        Parameters
+        ----------
+        row: dict
+            All fields of the site, as returned by `to_row`
 
+        Returns
+        -------
+        dict
+            The row for the `inspect` command
+    """
+    return {
+        'id': row['id'],
+        'name': row['name'],
+        'region': row['region'],
+        'region_parent': row.get('region.parent'),
+        'status': row['status'],
+        'tenant': row['tenant'],
+        'tenant_group': row.get('tenant.group'),
+        'facility': row['facility'],
+        'description': row['description'],
+        'time_zone': row['time_zone'],
+        'physical_address': row['physical_address'],
+        'shipping_address': row['shipping_address'],
+        'rack_count': row['rack_count'],
+        'device_count': row['device_count'],
+        'virtualmachine_count': row['virtualmachine_count'],
+        'prefix_count': row['prefix_count'],
+        'vlan_count': row['vlan_count'],
+        'asn_count': len(row['asns']),
+        'circuit_count': row['circuit_count']
+    }
+
+
+def fetch_details(name: str) -> Iterator[dict]:
+    """ Retrieve a site from NetBox and convert it to a row for
+        the `inspect` command
 
-@sites.command(help='Inspect a specific site')
-@click.argument('name', type=str)
-def inspect(name: str) -> None:
-    """ Inspect a specific site
+        Parameters
+        ----------
+        name: str
+            The name of the site
+
+        Returns
+        -------
+        Iterator[dict]
+            The row for the site, if it exists
+    """
+    # Get the resource
+    resource = fetch_resource('dcim.sites', {'name': name}, inspect_fields)
+    if resource is None:
+        return
+
+    # Add the fields of related objects
+    row = to_row(resource)
+    for path in inspect_fields:
+        if '.' in path:
+            row[path] = to_value(get_path(resource, path))
+    yield get_details(row)
+
+
+def fetch_related(site_id: int, endpoint_name: str, columns: list) -> list:
+    """ Retrieve the objects of one type that belong to a site
 
         Parameters
         ----------
-        name : str
-            The name for the site to inspect
+        site_id: int
+            The ID of the site
+
+        endpoint_name: str
+            The name of the endpoint, like `dcim.racks`
+
+        columns: list
+            The columns for the rows
 
         Returns
         -------
-        None
+        list
+            The rows
     """
-    # Create the object
-    nbcli_object.create_pynetbox_object()
+    fields = [column['key'] for column in columns]
+    filters = {'site_id': site_id, **get_field_filters(endpoint_name, fields)}
+    return [
+        {field: to_value(resource.get(field)) for field in fields}
+        for resource in fetch_records(endpoint_name, filters)]
 
-    # Get the resource
-    resource_object = nbcli_object.nb.dcim.sites.get(name=name)
 
+def print_details(details: dict, instance_name: Optional[str] = None) -> None:
+    """ Print the details of a site
+
+        Parameters
+        ----------
+        details: dict
+            The row for the site
+
+        instance_name: Optional[str]
+            The instance of the site; shown if given
+
+        Returns
+        -------
+        None
+    """
     # Create a table for the site details
     table = Table(show_header=False, **tables)
     table.add_column('Setting', style='item_identification')
     table.add_column('Value')
 
     # Add the roes
-    table.add_row('Name', resource_object.name)
-    table.add_row('Region', str(resource_object.region))
-    table.add_row('Status', str(resource_object.status))
-    table.add_row('Tenant', resource_object.tenant)
-    table.add_row('Facility', resource_object.facility)
-    table.add_row('Description', resource_object.description)
-    table.add_row('Time zone', resource_object.time_zone)
-    table.add_row('Physical address', resource_object.physical_address)
-    table.add_row('Shipping address', resource_object.shipping_address)
+    if instance_name:
+        table.add_row('Instance', instance_name)
+    table.add_row('Name', details['name'])
+    table.add_row('Region', str(details['region']))
+    if details.get('region_parent'):
+        table.add_row('Parent region', details['region_parent'])
+    table.add_row('Status', str(details['status']))
+    table.add_row('Tenant', details['tenant'])
+    if details.get('tenant_group'):
+        table.add_row('Tenant group', details['tenant_group'])
+    table.add_row('Facility', details['facility'])
+    table.add_row('Description', details['description'])
+    table.add_row('Time zone', details['time_zone'])
+    table.add_row('Physical address', details['physical_address'])
+    table.add_row('Shipping address', details['shipping_address'])
 
     # Print the table
     console.print(table)
@@ -142,21 +469,189 @@ def inspect(name: str) -> None:
     table.add_column('Value')
 
     # Add the roes
-    table.add_row('Racks', str(resource_object.rack_count))
-    table.add_row('Devices', str(resource_object.device_count))
-    table.add_row('Virtual Machines', str(
-        resource_object.virtualmachine_count))
-    table.add_row('Prefixes', str(resource_object.prefix_count))
-    table.add_row('VLANs', str(resource_object.vlan_count))
-    table.add_row('ASNs', str(len(resource_object.asns)))
-    table.add_row('Circuits', str(resource_object.circuit_count))
+    table.add_row('Racks', str(details['rack_count']))
+    table.add_row('Devices', str(details['device_count']))
+    table.add_row('Virtual Machines', str(details['virtualmachine_count']))
+    table.add_row('Prefixes', str(details['prefix_count']))
+    table.add_row('VLANs', str(details['vlan_count']))
+    table.add_row('ASNs', str(details['asn_count']))
+    table.add_row('Circuits', str(details['circuit_count']))
 
     # Print the table
     console.print(table)
 
 
-@sites.command(help='Update a site')
-@click.argument('name', type=str)
+def retrieve_sites(names: list,
+                   deep: bool,
+                   offline: bool,
+                   refresh: bool,
+                   no_cache: bool,
+                   cache_ttl: int) -> tuple:
+    """ Retrieve the sites for the `inspect` command from the active
+        instance. The sites, and with `deep` the objects that belong
+        to them, are retrieved at the same time.
+
+        Parameters
+        ----------
+        names: list
+            The names of the sites
+
+        deep: bool
+            If set, the related objects are retrieved
+
+        offline: bool
+            If set, the sites come from the local mirror
+
+        refresh: bool
+            If set, the cache is refreshed
+
+        no_cache: bool
+            If set, the cache is not used
+
+        cache_ttl: int
+            The maximum age of cached results
+
+        Returns
+        -------
+        tuple
+            The rows for the sites, with None for sites that are not
+            found, and the related rows by site ID and title
+    """
+    from .mirror import get_mirror
+
+    if offline:
+        mirror = get_mirror()
+        sites = [
+            next(map(get_details, mirror.query('dcim.sites', {'name': name})), None)
+            for name in names]
+        return sites, {}
+
+    # Create the backend before the threads use it
+    nbcli_object.get_backend()
+    max_workers = nbcli_object.get_instance_setting('pool_size')
+
+    def get_site(name: str) -> Optional[dict]:
+        rows = [*cached_rows(
+            'dcim.sites', {'name': name, 'view': 'details'}, lambda: fetch_details(name),
+            cache_ttl, refresh=refresh, no_cache=no_cache)]
+        return rows[0] if rows else None
+
+    # The threads use the instance of this thread
+    with ThreadPoolExecutor(max_workers=min(len(names), max_workers)) as executor:
+        sites = [*executor.map(nbcli_object.bind_instance(get_site), names)]
+
+    # Retrieve the related objects of all sites at the same time
+    related = {}
+    if deep:
+        queries = [
+            (details['id'], title, endpoint_name, columns)
+            for details in sites if details and details.get('id')
+            for title, endpoint_name, columns in related_objects]
+        with ThreadPoolExecutor(max_workers=max(min(len(queries), max_workers), 1)) as executor:
+            futures = {
+                (site_id, title): executor.submit(
+                    nbcli_object.bind_instance(fetch_related), site_id, endpoint_name, columns)
+                for site_id, title, endpoint_name, columns in queries}
+        related = {key: future.result() for key, future in futures.items()}
+    return sites, related
+
+
+@sites.command(help='Inspect one or more sites')
+@click.argument('names', type=str, nargs=-1, required=True)
+@click.option('--deep', is_flag=True,
+              help='Also show the racks, devices, prefixes, VLANs and circuits of the sites')
+@click.option('--offline', is_flag=True,
+              help='Answer from the local copy that `nbcli sync` made')
+@cache_options('sites inspect')
+@instance_options
+def inspect(names: tuple,
+            deep: bool,
+            offline: bool,
+            refresh: bool,
+            no_cache: bool,
+            cache_ttl: int,
+            instances: tuple,
+            all_instances: bool) -> None:
+    """ Inspect one or more sites. The sites, and with `deep` the
+        objects that belong to them, are retrieved at the same time.
+
+        Parameters
+        ----------
+        names : tuple
+            The names of the sites to inspect
+
+        deep: bool
+            If set, the related objects are retrieved and shown
+
+        offline: bool
+            If set, the sites come from the local mirror
+
+        refresh: bool
+            If set, the cache is refreshed
+
+        no_cache: bool
+            If set, the cache is not used
+
+        cache_ttl: int
+            The maximum age of cached results
+
+        instances: tuple
+            The instances to query instead of the active instance
+
+        all_instances: bool
+            If set, all instances are queried
+
+        Returns
+        -------
+        None
+    """
+    names = [*dict.fromkeys(names)]
+
+    if offline and deep:
+        console.print('[error]--deep is not available offline[/]')
+        return
+
+    def retrieve() -> tuple:
+        return retrieve_sites(names, deep, offline, refresh, no_cache, cache_ttl)
+
+    # Query the chosen instances at the same time, or the active
+    # instance
+    instance_names = get_instance_names(instances, all_instances)
+    if instance_names:
+        results = run_on_instances(instance_names, retrieve)
+        print_errors(results)
+        results = [
+            (instance_name, result) for instance_name, result, error in results
+            if error is None]
+    else:
+        try:
+            results = [(None, retrieve())]
+        except MirrorError as error:
+            console.print(f'[error]{error}[/]')
+            return
+
+    with timings.span('output'):
+        for instance_name, (sites, related) in results:
+            for name, details in zip(names, sites):
+                if details is None:
+                    location = f' on "[error_highlight]{instance_name}[/]"' if instance_name else ''
+                    console.print(
+                        f'[error]No site with name "[error_highlight]{name}[/]" found{location}[/]')
+                    continue
+
+                print_details(details, instance_name)
+                if deep:
+                    for title, _, columns in related_objects:
+                        rows = related.get((details.get('id'), title), [])
+                        console.print(
+                            f'[item_selected]{title}[/] of [item_identification]{details["name"]}[/]'
+                            f' ({len(rows)})')
+                        if rows:
+                            print_table(columns, rows)
+
+
+@sites.command(help='Update a site, or all sites that match --where')
+@click.argument('name', type=str, required=False)
 @click.option('--slug', type=str)
 @click.option('--status', type=click.Choice(
     ['planned', 'staging', 'active', 'decommissioning', 'retired']
@@ -166,14 +661,39 @@ def inspect(name: str) -> None:
 @click.option('--physical-address', type=str)
 @click.option('--shipping-address', type=str)
 @click.option('--comments', type=str)
-def update(name: str, **kwargs) -> None:
-    """ Method to update a site
+@click.option('--where', multiple=True,
+              help='Filter as FIELD=VALUE; updates all sites that match')
+@click.option('--set', 'assignments', multiple=True,
+              help='Extra value to set as FIELD=VALUE')
+@click.option('--dry-run', is_flag=True,
+              help='Show the sites that match --where without updating them')
+@queue_option
+def update(name: Optional[str],
+           where: tuple,
+           assignments: tuple,
+           dry_run: bool,
+           queue: Optional[bool],
+           **kwargs) -> None:
+    """ Method to update a site, or all sites that match the
+        filters in `where` with bulk requests
 
         Parameters
         ----------
-        name: str
+        name: Optional[str]
             The name of the site to update
 
+        where: tuple
+            Filters as `FIELD=VALUE`
+
+        assignments: tuple
+            Extra values to set as `FIELD=VALUE`
+
+        dry_run: bool
+            If set, the matching sites are only shown
+
+        queue: Optional[bool]
+            If set, the site is updated by the next `flush`
+
         **kwargs: dict
             Values to update
 
@@ -181,42 +701,176 @@ def update(name: str, **kwargs) -> None:
         -------
         None
     """
+    from .bulk import UNIQUE_FIELDS, parse_assignments, run_filtered
+    from .ids import write_by_name
+    from .journal import queue_change
+
+    if (name is None) == (len(where) == 0):
+        console.print('[error]Give either a name or --where[/]')
+        return
+
+    try:
+        kwargs.update(parse_assignments(assignments))
+    except BulkInputError as error:
+        console.print(f'[error]{error}[/]')
+        return
+
+    queue = use_queue(queue)
+    if where and queue:
+        console.print('[error]Changes with --where cannot be queued; use --no-queue[/]')
+        return
+
+    if where:
+        changes = {
+            setting: value for setting, value in kwargs.items() if value is not None}
+        unique = [field for field in UNIQUE_FIELDS if field in changes]
+        if unique:
+            console.print(
+                f'[error]{", ".join(unique)} cannot be set with --where; all matching '
+                f'sites would get the same value[/]')
+            return
+        if run_filtered('dcim.sites', 'update', where, changes, dry_run=dry_run,
+                        workers=nbcli_object.get_instance_setting('workers')):
+            get_cache().invalidate('dcim.sites', 'dcim.regions')
+        return
+
+    # Update the resource by its ID
+    changes = {
+        setting: value for setting, value in kwargs.items() if value is not None}
+    if changes and queue:
+        queue_change('dcim.sites', 'update', name, changes)
+        return
+    if changes and write_by_name('dcim.sites', name, changes) is None:
+        console.print(
+            f'[error]No site with name "[error_highlight]{name}[/]" found[/]')
+        return
+
+    # Region site counts change as well
+    get_cache().invalidate('dcim.sites', 'dcim.regions')
+
+
+@sites.command(help='Delete a site, or all sites that match --where')
+@click.argument('name', type=str, required=False)
+@click.option('--where', multiple=True,
+              help='Filter as FIELD=VALUE; deletes all sites that match')
+@click.option('--dry-run', is_flag=True,
+              help='Show the sites that match --where without deleting them')
+@click.option('--yes', is_flag=True,
+              help='Do not ask for confirmation when deleting with --where')
+@queue_option
+def delete(name: Optional[str],
+           where: tuple,
+           dry_run: bool,
+           yes: bool,
+           queue: Optional[bool]) -> None:
+    """ Method to delete a site, or all sites that match the
+        filters in `where` with bulk requests
 
-    # Create the object
-    nbcli_object.create_pynetbox_object()
+        Parameters
+        ----------
+        name: Optional[str]
+            The name of the site to delete
 
-    # Get the resources
-    resource_object = nbcli_object.nb.dcim.sites.get(name=name)
+        where: tuple
+            Filters as `FIELD=VALUE`
 
-    # Update the resource
-    for setting, value in kwargs.items():
-        if value is not None:
-            setattr(resource_object, setting, value)
+        dry_run: bool
+            If set, the matching sites are only shown
 
-    # Update the resource
-    resource_object.save()
+        yes: bool
+            If set, no confirmation is asked
 
+        queue: Optional[bool]
+            If set, the site is deleted by the next `flush`
 
-@sites.command(help='Delete a site')
-@click.argument('name', type=str)
-def delete(name: str) -> None:
-    """ Method to delete a site
+        Returns
+        -------
+        None
+    """
+    from .bulk import run_filtered
+    from .ids import write_by_name
+    from .journal import queue_change
+
+    if (name is None) == (len(where) == 0):
+        console.print('[error]Give either a name or --where[/]')
+        return
+
+    queue = use_queue(queue)
+    if where and queue:
+        console.print('[error]Changes with --where cannot be queued; use --no-queue[/]')
+        return
+
+    if where:
+        if run_filtered('dcim.sites', 'delete', where, {}, dry_run=dry_run, confirm=not yes,
+                        workers=nbcli_object.get_instance_setting('workers')):
+            get_cache().invalidate('dcim.sites', 'dcim.regions')
+        return
+
+    if queue:
+        queue_change('dcim.sites', 'delete', name)
+        return
+
+    # Delete the resource by its ID
+    if write_by_name('dcim.sites', name) is None:
+        console.print(
+            f'[error]No site with name "[error_highlight]{name}[/]" found[/]')
+        return
+
+    # Region site counts change as well
+    get_cache().invalidate('dcim.sites', 'dcim.regions')
+
+
+@sites.command(name='import', help='Create, update or delete sites from a CSV, JSON or YAML file')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--action', type=click.Choice(['create', 'update', 'delete']),
+              default='create', show_default=True)
+@click.option('--format', 'file_format', type=click.Choice(['csv', 'json', 'yaml']),
+              help='Format of the file; by default the file extension is used')
+@click.option('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, show_default=True,
+              help='Number of sites in one request')
+@click.option('--workers', type=int,
+              help='Number of requests at the same time; overrides the instance setting')
+def import_file(path: str,
+                action: str,
+                file_format: Optional[str],
+                chunk_size: int,
+                workers: Optional[int]) -> None:
+    """ Method to create, update or delete sites in bulk. For
+        updates and deletes, the sites are identified by their
+        `id` or `name`.
 
         Parameters
         ----------
-        name: str
-            The name of the site to delete
+        path: str
+            The file with the sites
+
+        action: str
+            The action to do for the sites
+
+        file_format: Optional[str]
+            The format of the file
+
+        chunk_size: int
+            The number of sites in one request
+
+        workers: Optional[int]
+            The number of requests at the same time
 
         Returns
         -------
         None
     """
+    from .bulk import read_rows, run_bulk, print_report
 
-    # Create the object
-    nbcli_object.create_pynetbox_object()
+    try:
+        rows = read_rows(path, file_format)
+    except BulkInputError as error:
+        console.print(f'[error]{error}[/]')
+        return
 
-    # Get the resources
-    resource_object = nbcli_object.nb.dcim.sites.get(name=name)
+    if workers is None:
+        workers = nbcli_object.get_instance_setting('workers')
 
-    # Delete the resource
-    resource_object.delete()
+    results = run_bulk('dcim.sites', action, rows, chunk_size, workers)
+    get_cache().invalidate('dcim.sites', 'dcim.regions')
+    print_report(action, rows, results)
@@ -0,0 +1,332 @@
+""" Module with helpers to render NetBox resources to the console """
+import csv
+import json
+import logging
+import os
+import sys
+from typing import Any, Iterable, Optional
+import click
+from rich.table import Table
+from .cli import console, options, tables
+from .timings import timings
+
+logger = logging.getLogger('render')
+
+# The default number of rows that are printed at once in streaming
+# mode. This matches the default page size of NetBox.
+STREAM_CHUNK_SIZE = 50
+
+
+def create_table(columns: list,
+                 show_header: bool = True,
+                 widths: Optional[list] = None,
+                 **kwargs) -> Table:
+    """ Create a Rich table for the given columns
+
+        Parameters
+        ----------
+        columns: list
+            A list with dicts describing the columns. Every dict
+            contains a `key` and a `header` and optionally extra
+            arguments for `Table.add_column`.
+
+        show_header: bool
+            If set, the header is shown
+
+        widths: Optional[list]
+            Fixed widths for the columns. If not given, Rich sizes
+            the columns
+
+        **kwargs: dict
+            Extra arguments for the `Table`
+
+        Returns
+        -------
+        Table
+            The created table
+    """
+    table = Table(show_header=show_header, **tables, **kwargs)
+    for index, column in enumerate(columns):
+        column_args = {
+            setting: value for setting, value in column.items()
+            if setting not in ('key', 'header')}
+        if widths:
+            column_args.update({
+                'width': widths[index],
+                'no_wrap': True,
+                'overflow': 'ellipsis'})
+        table.add_column(column['header'], **column_args)
+    return table
+
+
+def to_value(value: Any) -> Any:
+    """ Convert a value of a resource to a value that can be shown
+        and stored as JSON. Nested objects are shown by their name,
+        label or display value, like pynetbox shows them.
+
+        Parameters
+        ----------
+        value: Any
+            The value to convert
+
+        Returns
+        -------
+        Any
+            The converted value
+    """
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, dict):
+        return value.get('name') or value.get('label') or value.get('display') or ''
+    return str(value)
+
+
+def to_row(resource: dict) -> dict:
+    """ Convert all fields of a resource to values that can be
+        stored as JSON. Lists are kept as lists of converted values.
+
+        Parameters
+        ----------
+        resource: dict
+            The resource
+
+        Returns
+        -------
+        dict
+            The converted fields
+    """
+    row = {}
+    for field, value in resource.items():
+        if isinstance(value, list):
+            row[field] = [to_value(item) for item in value]
+        else:
+            row[field] = to_value(value)
+    return row
+
+
+def select_columns(columns: list, fields: Optional[str]) -> list:
+    """ Select columns by a comma-separated list of their keys
+
+        Parameters
+        ----------
+        columns: list
+            The available columns
+
+        fields: Optional[str]
+            The keys of the columns, like `id,name`. If not given,
+            all columns are returned.
+
+        Returns
+        -------
+        list
+            The selected columns in the given order
+    """
+    if not fields:
+        return columns
+
+    available = {column['key']: column for column in columns}
+    keys = [key.strip() for key in fields.split(',') if key.strip()]
+    unknown = [key for key in keys if key not in available]
+    if unknown or len(keys) == 0:
+        raise click.BadParameter(
+            f'Choose from {", ".join(available)}', param_hint='--fields')
+    return [available[key] for key in keys]
+
+
+def get_cells(columns: list, row: dict) -> list:
+    """ Convert a row to the cells for a table
+
+        Parameters
+        ----------
+        columns: list
+            The columns for the table
+
+        row: dict
+            The row to convert
+
+        Returns
+        -------
+        list
+            The values for the cells as strings
+    """
+    return [str(row[column['key']]) for column in columns]
+
+
+def print_table(columns: list, rows: Iterable[dict]) -> None:
+    """ Print the rows in one table. All rows are collected
+        before the table is printed.
+
+        Parameters
+        ----------
+        columns: list
+            The columns for the table
+
+        rows: Iterable[dict]
+            The rows to print
+
+        Returns
+        -------
+        None
+    """
+    table = create_table(columns)
+    for row in rows:
+        table.add_row(*get_cells(columns, row))
+    console.print(table)
+
+
+def print_streaming_table(columns: list,
+                          rows: Iterable[dict],
+                          chunk_size: int = STREAM_CHUNK_SIZE,
+                          column_width: Optional[int] = None) -> int:
+    """ Print the rows in chunks while they are retrieved. Only one
+        chunk is kept in memory. The column widths are fixed to the
+        given width, or to the widths needed for the first chunk, so
+        the chunks line up. A KeyboardInterrupt stops retrieving
+        rows; the rows that were printed stay on the screen.
+
+        Parameters
+        ----------
+        columns: list
+            The columns for the table
+
+        rows: Iterable[dict]
+            The rows to print. This is usually a generator that
+            retrieves the pages from NetBox.
+
+        chunk_size: int
+            The number of rows to print at once
+
+        column_width: Optional[int]
+            A fixed width for all columns
+
+        Returns
+        -------
+        int
+            The number of printed rows
+    """
+    widths = None
+    printed = 0
+    chunk = []
+
+    def print_chunk() -> None:
+        nonlocal widths, printed
+        cells = [get_cells(columns, row) for row in chunk]
+
+        # Fix the widths of the columns on the first chunk
+        if widths is None:
+            if column_width:
+                widths = [column_width] * len(columns)
+            else:
+                widths = [
+                    max([len(column['header'])] + [len(row[index]) for row in cells])
+                    for index, column in enumerate(columns)]
+
+        table = create_table(
+            columns, show_header=printed == 0, widths=widths, show_edge=False)
+        for row in cells:
+            table.add_row(*row)
+        console.print(table)
+        printed += len(chunk)
+        chunk.clear()
+
+    try:
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                print_chunk()
+    except KeyboardInterrupt:
+        if chunk:
+            print_chunk()
+        logger.debug('Streaming interrupted by the user')
+        console.print(
+            f'[error]Interrupted; stopped after [error_highlight]{printed}[/] rows[/]')
+        return printed
+
+    if chunk or printed == 0:
+        print_chunk()
+    return printed
+
+
+def write_records(columns: list, rows: Iterable[dict], output: str) -> int:
+    """ Write the rows to stdout in a machine-readable format. Every
+        row is written when it is retrieved, without Rich, so the
+        memory use does not depend on the number of rows.
+
+        Parameters
+        ----------
+        columns: list
+            The columns to write
+
+        rows: Iterable[dict]
+            The rows to write
+
+        output: str
+            The format; `jsonl`, `csv` or `tsv`
+
+        Returns
+        -------
+        int
+            The number of written rows
+    """
+    keys = [column['key'] for column in columns]
+    written = 0
+    try:
+        if output == 'jsonl':
+            for row in rows:
+                sys.stdout.write(json.dumps({key: row[key] for key in keys}) + '\n')
+                written += 1
+                if written % STREAM_CHUNK_SIZE == 0:
+                    sys.stdout.flush()
+        else:
+            writer = csv.writer(
+                sys.stdout, delimiter='\t' if output == 'tsv' else ',', lineterminator='\n')
+            writer.writerow(keys)
+            for row in rows:
+                writer.writerow([row[key] for key in keys])
+                written += 1
+                if written % STREAM_CHUNK_SIZE == 0:
+                    sys.stdout.flush()
+        sys.stdout.flush()
+    except KeyboardInterrupt:
+        logger.debug(f'Writing interrupted by the user after {written} rows')
+    except BrokenPipeError:
+        # The reader, like `head`, stopped reading. Point stdout to
+        # devnull so Python does not fail when it flushes on exit
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+    return written
+
+
+def print_rows(columns: list,
+               rows: Iterable[dict],
+               stream: bool = False,
+               column_width: Optional[int] = None) -> None:
+    """ Print the rows in the output format that is set with the
+        global `--output` option
+
+        Parameters
+        ----------
+        columns: list
+            The columns to print
+
+        rows: Iterable[dict]
+            The rows to print
+
+        stream: bool
+            If set, tables are printed in chunks while the rows are
+            retrieved
+
+        column_width: Optional[int]
+            Fixed width for the columns in streaming mode
+
+        Returns
+        -------
+        None
+    """
+    rows = timings.measure_rows(rows)
+    with timings.span('output', format=options['output']):
+        if options['output'] != 'table':
+            write_records(columns, rows, options['output'])
+        elif stream:
+            print_streaming_table(columns, rows, column_width=column_width)
+        else:
+            print_table(columns, rows)
@@ -0,0 +1,669 @@
+""" Module with commands that are generated from the resource model
+    of NetBox, so every endpoint of the API can be listed, inspected,
+    created, updated and deleted. The commands are created when they
+    are used: `nbcli resources dcim devices list` only creates the
+    commands of `dcim.devices`. """
+import functools
+from typing import Any, Callable, Optional
+import click
+from rich.table import Table
+from .nbcli import nbcli_object
+from .cli import console, tables
+from .fetch import DEFAULT_PAGE_SIZE, fetch_records, get_field_filters
+from .bulk import parse_assignments
+from .cache import get_cache
+from .exceptions import BulkInputError, NetBoxRequestError, SchemaError
+from .ids import get_id_index, write_by_name
+from .render import print_rows, to_row, to_value
+from .schema import expire_models, get_model
+from .summary import print_count
+
+# The fields that identify a resource in lists, in order of
+# preference. Endpoints without any of them show `display`.
+IDENTIFYING_FIELDS = ('name', 'prefix', 'address', 'cid', 'model', 'vid')
+
+# Fields that are added to the default columns if the endpoint has
+# them
+DEFAULT_FIELDS = ('status', 'site', 'tenant', 'description')
+
+# The click types for the kinds of fields. Related objects are given
+# by their ID.
+KIND_TYPES = {
+    'integer': click.INT,
+    'number': click.FLOAT,
+    'boolean': click.BOOL,
+    'object': click.INT
+}
+
+# Options of the generated commands; fields with these names can
+# only be given with `--filter` or `--set`
+RESERVED_OPTIONS = (
+    'fields', 'filter', 'page_size', 'max_results', 'limit', 'ordering', 'count',
+    'workers', 'set', 'yes', 'identifier', 'help')
+
+
+def get_header(field: str) -> str:
+    """ Get the column header for a field
+
+        Parameters
+        ----------
+        field: str
+            The field, like `site_count`
+
+        Returns
+        -------
+        str
+            The header, like `Site count`
+    """
+    if field == 'id':
+        return 'ID'
+    return field.replace('_', ' ').strip().capitalize()
+
+
+def get_columns(model: dict, fields: Optional[str]) -> list:
+    """ Get the columns for the `list` command of an endpoint
+
+        Parameters
+        ----------
+        model: dict
+            The model of the endpoint
+
+        fields: Optional[str]
+            Comma-separated fields to show; by default the ID, the
+            identifying field and common fields are shown
+
+        Returns
+        -------
+        list
+            The columns
+    """
+    if fields:
+        keys = [field.strip() for field in fields.split(',') if field.strip()]
+        unknown = [key for key in keys if key not in model['fields']]
+        if unknown:
+            raise click.BadParameter(
+                f'Unknown field "{unknown[0]}"; choose from {", ".join(model["fields"])}',
+                param_hint='--fields')
+    else:
+        identifying = next(
+            (field for field in IDENTIFYING_FIELDS if field in model['fields']), 'display')
+        keys = ['id', identifying, *(
+            field for field in DEFAULT_FIELDS if field in model['fields'])]
+
+    return [{
+        'key': key,
+        'header': get_header(key),
+        **({'style': 'item_identification'} if key in ('id', *IDENTIFYING_FIELDS) else {}),
+        **({'justify': 'right'} if model['fields'].get(key) in ('integer', 'number') else {})
+    } for key in keys]
+
+
+def convert_value(kind: Optional[str], value: Any) -> Any:
+    """ Convert a value from the command line to the kind of its
+        field
+
+        Parameters
+        ----------
+        kind: Optional[str]
+            The kind of the field, or None if the field is unknown
+
+        value: Any
+            The value; lists are converted item by item
+
+        Returns
+        -------
+        Any
+            The converted value
+    """
+    if isinstance(value, list):
+        return [convert_value(kind, item) for item in value]
+    if not isinstance(value, str):
+        return value
+    if kind in ('integer', 'object') and value.lstrip('-').isdigit():
+        return int(value)
+    if kind == 'number':
+        return float(value)
+    if kind == 'boolean':
+        return value.lower() in ('true', '1', 'yes')
+    if kind == 'array':
+        return [int(item) if item.isdigit() else item for item in value.split(',') if item]
+    return value
+
+
+def get_changes(model: dict, assignments: tuple, values: dict) -> dict:
+    """ Get the values to write from the field options and the
+        `--set` options
+
+        Parameters
+        ----------
+        model: dict
+            The model of the endpoint
+
+        assignments: tuple
+            The `--set` options as `FIELD=VALUE`
+
+        values: dict
+            The values of the field options
+
+        Returns
+        -------
+        dict
+            The values to write
+    """
+    changes = {field: value for field, value in values.items() if value is not None}
+    for field, value in parse_assignments(assignments).items():
+        changes[field] = convert_value(model['writable'].get(field), value)
+    return changes
+
+
+def get_field_options(model: dict, fields: dict, multiple: bool = False) -> list:
+    """ Create the options for fields of an endpoint
+
+        Parameters
+        ----------
+        model: dict
+            The model of the endpoint
+
+        fields: dict
+            The fields with their kind
+
+        multiple: bool
+            If set, the options can be given more than once
+
+        Returns
+        -------
+        list
+            The options
+    """
+    params = []
+    for field, kind in fields.items():
+        if field in RESERVED_OPTIONS or kind == 'array' or not field.isidentifier():
+            continue
+        field_type = KIND_TYPES.get(kind, click.STRING)
+        if field in model['choices']:
+            field_type = click.Choice(model['choices'][field])
+        params.append(click.Option(
+            [f'--{field}'], type=field_type, multiple=multiple,
+            help='ID of the related object' if kind == 'object' else None))
+    return params
+
+
+def find_resource(endpoint: str, model: dict, identifier: str) -> Optional[dict]:
+    """ Find a resource by its ID or name
+
+        Parameters
+        ----------
+        endpoint: str
+            The endpoint, like `dcim.devices`
+
+        model: dict
+            The model of the endpoint
+
+        identifier: str
+            The ID, or the name for endpoints with names
+
+        Returns
+        -------
+        Optional[dict]
+            The resource, or None if it does not exist
+    """
+    backend = nbcli_object.get_backend()
+    if identifier.isdigit():
+        return backend.get(endpoint, int(identifier))
+    if 'name' not in model['filters']:
+        raise click.BadParameter(
+            f'"{endpoint}" has no names; give the ID', param_hint='IDENTIFIER')
+    return backend.get(endpoint, name=identifier)
+
+
+def write_resource(endpoint: str,
+                   model: dict,
+                   identifier: str,
+                   changes: Optional[dict] = None) -> Any:
+    """ Update or delete a resource by its ID or name
+
+        Parameters
+        ----------
+        endpoint: str
+            The endpoint, like `dcim.devices`
+
+        model: dict
+            The model of the endpoint
+
+        identifier: str
+            The ID, or the name for endpoints with names
+
+        changes: Optional[dict]
+            The values to update. If not given, the resource is
+            deleted.
+
+        Returns
+        -------
+        Any
+            The result of the request, or None if there is no
+            resource with the name or ID
+    """
+    if not identifier.isdigit():
+        if 'name' not in model['filters']:
+            raise click.BadParameter(
+                f'"{endpoint}" has no names; give the ID', param_hint='IDENTIFIER')
+        return write_by_name(endpoint, identifier, changes)
+
+    backend = nbcli_object.get_backend()
+    try:
+        if changes is None:
+            return backend.delete(endpoint, int(identifier))
+        return backend.update(endpoint, changes, int(identifier))
+    except NetBoxRequestError as error:
+        if error.status_code == 404:
+            return None
+        raise
+
+
+def check_rejection(callback: Callable) -> Callable:
+    """ Wrap the callback of a command. If NetBox rejects a request of
+        the command, the model the command was built from can be
+        outdated, so the NetBox version is checked on the next use of
+        the model.
+
+        Parameters
+        ----------
+        callback: Callable
+            The callback
+
+        Returns
+        -------
+        Callable
+            The wrapped callback
+    """
+    @functools.wraps(callback)
+    def checked(*args, **kwargs) -> Any:
+        try:
+            return callback(*args, **kwargs)
+        except NetBoxRequestError as error:
+            if error.status_code == 400:
+                expire_models()
+            raise
+    return checked
+
+
+def create_list_command(endpoint: str, model: dict) -> click.Command:
+    """ Create the `list` command of an endpoint
+
+        Parameters
+        ----------
+        endpoint: str
+            The endpoint, like `dcim.devices`
+
+        model: dict
+            The model of the endpoint
+
+        Returns
+        -------
+        click.Command
+            The command
+    """
+    def list_resources(fields: Optional[str],
+                       filter: tuple,
+                       page_size: int,
+                       max_results: Optional[int],
+                       ordering: Optional[str],
+                       count: bool,
+                       workers: Optional[int],
+                       **kwargs) -> None:
+        # Filters from the options and from `--filter`
+        try:
+            filters = {
+                field: [*values] if len(values) > 1 else values[0]
+                for field, values in kwargs.items() if values}
+            filters.update(parse_assignments(filter))
+        except BulkInputError as error:
+            console.print(f'[error]{error}[/]')
+            return
+
+        # Only the number of results is requested
+        if count:
+            print_count(endpoint, filters, False, [])
+            return
+
+        # The columns to show
+        columns = get_columns(model, fields)
+        keys = [column['key'] for column in columns]
+
+        # Get the resources
+        query = {**filters, 'ordering': ordering} if ordering else filters
+        resources = fetch_records(
+            endpoint, {**query, **get_field_filters(endpoint, keys)},
+            workers=workers or nbcli_object.get_instance_setting('workers'),
+            page_size=page_size, max_results=max_results)
+
+        # Print the rows
+        print_rows(columns, (
+            {key: to_value(resource.get(key)) for key in keys} for resource in resources))
+
+    return click.Command('list', callback=list_resources, help=f'List {endpoint}', params=[
+        click.Option(['--fields'], type=str,
+                     help='Comma-separated columns to show; only these are retrieved'),
+        click.Option(['--filter'], type=str, multiple=True,
+                     help='FIELD=VALUE filter, like name__ic=core; can be repeated'),
+        click.Option(['--page-size'], type=click.IntRange(min=1), default=DEFAULT_PAGE_SIZE,
+                     show_default=True,
+                     help='Number of results per request; NetBox caps it to its MAX_PAGE_SIZE'),
+        click.Option(['--max-results', '--limit', 'max_results'], type=click.IntRange(min=1),
+                     help='Stop after this number of results'),
+        click.Option(['--ordering'], type=str,
+                     help='Comma-separated fields NetBox sorts by, like `name` or `-id`'),
+        click.Option(['--count'], is_flag=True,
+                     help='Only print the number of results; NetBox returns a single result'),
+        click.Option(['--workers'], type=int,
+                     help='Number of pages to retrieve at the same time; '
+                          'overrides the instance setting'),
+        *get_field_options(model, model['filters'], multiple=True)])
+
+
+def create_inspect_command(endpoint: str, model: dict) -> click.Command:
+    """ Create the `inspect` command of an endpoint
+
+        Parameters
+        ----------
+        endpoint: str
+            The endpoint, like `dcim.devices`
+
+        model: dict
+            The model of the endpoint
+
+        Returns
+        -------
+        click.Command
+            The command
+    """
+    def inspect(identifier: str) -> None:
+        resource = find_resource(endpoint, model, identifier)
+        if resource is None:
+            console.print(
+                f'[error]No object with ID or name "[error_highlight]{identifier}[/]" found[/]')
+            return
+
+        # Create a table with all fields
+        table = Table(show_header=False, **tables)
+        table.add_column('Setting', style='item_identification')
+        table.add_column('Value')
+        for field, value in to_row(resource).items():
+            if isinstance(value, list):
+                value = ', '.join(str(item) for item in value)
+            table.add_row(get_header(field), '' if value is None else str(value))
+
+        # Print the table
+        console.print(table)
+
+    return click.Command(
+        'inspect', callback=inspect, help=f'Show all fields of one of {endpoint}',
+        params=[click.Argument(['identifier'], type=str)])
+
+
+def create_write_command(endpoint: str, model: dict, action: str) -> click.Command:
+    """ Create the `create`, `update` or `delete` command of an
+        endpoint
+
+        Parameters
+        ----------
+        endpoint: str
+            The endpoint, like `dcim.devices`
+
+        model: dict
+            The model of the endpoint
+
+        action: str
+            The action; `create`, `update` or `delete`
+
+        Returns
+        -------
+        click.Command
+            The command
+    """
+    def write(identifier: Optional[str] = None,
+              set: tuple = (),
+              yes: bool = False,
+              **kwargs) -> None:
+        try:
+            changes = get_changes(model, set, kwargs)
+        except BulkInputError as error:
+            console.print(f'[error]{error}[/]')
+            return
+
+        if action == 'create':
+            missing = [field for field in model['required'] if field not in changes]
+            if missing:
+                console.print(
+                    f'[error]Missing required fields: [error_highlight]{", ".join(missing)}[/][/]')
+                return
+
+            # Add the new resource and remember its ID
+            created = nbcli_object.get_backend().create(endpoint, changes)
+            index = get_id_index(endpoint)
+            index.add(created)
+            index.save()
+        else:
+            if action == 'delete' and not yes:
+                click.confirm(f'Delete "{identifier}" from {endpoint}?', abort=True)
+            if action == 'update' and not changes:
+                return
+            if write_resource(
+                    endpoint, model, identifier,
+                    changes if action == 'update' else None) is None:
+                console.print(
+                    f'[error]No object with ID or name "[error_highlight]{identifier}[/]" '
+                    'found[/]')
+                return
+
+        get_cache().invalidate(endpoint)
+
+    params = []
+    if action != 'create':
+        params.append(click.Argument(['identifier'], type=str))
+    if action == 'delete':
+        params.append(click.Option(
+            ['--yes'], is_flag=True, help='Do not ask for confirmation'))
+    else:
+        params.append(click.Option(
+            ['--set'], type=str, multiple=True,
+            help='Value to set as FIELD=VALUE, for fields without an option; can be repeated'))
+        params += get_field_options(model, model['writable'])
+
+    return click.Command(
+        action, callback=write, params=params,
+        help=f'{action.capitalize()} one of {endpoint}' if action != 'create'
+        else f'Create a new object in {endpoint}')
+
+
+# The functions that create the commands of an endpoint
+COMMAND_FACTORIES = {
+    'list': create_list_command,
+    'inspect': create_inspect_command,
+    'create': lambda endpoint, model: create_write_command(endpoint, model, 'create'),
+    'update': lambda endpoint, model: create_write_command(endpoint, model, 'update'),
+    'delete': lambda endpoint, model: create_write_command(endpoint, model, 'delete')
+}
+
+
+class SchemaGroup(click.Group):
+    def __init__(self, *args, app: Optional[str] = None, **kwargs) -> None:
+        """ A click group whose subcommands are created from the
+            resource model when they are used. Without an app, the
+            subcommands are the apps; with an app, they are the
+            endpoints of the app.
+
+            Parameters
+            ----------
+            *args: list
+                Arguments for `click.Group`
+
+            app: Optional[str]
+                The app, like `dcim`
+
+            **kwargs: dict
+                Arguments for `click.Group`
+
+            Returns
+            -------
+            None
+        """
+        super().__init__(*args, **kwargs)
+        self.app = app
+        self.refreshed = False
+
+    def get_model(self, ctx: click.Context) -> dict:
+        """ Method to get the resource model of the active instance.
+            The top group retrieves the schema again, once, if
+            `--refresh-schema` is given.
+
+            Parameters
+            ----------
+            ctx: click.Context
+                The click context
+
+            Returns
+            -------
+            dict
+                The model of every endpoint
+        """
+        refresh = ctx.params.get('refresh_schema', False) and not self.refreshed
+        self.refreshed = self.refreshed or refresh
+        try:
+            return get_model(refresh=refresh)
+        except (NetBoxRequestError, SchemaError) as error:
+            raise click.ClickException(f'The resource model is not available: {error}')
+
+    def get_children(self, ctx: click.Context) -> dict:
+        """ Method to get the names of the subcommands with the
+            endpoints they belong to
+
+            Parameters
+            ----------
+            ctx: click.Context
+                The click context
+
+            Returns
+            -------
+            dict
+                The names of the subcommands with a list of their
+                endpoints
+        """
+        children = {}
+        for endpoint in self.get_model(ctx):
+            app, name = endpoint.split('.')
+            if self.app is None:
+                children.setdefault(app.replace('_', '-'), []).append(endpoint)
+            elif app == self.app:
+                children[name.replace('_', '-')] = [endpoint]
+        return children
+
+    def list_commands(self, ctx: click.Context) -> list:
+        """ Method that returns the names of all subcommands
+
+            Parameters
+            ----------
+            ctx: click.Context
+                The click context
+
+            Returns
+            -------
+            list
+                The names of the subcommands
+        """
+        return sorted(self.get_children(ctx))
+
+    def get_command(self, ctx: click.Context, cmd_name: str) -> Optional[click.Command]:
+        """ Method that creates a subcommand
+
+            Parameters
+            ----------
+            ctx: click.Context
+                The click context
+
+            cmd_name: str
+                The name of the subcommand
+
+            Returns
+            -------
+            Optional[click.Command]
+                The subcommand, or None if it does not exist
+        """
+        endpoints = self.get_children(ctx).get(cmd_name)
+        if endpoints is None:
+            return None
+        if self.app is None:
+            return SchemaGroup(
+                cmd_name, app=endpoints[0].split('.')[0],
+                help=f'Objects of the {cmd_name} app')
+
+        # The commands of an endpoint
+        endpoint = endpoints[0]
+        model = self.get_model(ctx)[endpoint]
+        group = click.Group(cmd_name, help=f'Manage {endpoint}')
+        for action in model['actions']:
+            command = COMMAND_FACTORIES[action](endpoint, model)
+            command.callback = check_rejection(command.callback)
+            group.add_command(command)
+        return group
+
+    def format_commands(self, ctx: click.Context, formatter: click.HelpFormatter) -> None:
+        """ Method that writes the command list for the help page
+            without creating the commands
+
+            Parameters
+            ----------
+            ctx: click.Context
+                The click context
+
+            formatter: click.HelpFormatter
+                The formatter for the help page
+
+            Returns
+            -------
+            None
+        """
+        children = self.get_children(ctx)
+        if not children:
+            return
+        rows = [
+            (name, ', '.join(endpoint.split('.')[1] for endpoint in endpoints)
+             if self.app is None else f'Manage {endpoints[0]}')
+            for name, endpoints in sorted(children.items())]
+        with formatter.section('Commands'):
+            formatter.write_dl(rows)
+
+
+@click.group(cls=SchemaGroup, invoke_without_command=True,
+             help='Commands for every NetBox endpoint, generated from the OpenAPI schema')
+@click.option('--refresh-schema', is_flag=True,
+              help='Retrieve the OpenAPI schema of NetBox again')
+@click.pass_context
+def resources(ctx: click.Context, refresh_schema: bool) -> None:
+    """ Group with the generated commands. Without a subcommand,
+        the schema can be retrieved again.
+
+        Parameters
+        ----------
+        ctx: click.Context
+            The click context
+
+        refresh_schema: bool
+            If set, the schema is retrieved again
+
+        Returns
+        -------
+        None
+    """
+    if ctx.invoked_subcommand is not None:
+        return
+
+    if not refresh_schema:
+        console.print(ctx.get_help())
+        return
+
+    # Only refresh the model
+    endpoints = ctx.command.get_model(ctx)
+    console.print(
+        f'Compiled the schema of [item_identification]{len(endpoints)}[/] endpoints for '
+        f'"[item_selected]{nbcli_object.get_active_instance_name()}[/]"')
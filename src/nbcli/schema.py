@@ -0,0 +1,411 @@
+""" Module with the resource model of a NetBox instance. The model is
+    compiled from the OpenAPI schema of NetBox and describes every
+    endpoint with its fields, filters and writable fields. The schema
+    is large, so it is only retrieved once per instance and NetBox
+    version; the compiled model is stored on disk and is small enough
+    to load on every command. The NetBox version is checked once per
+    `SCHEMA_CHECK_TTL`, and the schema is retrieved again when it
+    changed. When NetBox rejects a request that was built from a
+    model, the version is checked on the next use, so an upgrade is
+    picked up without waiting for the TTL. The GraphQL backend stores
+    its model the same way. """
+import json
+import logging
+import os
+import re
+import time
+from typing import Callable, Optional
+from .nbcli import nbcli_object, NBCLI_DATA_DIR
+from .exceptions import SchemaError
+
+NBCLI_SCHEMA_DIR = f'{NBCLI_DATA_DIR}/schema'
+
+# The format of the compiled models. Models in another format are
+# compiled again.
+MODEL_FORMAT = 2
+
+# The time in seconds before the NetBox version is checked again
+SCHEMA_CHECK_TTL = 86400
+
+# The time in seconds after a check before a rejected request leads
+# to another check
+SCHEMA_RECHECK_INTERVAL = 60
+
+# The names of the models
+MODEL_NAMES = ('openapi', 'graphql')
+
+# The paths of the list endpoints, like `/api/dcim/sites/`
+LIST_PATH_PATTERN = re.compile(r'^/api/([a-z0-9-]+)/([a-z0-9-]+)/$')
+
+# Query parameters that are not filters
+CONTROL_PARAMETERS = ('limit', 'offset', 'ordering', 'brief', 'fields', 'exclude', 'format')
+
+logger = logging.getLogger('schema')
+
+# The loaded models per model name and instance
+models = {}
+
+
+def resolve(schema: dict, node: dict) -> dict:
+    """ Resolve a reference in the schema. A node with only one
+        `allOf` item, as used for nested objects, is resolved to
+        that item.
+
+        Parameters
+        ----------
+        schema: dict
+            The OpenAPI schema
+
+        node: dict
+            The node, possibly a `$ref`
+
+        Returns
+        -------
+        dict
+            The node the reference points to
+    """
+    while True:
+        if '$ref' in node:
+            target = schema
+            for part in node['$ref'].lstrip('#/').split('/'):
+                target = target[part]
+            node = target
+        elif len(node.get('allOf', ())) == 1:
+            node = node['allOf'][0]
+        else:
+            return node
+
+
+def get_kind(schema: dict, node: dict) -> str:
+    """ Get the kind of a field: `integer`, `number`, `boolean`,
+        `string`, `choice`, `object` for a related object or `array`
+
+        Parameters
+        ----------
+        schema: dict
+            The OpenAPI schema
+
+        node: dict
+            The schema of the field
+
+        Returns
+        -------
+        str
+            The kind
+    """
+    if '$ref' in node or 'allOf' in node:
+        node = resolve(schema, node)
+
+    # Related objects can be written as an ID or as an object
+    options = node.get('oneOf') or node.get('anyOf')
+    if options:
+        kinds = {get_kind(schema, option) for option in options}
+        return 'object' if 'object' in kinds else kinds.pop()
+
+    if 'enum' in node:
+        return 'choice'
+    properties = node.get('properties', {})
+    if 'value' in properties and 'label' in properties:
+        return 'choice'
+    if node.get('type') in ('integer', 'number', 'boolean', 'string', 'array'):
+        return node['type']
+    return 'object'
+
+
+def get_json_schema(schema: dict, content: Optional[dict]) -> dict:
+    """ Get the schema of a JSON request or response body
+
+        Parameters
+        ----------
+        schema: dict
+            The OpenAPI schema
+
+        content: Optional[dict]
+            The `content` of the body
+
+        Returns
+        -------
+        dict
+            The resolved schema of the body, or an empty dict
+    """
+    body = (content or {}).get('application/json', {}).get('schema')
+    if body is None:
+        return {}
+    body = resolve(schema, body)
+    if body.get('type') == 'array':
+        body = resolve(schema, body.get('items', {}))
+    return body
+
+
+def compile_endpoint(schema: dict, path: str, operations: dict) -> Optional[dict]:
+    """ Compile the model of one list endpoint
+
+        Parameters
+        ----------
+        schema: dict
+            The OpenAPI schema
+
+        path: str
+            The path of the list endpoint
+
+        operations: dict
+            The operations of the path
+
+        Returns
+        -------
+        Optional[dict]
+            The model, or None if the path is not a list of resources
+    """
+    listing = operations.get('get')
+    if listing is None:
+        return None
+    response = get_json_schema(
+        schema, listing.get('responses', {}).get('200', {}).get('content'))
+    results = response.get('properties', {}).get('results')
+    if results is None:
+        return None
+    resource = resolve(schema, results.get('items', {}))
+
+    model = {
+        'fields': {
+            field: get_kind(schema, node)
+            for field, node in resource.get('properties', {}).items()},
+        'labels': {},
+        'filters': {},
+        'writable': {},
+        'choices': {},
+        'required': [],
+        'actions': ['list', 'inspect']
+    }
+
+    # The labels of choice fields, by value
+    for field, node in resource.get('properties', {}).items():
+        properties = resolve(schema, node).get('properties', {})
+        values = properties.get('value', {}).get('enum')
+        labels = properties.get('label', {}).get('enum')
+        if values and labels and len(values) == len(labels):
+            model['labels'][field] = {
+                value: label for value, label in zip(values, labels) if value not in ('', None)}
+
+    # Only the base filters are kept; lookups like `name__ic` can be
+    # given as they are
+    for parameter in listing.get('parameters', ()):
+        parameter = resolve(schema, parameter)
+        name = parameter.get('name', '')
+        if parameter.get('in') != 'query' or '__' in name or name in CONTROL_PARAMETERS:
+            continue
+        node = parameter.get('schema', {})
+        if node.get('type') == 'array':
+            node = node.get('items', {})
+        model['filters'][name] = get_kind(schema, node)
+
+    # The fields that can be written come from the create request
+    creation = operations.get('post')
+    if creation is not None:
+        body = get_json_schema(schema, creation.get('requestBody', {}).get('content'))
+        for field, node in body.get('properties', {}).items():
+            node = resolve(schema, node) if '$ref' in node else node
+            if node.get('readOnly'):
+                continue
+            model['writable'][field] = get_kind(schema, node)
+            if 'enum' in node:
+                model['choices'][field] = [
+                    value for value in node['enum'] if value not in ('', None)]
+        model['required'] = [
+            field for field in body.get('required', ()) if field in model['writable']]
+        model['actions'].append('create')
+
+    detail = schema['paths'].get(f'{path}{{id}}/', {})
+    if 'patch' in detail:
+        model['actions'].append('update')
+    if 'delete' in detail:
+        model['actions'].append('delete')
+    return model
+
+
+def compile_schema(schema: dict) -> dict:
+    """ Compile the OpenAPI schema of NetBox to the resource model
+
+        Parameters
+        ----------
+        schema: dict
+            The OpenAPI schema
+
+        Returns
+        -------
+        dict
+            The model of every endpoint, by endpoint name like
+            `dcim.sites`
+    """
+    if not isinstance(schema.get('paths'), dict):
+        raise SchemaError('The OpenAPI schema of NetBox has no paths')
+
+    endpoints = {}
+    for path, operations in schema['paths'].items():
+        match = LIST_PATH_PATTERN.match(path)
+        if match is None:
+            continue
+        model = compile_endpoint(schema, path, operations)
+        if model is not None:
+            app, name = (part.replace('-', '_') for part in match.groups())
+            endpoints[f'{app}.{name}'] = model
+    return endpoints
+
+
+def get_model_path(instance_name: str, name: str) -> str:
+    """ Get the path of a compiled model of an instance
+
+        Parameters
+        ----------
+        instance_name: str
+            The name of the instance
+
+        name: str
+            The name of the model, like `openapi`
+
+        Returns
+        -------
+        str
+            The path
+    """
+    return os.path.join(NBCLI_SCHEMA_DIR, instance_name, f'{name}.json')
+
+
+def read_model(path: str) -> Optional[dict]:
+    """ Read a compiled model
+
+        Parameters
+        ----------
+        path: str
+            The path of the model
+
+        Returns
+        -------
+        Optional[dict]
+            The model, or None if it is missing or in another format
+    """
+    try:
+        with open(path, 'r') as model_file:
+            model = json.load(model_file)
+    except (FileNotFoundError, ValueError):
+        return None
+    return model if model.get('format') == MODEL_FORMAT else None
+
+
+def write_model(path: str, model: dict) -> None:
+    """ Write a compiled model. The model is written to a temporary
+        file that replaces the model, so other processes never read
+        a partly written model.
+
+        Parameters
+        ----------
+        path: str
+            The path of the model
+
+        model: dict
+            The model
+
+        Returns
+        -------
+        None
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'w') as model_file:
+        json.dump(model, model_file, separators=(',', ':'))
+    os.replace(temp_path, path)
+
+
+def get_compiled(name: str, compile_model: Callable[[], dict], refresh: bool = False) -> dict:
+    """ Get a compiled model of the active instance. The stored
+        model is used while its NetBox version is checked less than
+        `SCHEMA_CHECK_TTL` ago. After that, the version is checked
+        with one request, and the model is only compiled again if
+        the version changed.
+
+        Parameters
+        ----------
+        name: str
+            The name of the model, like `openapi`
+
+        compile_model: Callable[[], dict]
+            A function that retrieves the schema and compiles it
+
+        refresh: bool
+            If set, the model is compiled again
+
+        Returns
+        -------
+        dict
+            The compiled model
+    """
+    instance_name = nbcli_object.get_active_instance_name()
+    if (name, instance_name) in models and not refresh:
+        return models[(name, instance_name)]
+
+    path = get_model_path(instance_name, name)
+    model = None if refresh else read_model(path)
+    if model is not None and time.time() - model['checked_at'] < SCHEMA_CHECK_TTL:
+        models[(name, instance_name)] = model['model']
+        return model['model']
+
+    version = nbcli_object.get_backend().status()['netbox-version']
+    if model is not None and model['netbox_version'] == version:
+        logger.debug(f'The {name} model of "{instance_name}" is still for NetBox {version}')
+    else:
+        logger.info(f'Compiling the {name} model of "{instance_name}" for NetBox {version}')
+        model = {
+            'format': MODEL_FORMAT,
+            'netbox_version': version,
+            'model': compile_model()}
+    model['checked_at'] = time.time()
+    write_model(path, model)
+
+    models[(name, instance_name)] = model['model']
+    return model['model']
+
+
+def expire_models() -> None:
+    """ Make the next use of the models of the active instance check
+        the NetBox version. This is done when NetBox rejects a request
+        that was built from a model, which happens after an upgrade.
+        Models that were checked in the last
+        `SCHEMA_RECHECK_INTERVAL` are kept, so failing requests do
+        not check the version every time.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        None
+    """
+    instance_name = nbcli_object.get_active_instance_name()
+    for name in MODEL_NAMES:
+        path = get_model_path(instance_name, name)
+        model = read_model(path)
+        if model is None or time.time() - model['checked_at'] < SCHEMA_RECHECK_INTERVAL:
+            continue
+        logger.debug(f'The {name} model of "{instance_name}" is checked on its next use')
+        model['checked_at'] = 0
+        write_model(path, model)
+        models.pop((name, instance_name), None)
+
+
+def get_model(refresh: bool = False) -> dict:
+    """ Get the resource model of the active instance, compiled from
+        the OpenAPI schema of NetBox
+
+        Parameters
+        ----------
+        refresh: bool
+            If set, the schema is retrieved again
+
+        Returns
+        -------
+        dict
+            The model of every endpoint, by endpoint name
+    """
+    return get_compiled(
+        'openapi', lambda: compile_schema(nbcli_object.get_backend().schema()), refresh)
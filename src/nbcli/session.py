@@ -0,0 +1,116 @@
+""" Module with the HTTP session that is used for the requests to
+    NetBox """
+from typing import Any
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from .timings import timings
+
+# HTTP status codes that are retried
+RETRY_STATUS_CODES = (500, 502, 503, 504)
+
+
+class TimeoutSession(requests.Session):
+    def __init__(self, timeout: tuple) -> None:
+        """ The initiator sets the default timeout
+
+            Parameters
+            ----------
+            timeout: tuple
+                The connect and read timeout in seconds
+
+            Returns
+            -------
+            None
+        """
+        super().__init__()
+        self.timeout = timeout
+
+    def request(self, method: str, url: str, **kwargs) -> Any:
+        """ Method that sends a request with the default timeout
+            if no timeout is given
+
+            Parameters
+            ----------
+            method: str
+                The HTTP method
+
+            url: str
+                The URL for the request
+
+            **kwargs: dict
+                Arguments for `requests.Session.request`
+
+            Returns
+            -------
+            Any
+                The response
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        if not timings.enabled:
+            return super().request(method, url, **kwargs)
+
+        # The body is read before `request` returns, so the latency
+        # includes the download
+        start = time.perf_counter()
+        try:
+            response = super().request(method, url, **kwargs)
+        except requests.RequestException:
+            timings.add_request(method, url, None, start, time.perf_counter() - start, 0)
+            raise
+        timings.add_request(
+            method, response.url, response.status_code, start,
+            time.perf_counter() - start, len(response.content))
+        return response
+
+
+def create_session(pool_size: int,
+                   connect_timeout: float,
+                   read_timeout: float,
+                   retries: int,
+                   retry_backoff: float) -> TimeoutSession:
+    """ Create a session with a connection pool, timeouts and
+        retries. Connection errors and the status codes in
+        `RETRY_STATUS_CODES` are retried with an exponential
+        backoff. Read errors and status codes are only retried for
+        idempotent methods, so a POST is never sent twice.
+
+        Parameters
+        ----------
+        pool_size: int
+            The number of connections to keep open per host
+
+        connect_timeout: float
+            The connect timeout in seconds
+
+        read_timeout: float
+            The read timeout in seconds
+
+        retries: int
+            The number of retries
+
+        retry_backoff: float
+            The backoff factor for the retries in seconds
+
+        Returns
+        -------
+        TimeoutSession
+            The session
+    """
+    session = TimeoutSession(timeout=(connect_timeout, read_timeout))
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=retry_backoff,
+        status_forcelist=RETRY_STATUS_CODES,
+        raise_on_status=False)
+    adapter = HTTPAdapter(
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        max_retries=retry)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
@@ -0,0 +1,173 @@
+""" Module with the interactive shell. The shell runs the commands
+    of the CLI in one process, so the configuration, the PyNetBox
+    object and the HTTP connections are reused between commands. """
+import logging
+import os
+import shlex
+from typing import Optional
+import click
+from .cli import cli, console
+from .nbcli import nbcli_object, NBCLI_DATA_DIR
+
+NBCLI_HISTORY_FILE = f'{NBCLI_DATA_DIR}/history'
+
+# Commands that end the shell
+EXIT_COMMANDS = ('exit', 'quit')
+
+logger = logging.getLogger('shell')
+
+
+def get_completions(line: str, text: str) -> list:
+    """ Get the completions for the word that is being typed, based
+        on the commands and options of the CLI
+
+        Parameters
+        ----------
+        line: str
+            The complete line so far
+
+        text: str
+            The word that is being completed
+
+        Returns
+        -------
+        list
+            The possible completions
+    """
+    try:
+        words = shlex.split(line[:len(line) - len(text)])
+    except ValueError:
+        return []
+
+    # Walk the command tree for the words that are done
+    ctx = click.Context(cli)
+    command = cli
+    for word in words:
+        if isinstance(command, click.Group) and not word.startswith('-'):
+            subcommand = command.get_command(ctx, word)
+            if subcommand is not None:
+                command = subcommand
+
+    if text.startswith('-'):
+        candidates = [
+            option for param in command.params if isinstance(param, click.Option)
+            for option in param.opts + param.secondary_opts]
+    elif isinstance(command, click.Group):
+        candidates = command.list_commands(ctx)
+        if command is cli:
+            candidates = [*candidates, *EXIT_COMMANDS]
+    else:
+        candidates = []
+    return [candidate for candidate in candidates if candidate.startswith(text)]
+
+
+def setup_readline() -> Optional[object]:
+    """ Configure readline for history and tab completion, if
+        readline is available
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        Optional[object]
+            The readline module, or None
+    """
+    try:
+        import readline
+    except ImportError:
+        logger.debug('readline is not available; no history and completion')
+        return None
+
+    def complete(text: str, state: int) -> Optional[str]:
+        completions = get_completions(readline.get_line_buffer(), text)
+        return completions[state] + ' ' if state < len(completions) else None
+
+    readline.set_completer(complete)
+    readline.set_completer_delims(' \t\n')
+    if 'libedit' in (readline.__doc__ or ''):
+        readline.parse_and_bind('bind ^I rl_complete')
+    else:
+        readline.parse_and_bind('tab: complete')
+
+    try:
+        readline.read_history_file(NBCLI_HISTORY_FILE)
+    except (FileNotFoundError, OSError):
+        pass
+    return readline
+
+
+def run_command(args: list) -> None:
+    """ Run a command of the CLI without leaving the shell
+
+        Parameters
+        ----------
+        args: list
+            The arguments for the CLI
+
+        Returns
+        -------
+        None
+    """
+    try:
+        cli.main(args=args, prog_name='nbcli', standalone_mode=False)
+    except click.exceptions.Abort:
+        console.print('[error]Aborted[/]')
+    except click.ClickException as error:
+        error.show()
+    except KeyboardInterrupt:
+        console.print('[error]Interrupted[/]')
+    except Exception as error:
+        logger.debug('Command failed', exc_info=True)
+        console.print(f'[error]{type(error).__name__}: {error}[/]')
+
+
+@click.command(help='Interactive shell that keeps the connection open')
+def shell() -> None:
+    """ Start an interactive shell. Every line is run as a command
+        of the CLI, like `organization sites list`. The PyNetBox
+        object is created once and only created again when the
+        active instance changes.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        None
+    """
+    readline = setup_readline()
+    console.print('Type a command, like [item_identification]status[/], '
+                  'or [item_identification]exit[/] to leave the shell')
+
+    try:
+        while True:
+            try:
+                line = input(f'nbcli ({nbcli_object.config["active_instance"]})> ')
+            except KeyboardInterrupt:
+                console.print()
+                continue
+            except EOFError:
+                console.print()
+                break
+
+            try:
+                args = shlex.split(line)
+            except ValueError as error:
+                console.print(f'[error]{error}[/]')
+                continue
+
+            if len(args) == 0:
+                continue
+            if args[0] in EXIT_COMMANDS:
+                break
+            if args[0] == 'shell':
+                console.print('[error]Already in the shell[/]')
+                continue
+            run_command(args)
+    finally:
+        if readline is not None:
+            os.makedirs(NBCLI_DATA_DIR, exist_ok=True)
+            readline.write_history_file(NBCLI_HISTORY_FILE)
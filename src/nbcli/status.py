@@ -1,24 +1,78 @@
-from .cli import cli, tables, console
+import click
+from .cli import tables, console
 from .nbcli import nbcli_object
+from .instances import get_instance_names, instance_options, print_errors, run_on_instances
 from rich.table import Table
 
 
-@cli.command(help='NetBox status')
-def status():
+def print_instances(results: list) -> None:
+    """ Method that prints the status of several instances in one
+        table, with a row per instance. The errors of instances that
+        failed are printed after the table.
+
+        Parameters
+        ----------
+        results: list
+            The results of `run_on_instances`
+
+        Returns
+        -------
+        None
+    """
+    # Create a table for the output
+    table = Table(**tables)
+    table.add_column('Instance', style='item_identification')
+    table.add_column('NetBox version')
+    table.add_column('Django version')
+    table.add_column('Python version')
+    table.add_column('Plugins', justify='right')
+    table.add_column('Status')
+
+    # Add the rows
+    for name, status, error in results:
+        if error is not None:
+            table.add_row(name, '', '', '', '', '[error]Failed[/]')
+            continue
+        table.add_row(
+            name,
+            status['netbox-version'],
+            status['django-version'],
+            status['python-version'],
+            str(len(status['plugins'])),
+            'OK')
+
+    # Print the table
+    console.print(table)
+    print_errors(results)
+
+
+@click.command(help='NetBox status')
+@instance_options
+def status(instances: tuple, all_instances: bool):
     """ Method that returns the status of NetBox, like the
         version, installed apps and plugins.
 
         Parameters
         ----------
-        None
+        instances: tuple
+            The instances to query instead of the active instance
+
+        all_instances: bool
+            If set, all instances are queried
 
         Returns
         -------
         None
     """
-    # Create the object
-    nbcli_object.create_pynetbox_object()
-    status = nbcli_object.nb.status()
+    # Query the chosen instances at the same time
+    instance_names = get_instance_names(instances, all_instances)
+    if instance_names:
+        print_instances(run_on_instances(
+            instance_names, lambda: nbcli_object.get_backend().status()))
+        return
+
+    # Get the status
+    status = nbcli_object.get_backend().status()
 
     # Create a table for the output
     table = Table(show_header=False, **tables)
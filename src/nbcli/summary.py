@@ -0,0 +1,253 @@
+""" Module with count-only queries: the `--count` mode of the list
+    commands and the `summary` command. NetBox returns the total
+    count with every page, so a count is one request for one
+    resource, no matter how many resources match. """
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+import click
+from rich.table import Table
+from .nbcli import nbcli_object
+from .cli import console, options, tables
+from .fetch import count_records, get_field_filters
+from .bulk import parse_assignments
+from .exceptions import BulkInputError, MirrorError, NetBoxRequestError
+from .instances import (
+    INSTANCE_COLUMN, get_instance_names, instance_options, print_errors, run_on_instances)
+from .mirror import get_mirror
+from .render import print_rows
+
+# The endpoints for the `summary` command, with a title and the
+# status values that are counted
+SUMMARY_ENDPOINTS = [
+    ('Regions', 'dcim.regions', ()),
+    ('Sites', 'dcim.sites', (
+        'planned', 'staging', 'active', 'decommissioning', 'retired')),
+    ('Racks', 'dcim.racks', (
+        'reserved', 'available', 'planned', 'active', 'deprecated')),
+    ('Devices', 'dcim.devices', (
+        'offline', 'active', 'planned', 'staged', 'failed', 'inventory', 'decommissioning')),
+    ('Virtual machines', 'virtualization.virtual_machines', (
+        'offline', 'active', 'planned', 'staged', 'failed', 'decommissioning')),
+    ('Prefixes', 'ipam.prefixes', ('container', 'active', 'reserved', 'deprecated')),
+    ('IP addresses', 'ipam.ip_addresses', ('active', 'reserved', 'deprecated', 'dhcp', 'slaac')),
+    ('VLANs', 'ipam.vlans', ('active', 'reserved', 'deprecated')),
+    ('Circuits', 'circuits.circuits', (
+        'planned', 'provisioning', 'active', 'offline', 'deprovisioning', 'decommissioned')),
+    ('Tenants', 'tenancy.tenants', ())
+]
+
+# The column for the `--count` mode with several instances
+COUNT_COLUMN = {'key': 'count', 'header': 'Count', 'justify': 'right'}
+
+logger = logging.getLogger('summary')
+
+
+def get_count(endpoint: str, filters: dict, offline: bool = False) -> int:
+    """ Get the number of resources that match filters on the
+        active instance
+
+        Parameters
+        ----------
+        endpoint: str
+            The endpoint, like `dcim.sites`
+
+        filters: dict
+            The filters for the resources
+
+        offline: bool
+            If set, the rows in the local mirror are counted
+
+        Returns
+        -------
+        int
+            The number of resources
+    """
+    if offline:
+        return get_mirror().count(endpoint, filters)
+    return count_records(endpoint, filters)
+
+
+def print_count(endpoint: str, filters: dict, offline: bool, instance_names: list) -> None:
+    """ Print the number of resources that match filters for the
+        `--count` mode of the list commands. For one instance only
+        the number is printed; for several instances a row per
+        instance.
+
+        Parameters
+        ----------
+        endpoint: str
+            The endpoint, like `dcim.sites`
+
+        filters: dict
+            The filters for the resources
+
+        offline: bool
+            If set, the rows in the local mirror are counted
+
+        instance_names: list
+            The instances to count on, or an empty list for the
+            active instance
+
+        Returns
+        -------
+        None
+    """
+    if not instance_names:
+        try:
+            console.print(get_count(endpoint, filters, offline))
+        except MirrorError as error:
+            console.print(f'[error]{error}[/]')
+        return
+
+    results = run_on_instances(instance_names, lambda: get_count(endpoint, filters, offline))
+    print_errors(results)
+    rows = [
+        {'instance': name, 'count': count}
+        for name, count, error in results if error is None]
+    if options['output'] == 'table' and len(rows) > 1:
+        rows.append({'instance': 'Total', 'count': sum(row['count'] for row in rows)})
+    print_rows([INSTANCE_COLUMN, COUNT_COLUMN], rows)
+
+
+def count_summary(statuses: bool, filters: dict, workers: Optional[int]) -> list:
+    """ Count the resources of all endpoints in `SUMMARY_ENDPOINTS`
+        on the active instance. All counts are requested at the same
+        time, so this takes about one round trip.
+
+        Parameters
+        ----------
+        statuses: bool
+            If set, the resources are also counted per status
+
+        filters: dict
+            Filters for all counts
+
+        workers: Optional[int]
+            The number of counts that are requested at the same
+            time. By default, as many as the connection pool of the
+            instance holds.
+
+        Returns
+        -------
+        list
+            A tuple per endpoint with the title, the total and a
+            dict with the count per status. Counts that NetBox
+            refused, for example for an endpoint the token has no
+            access to, are None.
+    """
+    queries = [
+        (endpoint, None) for _, endpoint, _ in SUMMARY_ENDPOINTS]
+    if statuses:
+        queries += [
+            (endpoint, status)
+            for _, endpoint, endpoint_statuses in SUMMARY_ENDPOINTS
+            for status in endpoint_statuses]
+
+    # Create the backend and look up the API version before the
+    # threads use them
+    nbcli_object.get_backend()
+    get_field_filters(SUMMARY_ENDPOINTS[0][1], ['id'])
+
+    def count(query: tuple) -> Optional[int]:
+        endpoint, status = query
+        try:
+            return count_records(
+                endpoint, {**filters, 'status': status} if status else filters)
+        except NetBoxRequestError as error:
+            # Errors without a response mean NetBox is unreachable
+            if error.status_code is None:
+                raise
+            logger.debug(f'Counting "{endpoint}" failed: {error}')
+            return None
+
+    # More threads than connections in the pool would only wait
+    pool_size = nbcli_object.get_session_settings()['pool_size']
+    workers = min(workers or pool_size, len(queries))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        counts = dict(zip(queries, executor.map(nbcli_object.bind_instance(count), queries)))
+
+    return [
+        (title, counts[(endpoint, None)], {
+            status: counts[(endpoint, status)]
+            for status in endpoint_statuses if (endpoint, status) in counts})
+        for title, endpoint, endpoint_statuses in SUMMARY_ENDPOINTS]
+
+
+@click.command(help='Count the objects in NetBox per type and status')
+@click.option('--statuses/--no-statuses', default=True, show_default=True,
+              help='Also count the objects per status')
+@click.option('--filter', 'filters', type=str, multiple=True,
+              help='FIELD=VALUE filter for all counts, like tenant=acme; can be repeated')
+@click.option('--workers', type=click.IntRange(min=1),
+              help='Number of counts to request at the same time; by default the pool size')
+@instance_options
+def summary(statuses: bool,
+            filters: tuple,
+            workers: Optional[int],
+            instances: tuple,
+            all_instances: bool) -> None:
+    """ Show the number of objects per type, and per status, in one
+        table. The counts are requested at the same time.
+
+        Parameters
+        ----------
+        statuses: bool
+            If set, the objects are also counted per status
+
+        filters: tuple
+            `FIELD=VALUE` filters for all counts
+
+        workers: Optional[int]
+            The number of counts to request at the same time
+
+        instances: tuple
+            The instances to query instead of the active instance
+
+        all_instances: bool
+            If set, all instances are queried
+
+        Returns
+        -------
+        None
+    """
+    try:
+        filters = parse_assignments(filters)
+    except BulkInputError as error:
+        console.print(f'[error]{error}[/]')
+        return
+
+    def run() -> list:
+        return count_summary(statuses, filters, workers)
+
+    # Query the chosen instances at the same time, or the active
+    # instance
+    instance_names = get_instance_names(instances, all_instances)
+    if instance_names:
+        results = run_on_instances(instance_names, run)
+    else:
+        results = [(None, run(), None)]
+
+    # Create a table for the output
+    table = Table(**tables)
+    if instance_names:
+        table.add_column('Instance', style='item_selected')
+    table.add_column('Object', style='item_identification')
+    table.add_column('Total', justify='right')
+    if statuses:
+        table.add_column('By status')
+
+    # Add the rows; statuses without objects are left out
+    for name, counts, error in results:
+        if error is not None:
+            continue
+        for title, total, status_counts in counts:
+            row = [title, '-' if total is None else str(total)]
+            if statuses:
+                row.append(', '.join(
+                    f'{status} {count}' for status, count in status_counts.items() if count))
+            table.add_row(*([name] if instance_names else []), *row)
+
+    # Print the table
+    console.print(table)
+    print_errors(results)
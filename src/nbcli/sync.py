@@ -0,0 +1,114 @@
+import logging
+import time
+from typing import Optional
+import click
+from rich.table import Table
+from .cli import console, tables
+from .nbcli import nbcli_object
+from .fetch import fetch_records, get_field_filters
+from .mirror import Mirror, MIRROR_ENDPOINTS, get_mirror
+from .render import to_row
+
+logger = logging.getLogger('sync')
+
+
+def sync_endpoint(mirror: Mirror, endpoint_name: str, full: bool, workers: int) -> tuple:
+    """ Bring the mirror of one endpoint up to date. The first sync
+        retrieves all resources. Later syncs only retrieve the
+        resources that changed since the newest `last_updated` in
+        the mirror, and the IDs of all resources to find the ones
+        that were deleted.
+
+        Parameters
+        ----------
+        mirror: Mirror
+            The mirror to update
+
+        endpoint_name: str
+            The name of the endpoint, like `dcim.sites`
+
+        full: bool
+            If set, all resources are retrieved
+
+        workers: int
+            The number of pages to retrieve at the same time
+
+        Returns
+        -------
+        tuple
+            The mode, the number of updated rows and the number of
+            deleted rows
+    """
+    state = mirror.get_state(endpoint_name)
+    full = full or state is None or state[0] is None
+
+    # Resources that are updated at the same moment as the newest
+    # one in the mirror are retrieved again; storing them twice is
+    # harmless
+    filters = {} if full else {'last_updated__gte': state[0]}
+    logger.debug(f'Syncing "{endpoint_name}" with filters {filters}')
+    updated = mirror.store(
+        endpoint_name,
+        (to_row(resource) for resource in fetch_records(endpoint_name, filters, workers=workers)),
+        full=full)
+
+    deleted = 0
+    if not full:
+        id_filters = get_field_filters(endpoint_name, ['id'])
+        ids = {
+            resource['id']
+            for resource in fetch_records(endpoint_name, id_filters, workers=workers)}
+        deleted = mirror.remove_missing(endpoint_name, ids)
+
+    return 'full' if full else 'incremental', updated, deleted
+
+
+@click.command(help='Copy sites and regions to a local database for --offline')
+@click.argument('endpoints', nargs=-1, type=click.Choice(MIRROR_ENDPOINTS))
+@click.option('--full', is_flag=True,
+              help='Retrieve all objects instead of only the changed ones')
+@click.option('--workers', type=int,
+              help='Number of pages to retrieve at the same time; overrides the instance setting')
+def sync(endpoints: tuple, full: bool, workers: Optional[int]) -> None:
+    """ Copy resources of the active instance to the local mirror
+
+        Parameters
+        ----------
+        endpoints: tuple
+            The endpoints to sync. If not given, all mirrored
+            endpoints are synced.
+
+        full: bool
+            If set, all resources are retrieved
+
+        workers: Optional[int]
+            The number of pages to retrieve at the same time
+
+        Returns
+        -------
+        None
+    """
+    if workers is None:
+        workers = nbcli_object.get_instance_setting('workers')
+
+    mirror = get_mirror()
+
+    # Create a table for the output
+    table = Table(**tables)
+    table.add_column('Endpoint', style='item_identification')
+    table.add_column('Mode')
+    table.add_column('Updated', justify='right')
+    table.add_column('Deleted', justify='right')
+    table.add_column('Total', justify='right')
+    table.add_column('Time', justify='right')
+
+    for endpoint_name in endpoints or MIRROR_ENDPOINTS:
+        started = time.perf_counter()
+        mode, updated, deleted = sync_endpoint(mirror, endpoint_name, full, workers)
+        table.add_row(
+            endpoint_name, mode, str(updated), str(deleted),
+            str(mirror.count(endpoint_name)),
+            f'{time.perf_counter() - started:.2f}s')
+
+    # Print the table
+    console.print(table)
@@ -0,0 +1,403 @@
+""" Module that records where the time of a command goes. With the
+    global `--timings` option, every HTTP request and the time spent
+    in loading the configuration, creating the client, retrieving
+    pages, decoding them and rendering the output is recorded. A
+    summary is printed to stderr when the command ends, and the
+    events can be written as a Chrome trace for chrome://tracing or
+    Perfetto. When the option is not set, recording is a no-op. """
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterable, Iterator, Optional
+
+# Waits for rows that are shorter than this are not added to the
+# trace as separate events, but they are counted
+MIN_FETCH_EVENT = 0.0005
+
+# The number of requests that is shown in the summary. If there are
+# more, the slowest requests are shown.
+SUMMARY_REQUESTS = 10
+
+logger = logging.getLogger('timings')
+
+
+class Timings:
+    def __init__(self) -> None:
+        """ The initiator sets default values
+
+            Parameters
+            ----------
+            None
+
+            Returns
+            -------
+            None
+        """
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.reset()
+
+    def reset(self) -> None:
+        """ Method to remove all recorded events
+
+            Parameters
+            ----------
+            None
+
+            Returns
+            -------
+            None
+        """
+        self.start = time.perf_counter()
+        self.spans = []
+        self.requests = []
+        self.fetch_wait = 0.0
+
+    def enable(self) -> None:
+        """ Method to start recording
+
+            Parameters
+            ----------
+            None
+
+            Returns
+            -------
+            None
+        """
+        self.reset()
+        self.enabled = True
+
+    @contextmanager
+    def span(self, name: str, **args) -> Iterator[None]:
+        """ Context manager that records the time of a block
+
+            Parameters
+            ----------
+            name: str
+                The name of the block, like `render`
+
+            **args: dict
+                Extra values for the trace
+
+            Returns
+            -------
+            Iterator[None]
+                Nothing; the time is recorded when the block ends
+        """
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_span(name, start, time.perf_counter() - start, **args)
+
+    def add_span(self, name: str, start: float, duration: float, **args) -> None:
+        """ Method to record a block
+
+            Parameters
+            ----------
+            name: str
+                The name of the block
+
+            start: float
+                The `time.perf_counter` value at the start
+
+            duration: float
+                The duration in seconds
+
+            **args: dict
+                Extra values for the trace
+
+            Returns
+            -------
+            None
+        """
+        with self.lock:
+            self.spans.append({
+                'name': name,
+                'start': start,
+                'duration': duration,
+                'thread': threading.get_ident(),
+                'args': args})
+
+    def add_request(self,
+                    method: str,
+                    url: str,
+                    status: Optional[int],
+                    start: float,
+                    latency: float,
+                    size: int) -> None:
+        """ Method to record an HTTP request
+
+            Parameters
+            ----------
+            method: str
+                The HTTP method
+
+            url: str
+                The URL with the query string
+
+            status: Optional[int]
+                The status code, or None if there was no response
+
+            start: float
+                The `time.perf_counter` value at the start
+
+            latency: float
+                The time until the complete response was read, in
+                seconds
+
+            size: int
+                The size of the response body in bytes
+
+            Returns
+            -------
+            None
+        """
+        self.local.latency = self.get_thread_latency() + latency
+        with self.lock:
+            self.requests.append({
+                'method': method,
+                'url': url,
+                'status': status,
+                'start': start,
+                'latency': latency,
+                'bytes': size,
+                'thread': threading.get_ident()})
+
+    def get_thread_latency(self) -> float:
+        """ Method to get the total latency of the requests that
+            were sent from the current thread. Backends that block
+            use it to tell the network time from the decode time.
+
+            Parameters
+            ----------
+            None
+
+            Returns
+            -------
+            float
+                The latency in seconds
+        """
+        return getattr(self.local, 'latency', 0.0)
+
+    def measure_rows(self, rows: Iterable[dict]) -> Iterator[dict]:
+        """ Wrap rows to record how long the consumer waits for them.
+            Rows come from generators that retrieve the pages, so
+            this is the time that rendering waits for NetBox.
+
+            Parameters
+            ----------
+            rows: Iterable[dict]
+                The rows
+
+            Returns
+            -------
+            Iterator[dict]
+                The same rows
+        """
+        if not self.enabled:
+            yield from rows
+            return
+
+        iterator = iter(rows)
+        while True:
+            start = time.perf_counter()
+            try:
+                row = next(iterator)
+            except StopIteration:
+                break
+            finally:
+                wait = time.perf_counter() - start
+                self.fetch_wait += wait
+                if wait >= MIN_FETCH_EVENT:
+                    self.add_span('fetch', start, wait)
+            yield row
+
+    def get_total(self, name: str) -> float:
+        """ Method to get the total time of the blocks with a name
+
+            Parameters
+            ----------
+            name: str
+                The name of the blocks
+
+            Returns
+            -------
+            float
+                The total time in seconds
+        """
+        return sum(span['duration'] for span in self.spans if span['name'] == name)
+
+    def get_nested(self, name: str, outer: str) -> float:
+        """ Method to get the total time of the blocks with a name
+            that ran inside blocks with another name
+
+            Parameters
+            ----------
+            name: str
+                The name of the inner blocks
+
+            outer: str
+                The name of the outer blocks
+
+            Returns
+            -------
+            float
+                The total time in seconds
+        """
+        outer_spans = [span for span in self.spans if span['name'] == outer]
+        return sum(
+            span['duration'] for span in self.spans
+            if span['name'] == name and any(
+                outer_span['start'] <= span['start'] <= outer_span['start'] + outer_span['duration']
+                for outer_span in outer_spans))
+
+    def print_summary(self) -> None:
+        """ Method to print the summary to stderr
+
+            Parameters
+            ----------
+            None
+
+            Returns
+            -------
+            None
+        """
+        import statistics
+        from rich.table import Table
+        from .cli import error_console as console, tables
+        total = time.perf_counter() - self.start
+
+        # Time per phase. Rendering waits for the pages, so the wait
+        # is subtracted from the output time. The client is usually
+        # created while the first row is retrieved, so that time is
+        # subtracted from the wait.
+        phases = [
+            ('Config load', self.get_total('config load')),
+            ('Client creation', self.get_total('client creation')),
+            ('Fetch (wait for rows)',
+             self.fetch_wait - self.get_nested('client creation', 'fetch')),
+            ('Decode (JSON and records)', self.get_total('decode')),
+            ('Render', self.get_total('output') - self.fetch_wait),
+            ('Total', total)]
+        table = Table(title='Timings', **tables)
+        table.add_column('Phase', style='item_identification')
+        table.add_column('Time', justify='right')
+        for phase, duration in phases:
+            table.add_row(phase, f'{duration * 1000:.1f} ms')
+        console.print(table)
+
+        # Requests
+        latencies = [request['latency'] for request in self.requests]
+        table = Table(show_header=False, **tables)
+        table.add_column('Setting', style='item_identification')
+        table.add_column('Value', justify='right')
+        table.add_row('Requests', str(len(self.requests)))
+        table.add_row('Pages', str(len([span for span in self.spans if span['name'] == 'page'])))
+        table.add_row('Bytes', f'{sum(request["bytes"] for request in self.requests):,}')
+        if latencies:
+            table.add_row('Latency total', f'{sum(latencies) * 1000:.1f} ms')
+            table.add_row('Latency median', f'{statistics.median(latencies) * 1000:.1f} ms')
+            table.add_row('Latency max', f'{max(latencies) * 1000:.1f} ms')
+        console.print(table)
+
+        if not self.requests:
+            return
+        requests = self.requests
+        title = 'Requests'
+        if len(requests) > SUMMARY_REQUESTS:
+            requests = sorted(
+                requests, key=lambda request: request['latency'], reverse=True)[:SUMMARY_REQUESTS]
+            title = f'Slowest {SUMMARY_REQUESTS} requests'
+        table = Table(title=title, **tables)
+        table.add_column('Method')
+        table.add_column('URL', style='item_identification', overflow='fold')
+        table.add_column('Status', justify='right')
+        table.add_column('Latency', justify='right')
+        table.add_column('Bytes', justify='right')
+        for request in sorted(requests, key=lambda request: request['start']):
+            table.add_row(
+                request['method'],
+                request['url'],
+                str(request['status'] or '-'),
+                f'{request["latency"] * 1000:.1f} ms',
+                f'{request["bytes"]:,}')
+        console.print(table)
+
+    def write_trace(self, path: str) -> None:
+        """ Method to write the events in the Chrome trace format.
+            Requests and blocks are complete events with times in
+            microseconds since the start of the recording.
+
+            Parameters
+            ----------
+            path: str
+                The file to write
+
+            Returns
+            -------
+            None
+        """
+        def to_microseconds(value: float) -> float:
+            return round(value * 1_000_000, 1)
+
+        events = [{
+            'name': span['name'],
+            'cat': 'nbcli',
+            'ph': 'X',
+            'ts': to_microseconds(span['start'] - self.start),
+            'dur': to_microseconds(span['duration']),
+            'pid': os.getpid(),
+            'tid': span['thread'],
+            'args': span['args']} for span in self.spans]
+        events += [{
+            'name': f'{request["method"]} {request["url"]}',
+            'cat': 'http',
+            'ph': 'X',
+            'ts': to_microseconds(request['start'] - self.start),
+            'dur': to_microseconds(request['latency']),
+            'pid': os.getpid(),
+            'tid': request['thread'],
+            'args': {
+                'method': request['method'],
+                'url': request['url'],
+                'status': request['status'],
+                'bytes': request['bytes']}} for request in self.requests]
+
+        with open(path, 'w') as trace_file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, trace_file)
+        logger.debug(f'Wrote {len(events)} events to "{path}"')
+
+    def finish(self, summary: bool, path: Optional[str] = None) -> None:
+        """ Method to stop recording and report the results
+
+            Parameters
+            ----------
+            summary: bool
+                If set, the summary is printed
+
+            path: Optional[str]
+                If given, the trace is written to this file
+
+            Returns
+            -------
+            None
+        """
+        if not self.enabled:
+            return
+        self.enabled = False
+        if summary:
+            self.print_summary()
+        if path:
+            self.write_trace(path)
+
+
+# The recorder for the process
+timings = Timings()
@@ -0,0 +1,259 @@
+""" Module for the `--watch` mode of the list commands. The rows are
+    retrieved once, and after that every poll only asks NetBox for
+    the resources that changed since the newest `last_updated` that
+    was seen. Deleted resources are found by comparing the IDs that
+    match the filters, which is much cheaper than retrieving the
+    rows again. """
+import logging
+import time
+from typing import Callable, Iterator, Optional
+import click
+from rich.table import Table
+from .cli import console
+from .fetch import fetch_records, get_field_filters, get_newest
+from .render import create_table, get_cells
+
+# The number of seconds between polls when `--watch` has no value
+DEFAULT_WATCH_INTERVAL = 10.0
+
+# Deleted resources are looked for every this many polls
+DELETE_CHECK_POLLS = 6
+
+logger = logging.getLogger('watch')
+
+
+def watch_option(function: Callable) -> Callable:
+    """ Decorator that adds the `--watch [SECONDS]` option to a
+        list command
+
+        Parameters
+        ----------
+        function: Callable
+            The command function
+
+        Returns
+        -------
+        Callable
+            The command function with the option
+    """
+    return click.option(
+        '--watch', type=click.FloatRange(min=1), is_flag=False,
+        flag_value=DEFAULT_WATCH_INTERVAL, default=None,
+        help=f'Keep polling for changes every SECONDS (default {DEFAULT_WATCH_INTERVAL:g}); '
+             'only changed objects are retrieved')(function)
+
+
+class Watcher:
+    def __init__(self,
+                 endpoint: str,
+                 filters: dict,
+                 fetch_rows: Callable[[dict], Iterator[dict]],
+                 workers: int) -> None:
+        """ The initiator sets default values
+
+            Parameters
+            ----------
+            endpoint: str
+                The endpoint, like `dcim.sites`
+
+            filters: dict
+                The filters for the resources
+
+            fetch_rows: Callable[[dict], Iterator[dict]]
+                A function that retrieves the rows for filters. The
+                rows must have the `id` and `last_updated` fields.
+
+            workers: int
+                The number of pages to retrieve at the same time
+
+            Returns
+            -------
+            None
+        """
+        self.endpoint = endpoint
+        self.filters = filters
+        self.fetch_rows = fetch_rows
+        self.workers = workers
+        self.rows = {}
+        self.newest = None
+        self.polls = 0
+
+    def merge(self, rows: Iterator[dict]) -> set:
+        """ Method to merge rows into the state and move the
+            high-water mark
+
+            Parameters
+            ----------
+            rows: Iterator[dict]
+                The rows that were retrieved
+
+            Returns
+            -------
+            set
+                The IDs of the rows that are new or changed
+        """
+        changed = set()
+        for row in rows:
+            if self.rows.get(row['id']) != row:
+                self.rows[row['id']] = row
+                changed.add(row['id'])
+            self.newest = get_newest(self.newest, row.get('last_updated'))
+        return changed
+
+    def remove_deleted(self) -> set:
+        """ Method to remove the rows of resources that were deleted
+            or no longer match the filters. Only the IDs are
+            retrieved.
+
+            Parameters
+            ----------
+            None
+
+            Returns
+            -------
+            set
+                The IDs of the removed rows
+        """
+        ids = {
+            resource['id'] for resource in fetch_records(
+                self.endpoint,
+                {**self.filters, **get_field_filters(self.endpoint, ['id'])},
+                workers=self.workers)}
+        deleted = {row_id for row_id in self.rows if row_id not in ids}
+        for row_id in deleted:
+            del self.rows[row_id]
+        return deleted
+
+    def poll(self) -> tuple:
+        """ Method to bring the state up to date. The first poll
+            retrieves all rows. Later polls retrieve the resources
+            with a `last_updated` from the high-water mark on;
+            resources that were updated at the same moment as the
+            newest one are retrieved again, but only count as
+            changed if they differ.
+
+            Parameters
+            ----------
+            None
+
+            Returns
+            -------
+            tuple
+                The IDs of the changed rows and of the deleted rows
+        """
+        filters = self.filters
+        if self.polls and self.newest is not None:
+            filters = {**filters, 'last_updated__gte': self.newest}
+        logger.debug(f'Polling "{self.endpoint}" with filters {filters}')
+        changed = self.merge(self.fetch_rows(filters))
+
+        deleted = set()
+        if self.polls and self.polls % DELETE_CHECK_POLLS == 0:
+            deleted = self.remove_deleted()
+        self.polls += 1
+        return changed, deleted
+
+
+def create_watch_table(columns: list, rows: list, changed: set, title: str) -> Table:
+    """ Create the table for the watched rows. Rows that changed in
+        the last poll are highlighted.
+
+        Parameters
+        ----------
+        columns: list
+            The columns for the table
+
+        rows: list
+            The rows to show
+
+        changed: set
+            The IDs of the rows that changed in the last poll
+
+        title: str
+            The caption of the table
+
+        Returns
+        -------
+        Table
+            The table
+    """
+    table = create_table(columns, caption=title)
+    for row in rows:
+        table.add_row(
+            *get_cells(columns, row),
+            style='item_activated' if row['id'] in changed else None)
+    return table
+
+
+def watch_rows(endpoint: str,
+               filters: dict,
+               columns: list,
+               fetch_rows: Callable[[dict], Iterator[dict]],
+               workers: int,
+               interval: float) -> None:
+    """ Show the rows and keep them up to date until the user stops
+        with Ctrl+C. On a terminal, the table is updated in place;
+        otherwise the changed rows are printed after every poll.
+
+        Parameters
+        ----------
+        endpoint: str
+            The endpoint, like `dcim.sites`
+
+        filters: dict
+            The filters for the resources
+
+        columns: list
+            The columns to show
+
+        fetch_rows: Callable[[dict], Iterator[dict]]
+            A function that retrieves the rows for filters, with the
+            `id` and `last_updated` fields
+
+        workers: int
+            The number of pages to retrieve at the same time
+
+        interval: float
+            The number of seconds between polls
+
+        Returns
+        -------
+        None
+    """
+    from rich.live import Live
+
+    watcher = Watcher(endpoint, filters, fetch_rows, workers)
+
+    def get_title(changed: set, deleted: set) -> str:
+        return (
+            f'{len(watcher.rows)} rows, {len(changed)} changed, {len(deleted)} deleted '
+            f'at {time.strftime("%H:%M:%S")}')
+
+    try:
+        changed, deleted = watcher.poll()
+
+        # Without a terminal, only the changes are printed
+        if not console.is_terminal:
+            console.print(create_watch_table(
+                columns, [*watcher.rows.values()], set(), get_title(set(), deleted)))
+            while True:
+                time.sleep(interval)
+                changed, deleted = watcher.poll()
+                if changed:
+                    console.print(create_watch_table(
+                        columns, [watcher.rows[row_id] for row_id in changed],
+                        changed, get_title(changed, deleted)))
+                for row_id in sorted(deleted):
+                    console.print(f'[item_activated]Deleted ID {row_id}[/]')
+
+        with Live(create_watch_table(columns, [*watcher.rows.values()], set(),
+                                     get_title(set(), deleted)),
+                  console=console, auto_refresh=False) as live:
+            while True:
+                time.sleep(interval)
+                changed, deleted = watcher.poll()
+                live.update(create_watch_table(
+                    columns, [*watcher.rows.values()], changed,
+                    get_title(changed, deleted)), refresh=True)
+    except KeyboardInterrupt:
+        logger.debug(f'Watching "{endpoint}" stopped after {watcher.polls} polls')
@@ -0,0 +1,71 @@
+""" Shared setup for the tests. The data directory of nbcli is
+    derived from the home directory when the package is imported, so
+    the home directory is replaced before anything imports nbcli. """
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+os.environ['HOME'] = tempfile.mkdtemp(prefix='nbcli-tests-')
+sys.path.insert(0, str(ROOT / 'src'))
+sys.path.insert(0, str(ROOT / 'benchmarks'))
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture
+def netbox():
+    """ A fake NetBox with 20 sites that serves small pages, running
+        in a thread of the test process """
+    from fake_netbox import FakeNetBox, create_server
+
+    fake = FakeNetBox(sites=20, regions=4, related_per_site=1, max_page_size=5)
+    server = create_server(fake)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    fake.url = f'http://{server.server_address[0]}:{server.server_address[1]}/'
+    yield fake
+    server.shutdown()
+    server.server_close()
+
+
+def use_instance(netbox, backend: str):
+    """ Make an instance for the fake NetBox with a backend the active
+        instance, and remove the stored data after the test """
+    from nbcli import schema
+    from nbcli.nbcli import nbcli_object, NBCLI_CONFIG_FILE, NBCLI_DATA_DIR
+
+    host, port = netbox.url[len('http://'):-1].split(':')
+    config = {
+        'active_instance': 'test',
+        'instances': {'test': {
+            'server': host, 'port': int(port), 'base_path': '/', 'api_key': 'x',
+            'backend': backend, 'retries': 2, 'retry_backoff': 0}}}
+    with open(NBCLI_CONFIG_FILE, 'w') as config_file:
+        json.dump(config, config_file)
+    nbcli_object.config_dict = None
+    nbcli_object.backend_name = None
+    schema.models.clear()
+    yield backend
+    shutil.rmtree(NBCLI_DATA_DIR, ignore_errors=True)
+
+
+@pytest.fixture(params=['pynetbox', 'async'])
+def instance(request, netbox):
+    """ The active instance for the fake NetBox, with each REST
+        backend """
+    if request.param == 'async':
+        pytest.importorskip('httpx')
+    yield from use_instance(netbox, request.param)
+
+
+@pytest.fixture
+def graphql_instance(netbox):
+    """ The active instance for the fake NetBox with the GraphQL
+        backend """
+    yield from use_instance(netbox, 'graphql')
@@ -0,0 +1,81 @@
+""" Tests for the REST backends against the fake NetBox. Every test
+    runs with the pynetbox and the async backend. """
+import pytest
+
+from nbcli.exceptions import NetBoxRequestError
+from nbcli.nbcli import nbcli_object
+
+
+@pytest.fixture
+def backend(instance):
+    return nbcli_object.get_backend()
+
+
+def test_list_page(backend):
+    resources, count = backend.list_page('dcim.sites', {'status': 'active'}, 3, 2)
+    assert count == 20
+    assert [resource['name'] for resource in resources] == ['site3', 'site4', 'site5']
+
+
+def test_list_pages(backend, netbox):
+    # The fake returns pages of 5 sites
+    names = [resource['name'] for resource in backend.list('dcim.sites', {}, workers=2)]
+    assert names == [f'site{number}' for number in range(1, 21)]
+    assert netbox.get_stats()['methods']['GET'] == 4
+
+
+def test_list_max_results(backend):
+    resources = [*backend.list('dcim.sites', {}, max_results=7)]
+    assert [resource['id'] for resource in resources] == [*range(1, 8)]
+
+
+def test_count(backend):
+    assert backend.count('dcim.sites', {}) == 20
+    assert backend.count('dcim.sites', {'name': ['site1', 'site2', 'missing']}) == 2
+
+
+def test_create_update_delete(backend, netbox):
+    created = backend.create('dcim.sites', [
+        {'name': 'new1', 'slug': 'new1'}, {'name': 'new2', 'slug': 'new2'}])
+    ids = [resource['id'] for resource in created]
+    assert [netbox.data['dcim/sites'][resource_id]['name'] for resource_id in ids] == ['new1', 'new2']
+
+    backend.update('dcim.sites', [{'id': resource_id, 'description': 'x'} for resource_id in ids])
+    assert all(netbox.data['dcim/sites'][resource_id]['description'] == 'x' for resource_id in ids)
+
+    backend.update('dcim.sites', {'description': 'y'}, ids[0])
+    assert netbox.data['dcim/sites'][ids[0]]['description'] == 'y'
+
+    assert backend.delete('dcim.sites', ids)
+    assert all(resource_id not in netbox.data['dcim/sites'] for resource_id in ids)
+
+
+def test_get(backend):
+    assert backend.get('dcim.sites', 3)['name'] == 'site3'
+    assert backend.get('dcim.sites', name='site4')['id'] == 4
+    assert backend.get('dcim.sites', 999) is None
+
+
+def test_retry_server_errors(backend, netbox):
+    netbox.failures = 2
+    resources, count = backend.list_page('dcim.sites', {}, 5, 0)
+    assert count == 20
+    assert netbox.failures == 0
+    assert netbox.get_stats()['methods']['GET'] == 3
+
+
+def test_server_errors_after_retries(backend, netbox):
+    # The instance allows two retries
+    netbox.failures = 5
+    with pytest.raises(NetBoxRequestError) as error:
+        backend.count('dcim.sites', {})
+    assert error.value.status_code == 503
+    assert netbox.failures == 2
+
+
+def test_create_is_not_retried(backend, netbox):
+    netbox.failures = 1
+    with pytest.raises(NetBoxRequestError) as error:
+        backend.create('dcim.sites', [{'name': 'new', 'slug': 'new'}])
+    assert error.value.status_code == 503
+    assert 'new' not in netbox.names['dcim/sites']
@@ -0,0 +1,25 @@
+""" Tests for the bulk helpers against the fake NetBox """
+from nbcli.bulk import AMBIGUOUS_MESSAGE, process_chunk, resolve_ids
+
+
+def test_resolve_ids_pages(instance, netbox):
+    # The fake returns pages of 5 sites, so the 12 names need 3 pages
+    rows = [{'name': f'site{number}'} for number in range(1, 13)]
+    ids = resolve_ids('dcim.sites', [*rows, {'name': 'site1'}, {'id': 20, 'name': 'site20'}])
+    assert ids == {f'site{number}': number for number in range(1, 13)}
+    assert netbox.get_stats()['methods']['GET'] >= 3
+
+
+def test_resolve_ids_ambiguous(instance, netbox):
+    netbox.create('dcim/regions', {'name': 'region1', 'slug': 'region1-b'})
+    ids = resolve_ids('dcim.regions', [{'name': 'region1'}, {'name': 'region2'}])
+    assert ids == {'region1': None, 'region2': 2}
+
+
+def test_process_chunk_reports_ambiguous_names(instance, netbox):
+    netbox.create('dcim/regions', {'name': 'region1', 'slug': 'region1-b'})
+    rows = [{'name': 'region1'}, {'name': 'region2', 'description': 'x'}, {'name': 'missing'}]
+    results = process_chunk('dcim.regions', 'update', rows)
+    assert results == [(None, AMBIGUOUS_MESSAGE), (2, None), (None, 'Not found')]
+    assert netbox.data['dcim/regions'][2]['description'] == 'x'
+    assert netbox.data['dcim/regions'][1]['description'] != 'x'
@@ -0,0 +1,221 @@
+""" Tests for the GraphQL query builder and the GraphQL backend """
+import json
+
+import pytest
+
+from nbcli import schema
+from nbcli.backends import PynetboxBackend
+from nbcli.exceptions import GraphQLUnsupported
+from nbcli.graphql import (
+    convert_resource, get_filters, get_list_query, get_selection)
+from nbcli.nbcli import nbcli_object, NBCLI_CONFIG_FILE
+
+
+def scalar(type_name: str, is_list: bool = False) -> list:
+    return [is_list, 'SCALAR', type_name]
+
+
+# A model like `compile_introspection` returns it, with the filters
+# per lookup of NetBox 4.2 and the input objects of NetBox 4.3
+MODEL = {
+    'objects': {
+        'SiteType': {
+            'id': scalar('ID'), 'name': scalar('String'),
+            'status': [False, 'ENUM', 'SiteStatusEnum'],
+            'region': [False, 'OBJECT', 'RegionType'],
+            'devices': [True, 'OBJECT', 'DeviceType'],
+            'circuit_terminations': [True, 'OBJECT', 'DeviceType'],
+            'prefixes': [True, 'OBJECT', 'PrefixType']},
+        'RegionType': {
+            'id': scalar('ID'), 'name': scalar('String'), 'slug': scalar('String'),
+            'parent': [False, 'OBJECT', 'RegionType'],
+            'children': [True, 'OBJECT', 'RegionType'],
+            'sites': [True, 'OBJECT', 'SiteType']},
+        'DeviceType': {'id': scalar('ID'), 'name': scalar('String')},
+        'PrefixType': {'id': scalar('ID'), 'display': scalar('String')}},
+    'inputs': {
+        'SiteFilterV42': {
+            'name': scalar('String', True), 'name__ic': scalar('String', True),
+            'asn': scalar('Int'), 'region_id': scalar('Int', True),
+            'status': [True, 'ENUM', 'SiteStatusEnum'],
+            'region': [False, 'INPUT_OBJECT', 'StrLookup']},
+        'SiteFilter': {
+            'name': [False, 'INPUT_OBJECT', 'StrLookup'],
+            'id': [False, 'INPUT_OBJECT', 'IDLookup'],
+            'status': [False, 'INPUT_OBJECT', 'StatusLookup']},
+        'StrLookup': {
+            'exact': scalar('String'), 'i_contains': scalar('String'),
+            'in_list': scalar('String', True)},
+        'IDLookup': {'exact': scalar('ID'), 'gt': scalar('Int'), 'in_list': scalar('ID', True)},
+        'StatusLookup': {'exact': [False, 'ENUM', 'SiteStatusEnum']}},
+    'lists': {
+        name: {'type': 'SiteType', 'filters': 'SiteFilter', 'pagination': True}
+        for name in ('site_list', 'ip_address_list', 'prefix_list', 'facility_list')}}
+
+
+@pytest.mark.parametrize('endpoint, expected', [
+    ('dcim.sites', 'site_list'),
+    ('dcim.racks', None),
+    ('ipam.ip_addresses', 'ip_address_list'),
+    ('ipam.prefixes', 'prefix_list'),
+    ('dcim.facilities', 'facility_list')])
+def test_get_list_query(endpoint, expected):
+    if expected is None:
+        with pytest.raises(GraphQLUnsupported):
+            get_list_query(MODEL, endpoint)
+    else:
+        assert get_list_query(MODEL, endpoint) == expected
+
+
+def test_get_list_query_es_plural():
+    model = {'lists': {'address_list': {}}}
+    assert get_list_query(model, 'dcim.addresses') == 'address_list'
+
+
+def test_get_filters_per_lookup():
+    filters = get_filters(MODEL, 'SiteFilterV42', {
+        'name__ic': 'dc', 'asn': '65000', 'region_id': ['1', '2']})
+    assert filters == {'name__ic': ['dc'], 'asn': 65000, 'region_id': [1, 2]}
+
+
+def test_get_filters_per_lookup_errors():
+    with pytest.raises(GraphQLUnsupported):
+        get_filters(MODEL, 'SiteFilterV42', {'status': 'active'})
+    with pytest.raises(GraphQLUnsupported):
+        get_filters(MODEL, 'SiteFilterV42', {'asn': ['1', '2']})
+    with pytest.raises(GraphQLUnsupported):
+        get_filters(MODEL, 'SiteFilterV42', {'facility': 'x'})
+    with pytest.raises(GraphQLUnsupported):
+        get_filters(MODEL, None, {'name': 'x'})
+    assert get_filters(MODEL, None, {}) == {}
+
+
+def test_get_filters_per_lookup_input_object():
+    # A field that is an input object in the old filters gets the
+    # exact lookup
+    assert get_filters(MODEL, 'SiteFilterV42', {'region': 'r1'}) == {'region': {'exact': 'r1'}}
+
+
+def test_get_filters_input_objects():
+    filters = get_filters(MODEL, 'SiteFilter', {
+        'name__ic': 'dc', 'id': ['1', '2'], 'id__gt': '5'})
+    assert filters == {'name': {'i_contains': 'dc'}, 'id': {'gt': 5}}
+    assert get_filters(MODEL, 'SiteFilter', {'id': ['1', '2']}) == {'id': {'in_list': ['1', '2']}}
+    assert get_filters(MODEL, 'SiteFilter', {'name': 'a'}) == {'name': {'exact': 'a'}}
+
+
+def test_get_filters_input_object_errors():
+    with pytest.raises(GraphQLUnsupported):
+        get_filters(MODEL, 'SiteFilter', {'status': 'active'})
+    with pytest.raises(GraphQLUnsupported):
+        get_filters(MODEL, 'SiteFilter', {'name__isw': 'a'})
+    with pytest.raises(GraphQLUnsupported):
+        get_filters(MODEL, 'SiteFilter', {'id__ic': '1'})
+
+
+@pytest.mark.parametrize('type_name, field', [
+    ('SiteType', 'device_count'),
+    ('SiteType', 'circuit_count'),
+    ('RegionType', 'site_count')])
+def test_get_selection_counts(type_name, field):
+    # Counts are annotated by the REST API
+    with pytest.raises(GraphQLUnsupported):
+        get_selection(MODEL, type_name, ['id', field])
+
+
+def test_get_selection_related():
+    selection = get_selection(MODEL, 'SiteType', ['name', 'region', 'region.parent.slug'])
+    assert selection == 'name region { id name parent { id name slug } }'
+    assert get_selection(MODEL, 'SiteType', ['prefixes']) == 'prefixes { id display }'
+    with pytest.raises(GraphQLUnsupported):
+        get_selection(MODEL, 'SiteType', ['name.first'])
+
+
+def test_convert_resource():
+    labels = {'status': {'active': 'Active', 'planned': 'Planned'}}
+    resource = convert_resource({
+        'id': '3', 'status': 'STATUS_ACTIVE', 'region': {'id': '4', 'status': 'active'}}, labels)
+    assert resource == {
+        'id': 3, 'status': {'value': 'active', 'label': 'Active'},
+        'region': {'id': 4, 'status': 'active'}}
+    assert convert_resource({'status': 'planned'}, labels)['status'] == {
+        'value': 'planned', 'label': 'Planned'}
+    assert convert_resource({'status': 'OTHER'}, labels)['status'] == {
+        'value': 'other', 'label': 'OTHER'}
+
+
+@pytest.fixture
+def backend(graphql_instance, netbox):
+    backend = nbcli_object.get_backend()
+    backend.get_graphql_model()
+    backend.get_labels('dcim.sites')
+    netbox.reset_stats()
+    return backend
+
+
+def test_backend_list_page(backend, netbox):
+    resources, count = backend.list_page(
+        'dcim.sites', {'fields': 'id,name,status,region', 'name__ic': 'site1'}, 5, 0)
+    assert count == 11
+    site = netbox.data['dcim/sites'][1]
+    assert resources[0] == {
+        'id': 1, 'name': 'site1', 'status': site['status'],
+        'region': {'id': site['region']['id'], 'name': site['region']['name'],
+                   'display': site['region']['display']}}
+    # One query and one request for the count
+    assert netbox.get_stats()['methods'] == {'POST': 1, 'GET': 1}
+
+
+def test_backend_list_one_page(backend, netbox):
+    resources = [*backend.list('dcim.sites', {'fields': 'id,name'}, max_results=3)]
+    assert resources == [{'id': 1, 'name': 'site1'}, {'id': 2, 'name': 'site2'}, {'id': 3, 'name': 'site3'}]
+    assert netbox.get_stats()['methods'] == {'POST': 1}
+
+
+def test_backend_rest_fallback(backend, netbox):
+    # Region counts include the sites of the child regions, so they
+    # come from the REST API
+    resources, count = backend.list_page('dcim.regions', {'fields': 'id,name,site_count'}, 2, 0)
+    assert count == 4
+    assert [resource['site_count'] for resource in resources] == [
+        netbox.data['dcim/regions'][resource_id]['site_count'] for resource_id in (1, 2)]
+    assert netbox.get_stats()['methods'] == {'GET': 1}
+
+
+def test_backend_counts(backend, netbox):
+    # Counts come from the REST API, so both backends return the same
+    filters = {'fields': 'id,name,device_count,circuit_count'}
+    resources, count = backend.list_page('dcim.sites', filters, 5, 0)
+    assert count == 20
+    expected = PynetboxBackend.list_page(backend, 'dcim.sites', filters, 5, 0)[0]
+    assert [resource['circuit_count'] for resource in resources] == [
+        resource['circuit_count'] for resource in expected]
+    assert resources == expected
+    assert 'POST' not in netbox.get_stats()['methods']
+
+
+def test_backend_rest_fallback_on_query_errors(backend, netbox):
+    # A field that the stored model has, but NetBox does not
+    model = backend.get_graphql_model()
+    model['objects'][model['lists']['site_list']['type']]['time_zone'] = [False, 'SCALAR', 'String']
+    resources, count = backend.list_page('dcim.sites', {'fields': 'id,name,time_zone'}, 5, 0)
+    assert count == 20
+    assert [resource['id'] for resource in resources] == [1, 2, 3, 4, 5]
+    assert netbox.get_stats()['methods'] == {'POST': 1, 'GET': 1}
+
+
+def test_backend_workers_use_instance(graphql_instance):
+    # The pages of the workers are retrieved with the instance of the
+    # thread that lists them, not the active instance
+    with open(NBCLI_CONFIG_FILE) as config_file:
+        config = json.load(config_file)
+    config['instances']['other'] = config['instances']['test']
+    with open(NBCLI_CONFIG_FILE, 'w') as config_file:
+        json.dump(config, config_file)
+    nbcli_object.config_dict = None
+
+    with nbcli_object.use_instance('other'):
+        backend = nbcli_object.get_backend()
+        resources = [*backend.list('dcim.sites', {'fields': 'id,name,status'}, workers=2, page_size=5)]
+    assert [resource['id'] for resource in resources] == [*range(1, 21)]
+    assert {instance_name for _, instance_name in schema.models} == {'other'}
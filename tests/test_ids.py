@@ -0,0 +1,51 @@
+""" Tests for the name index and the writes by name """
+import pytest
+
+from nbcli.bulk import run_bulk
+from nbcli.ids import get_id_index, write_by_name
+
+
+def reuse_name(netbox, resource_id: int) -> int:
+    """ Rename a site behind the back of the index and create another
+        site with its name """
+    name = netbox.data['dcim/sites'][resource_id]['name']
+    netbox.update('dcim/sites', resource_id, {'name': f'{name}-old'})
+    return netbox.create('dcim/sites', {'name': name, 'slug': f'{name}-new'})['id']
+
+
+def test_write_uses_index(instance, netbox):
+    write_by_name('dcim.sites', 'site2', {'description': 'x'})
+    assert get_id_index('dcim.sites').get('name', 'site2') == 2
+    assert netbox.data['dcim/sites'][2]['description'] == 'x'
+
+
+@pytest.mark.parametrize('changes', [{'description': 'y'}, None])
+def test_write_with_reused_name(instance, netbox, changes):
+    write_by_name('dcim.sites', 'site2', {'description': 'x'})
+    new_id = reuse_name(netbox, 2)
+
+    assert write_by_name('dcim.sites', 'site2', changes)
+    assert netbox.data['dcim/sites'][2]['description'] == 'x'
+    if changes is None:
+        assert new_id not in netbox.data['dcim/sites']
+    else:
+        assert netbox.data['dcim/sites'][new_id]['description'] == 'y'
+        assert get_id_index('dcim.sites').get('name', 'site2') == new_id
+
+
+def test_write_with_deleted_resource(instance, netbox):
+    write_by_name('dcim.sites', 'site2', {'description': 'x'})
+    netbox.delete('dcim/sites', 2)
+    assert write_by_name('dcim.sites', 'site2', {'description': 'y'}) is None
+    assert get_id_index('dcim.sites').get('name', 'site2') is None
+
+
+def test_bulk_updates_index(instance, netbox):
+    write_by_name('dcim.sites', 'site3', {'description': 'x'})
+    write_by_name('dcim.sites', 'site4', {'description': 'x'})
+    run_bulk('dcim.sites', 'update', [{'id': 3, 'name': 'renamed'}])
+    run_bulk('dcim.sites', 'delete', [{'name': 'site4'}])
+    index = get_id_index('dcim.sites')
+    assert index.get('name', 'renamed') == 3
+    assert index.get('name', 'site3') is None
+    assert index.get('name', 'site4') is None
@@ -0,0 +1,69 @@
+""" Tests for the journal and its flush """
+from click.testing import CliRunner
+
+from nbcli import journal
+from nbcli.cli import cli
+
+
+def get_names(netbox) -> list:
+    return sorted(resource['name'] for resource in netbox.data['dcim/sites'].values()
+                  if resource['name'].startswith('new'))
+
+
+def test_flush(instance, netbox):
+    journal.queue_change('dcim.sites', 'create', 'new1', {'name': 'new1', 'slug': 'new1'})
+    journal.queue_change('dcim.sites', 'update', 'new1', {'description': 'x'})
+    journal.queue_change('dcim.sites', 'delete', 'site1')
+    result = CliRunner().invoke(cli, ['flush'])
+    assert result.exit_code == 0, result.output
+    assert get_names(netbox) == ['new1']
+    [new_id] = netbox.names['dcim/sites']['new1']
+    assert netbox.data['dcim/sites'][new_id]['description'] == 'x'
+    assert 1 not in netbox.data['dcim/sites']
+    assert journal.read_entries(journal.get_journal_path('journal')) == []
+
+
+def test_interrupted_flush(instance, netbox, monkeypatch):
+    journal.queue_change('dcim.sites', 'create', 'new1', {'name': 'new1', 'slug': 'new1'})
+    journal.queue_change('dcim.sites', 'delete', 'site1')
+    journal.queue_change('dcim.sites', 'create', 'site1', {'name': 'site1', 'slug': 'site1'})
+
+    # The flush stops after the first round, which creates new1 and
+    # deletes site1; the second round creates site1 again
+    apply_operations = journal.apply_operations
+    rounds = []
+
+    def interrupt(*args):
+        rounds.append(args)
+        if len(rounds) == 2:
+            raise KeyboardInterrupt
+        return apply_operations(*args)
+
+    monkeypatch.setattr(journal, 'apply_operations', interrupt)
+    result = CliRunner().invoke(cli, ['flush'])
+    assert result.exit_code != 0
+    assert get_names(netbox) == ['new1']
+    assert 'site1' not in netbox.names['dcim/sites']
+    assert len(journal.read_entries(journal.get_journal_path('applied'))) == 2
+
+    # The next flush only sends the create of the second round
+    monkeypatch.setattr(journal, 'apply_operations', apply_operations)
+    netbox.reset_stats()
+    result = CliRunner().invoke(cli, ['flush'])
+    assert result.exit_code == 0, result.output
+    assert get_names(netbox) == ['new1']
+    assert len(netbox.names['dcim/sites']['site1']) == 1
+    assert netbox.get_stats()['methods'] == {'POST': 1}
+    for name in ('journal', 'flushing', 'applied'):
+        assert journal.read_entries(journal.get_journal_path(name)) == []
+
+
+def test_flush_rename_then_create(instance, netbox):
+    # The create uses the name that the rename before it frees
+    journal.queue_change('dcim.sites', 'update', 'site1', {'name': 'new1', 'slug': 'new1'})
+    journal.queue_change('dcim.sites', 'create', 'site1', {'name': 'site1', 'slug': 'site1'})
+    result = CliRunner().invoke(cli, ['flush'])
+    assert result.exit_code == 0, result.output
+    assert [*netbox.names['dcim/sites']['new1']] == [1]
+    assert len(netbox.names['dcim/sites']['site1']) == 1
+    assert journal.read_entries(journal.get_journal_path('dead-letter')) == []
@@ -0,0 +1,33 @@
+""" Tests for the region tree """
+import json
+
+from click.testing import CliRunner
+
+from nbcli.cli import cli
+from nbcli.organization_regions import count_per_region
+
+
+def test_count_per_region(instance, netbox):
+    netbox.reset_stats()
+    counts = count_per_region(2, True, True)
+
+    expected = {'sites': {}, 'devices': {}, 'prefixes': {}}
+    for site in netbox.data['dcim/sites'].values():
+        region_id = site['region']['id']
+        expected['sites'][region_id] = expected['sites'].get(region_id, 0) + 1
+        expected['devices'][region_id] = expected['devices'].get(region_id, 0) + site['device_count']
+        expected['prefixes'][region_id] = expected['prefixes'].get(region_id, 0) + site['prefix_count']
+    assert counts == expected
+    assert sum(counts['devices'].values()) == len(netbox.data['dcim/devices'])
+
+    # The API version and the sites in pages of 5; no devices or
+    # prefixes are retrieved
+    assert netbox.get_stats()['requests'] == 5
+
+
+def test_tree(instance, netbox):
+    result = CliRunner().invoke(
+        cli, ['--output', 'jsonl', 'organization', 'regions', 'tree', '--devices'])
+    assert result.exit_code == 0, result.output
+    rows = [json.loads(line) for line in result.output.splitlines()]
+    assert sum(row['devices'] for row in rows if row['depth'] == 0) == len(netbox.data['dcim/devices'])
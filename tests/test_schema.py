@@ -0,0 +1,67 @@
+""" Tests for the stored models and the NetBox version checks """
+import fake_netbox
+import pytest
+
+from nbcli import schema
+from nbcli.exceptions import NetBoxRequestError
+from nbcli.nbcli import nbcli_object
+from nbcli.resources import check_rejection
+
+
+def get_stored_version(name: str) -> str:
+    return schema.read_model(schema.get_model_path('test', name))['netbox_version']
+
+
+@pytest.fixture
+def upgrade(monkeypatch):
+    """ Upgrade the fake NetBox after the models were stored """
+    def upgrade():
+        monkeypatch.setattr(fake_netbox, 'NETBOX_VERSION', '4.2.0')
+    monkeypatch.setattr(schema, 'SCHEMA_RECHECK_INTERVAL', 0)
+    return upgrade
+
+
+def test_expire_models(instance, upgrade):
+    schema.get_model()
+    upgrade()
+
+    # Within the TTL, the stored model is used
+    schema.models.clear()
+    schema.get_model()
+    assert get_stored_version('openapi') == '4.1.0'
+
+    schema.expire_models()
+    schema.get_model()
+    assert get_stored_version('openapi') == '4.2.0'
+
+
+def test_expire_models_interval(instance, monkeypatch):
+    schema.get_model()
+    monkeypatch.setattr(schema, 'SCHEMA_RECHECK_INTERVAL', 3600)
+    schema.expire_models()
+    assert ('openapi', 'test') in schema.models
+
+
+def test_rejected_command(instance, upgrade):
+    schema.get_model()
+    upgrade()
+
+    def reject():
+        raise NetBoxRequestError('Bad request', 400, '{}')
+
+    with pytest.raises(NetBoxRequestError):
+        check_rejection(reject)()
+    schema.get_model()
+    assert get_stored_version('openapi') == '4.2.0'
+
+
+def test_rejected_graphql_query(graphql_instance, upgrade):
+    backend = nbcli_object.get_backend()
+    model = backend.get_graphql_model()
+    backend.get_labels('dcim.sites')
+    upgrade()
+
+    model['objects'][model['lists']['site_list']['type']]['time_zone'] = [False, 'SCALAR', 'String']
+    backend.list_page('dcim.sites', {'fields': 'id,time_zone'}, 5, 0)
+    backend.get_graphql_model()
+    assert get_stored_version('graphql') == '4.2.0'
@@ -0,0 +1,72 @@
+""" Tests that the help of the commands does not import the modules
+    that are only needed to run them, and that it starts fast. """
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from conftest import ROOT
+
+# Prints the imported modules after the CLI ran with the arguments
+SCRIPT = '''
+import json
+import sys
+sys.path.insert(0, 'src')
+from nbcli.cli import cli
+try:
+    cli(sys.argv[1:], standalone_mode=False)
+except SystemExit:
+    pass
+print(json.dumps(sorted(sys.modules)))
+'''
+
+# The seconds that a cold `nbcli --help` may take on top of the start
+# of the interpreter. It takes about 0.1 seconds; the budget is large
+# so slow test machines do not fail.
+STARTUP_BUDGET = 1.0
+
+# Modules that no help output should import
+HEAVY_MODULES = (
+    'httpx', 'pynetbox', 'requests', 'rich.live', 'sqlite3', 'yaml',
+    'nbcli.backends', 'nbcli.bulk', 'nbcli.ids', 'nbcli.mirror', 'nbcli.summary')
+
+
+def get_modules(*args: str) -> set:
+    result = subprocess.run(
+        [sys.executable, '-c', SCRIPT, *args], cwd=ROOT, env=os.environ,
+        capture_output=True, text=True, check=True)
+    return set(json.loads(result.stdout.splitlines()[-1]))
+
+
+def test_help_imports_no_commands():
+    modules = get_modules('--help')
+    for name in (*HEAVY_MODULES, 'rich.table', 'nbcli.organization_sites'):
+        assert name not in modules
+
+
+@pytest.mark.parametrize('group', ['sites', 'regions'])
+@pytest.mark.parametrize('command', [(), ('list',), ('update',), ('import',)])
+def test_command_help_imports_no_features(group, command):
+    modules = get_modules('organization', group, *command, '--help')
+    assert f'nbcli.organization_{group}' in modules
+    for name in HEAVY_MODULES:
+        assert name not in modules
+
+
+def get_duration(*args: str) -> float:
+    """ The shortest of three runs, in seconds """
+    durations = []
+    for _ in range(3):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, *args], cwd=ROOT, env=os.environ,
+                       capture_output=True, check=True)
+        durations.append(time.perf_counter() - start)
+    return min(durations)
+
+
+def test_help_startup_time():
+    interpreter = get_duration('-c', 'pass')
+    assert get_duration('src/nbcli_cli.py', '--help') - interpreter < STARTUP_BUDGET
@@ -0,0 +1,22 @@
+""" Tests for the summary counts """
+from concurrent import futures
+
+from nbcli import summary
+
+
+def test_workers_are_capped(instance, monkeypatch):
+    sizes = []
+
+    class Executor(futures.ThreadPoolExecutor):
+        def __init__(self, max_workers):
+            sizes.append(max_workers)
+            super().__init__(max_workers)
+
+    monkeypatch.setattr(summary, 'ThreadPoolExecutor', Executor)
+    rows = summary.count_summary(True, {}, None)
+    # The pool size of the instance
+    assert sizes == [10]
+    assert rows[0][1] is not None
+
+    summary.count_summary(False, {}, 1000)
+    assert sizes[1] == len(summary.SUMMARY_ENDPOINTS)
@@ -0,0 +1,30 @@
+""" Tests for the high-water marks of the watch mode and the mirror """
+from nbcli.fetch import get_newest
+from nbcli.watch import Watcher
+
+
+def test_get_newest_precision():
+    # As strings, '...00Z' sorts after '...00.5+00:00'
+    assert get_newest('2024-05-01T10:00:00.500000+00:00', '2024-05-01T10:00:00Z') == \
+        '2024-05-01T10:00:00.500000+00:00'
+    assert get_newest('2024-05-01T10:00:00Z', '2024-05-01T10:00:00.123+00:00') == \
+        '2024-05-01T10:00:00.123+00:00'
+
+
+def test_get_newest_offsets():
+    assert get_newest('2024-05-01T11:00:00+02:00', '2024-05-01T10:00:00Z') == '2024-05-01T10:00:00Z'
+    assert get_newest('2024-05-01T10:00:00', '2024-05-01T09:00:00+00:00') == '2024-05-01T10:00:00'
+
+
+def test_get_newest_missing():
+    assert get_newest(None, '2024-05-01T10:00:00Z') == '2024-05-01T10:00:00Z'
+    assert get_newest('2024-05-01T10:00:00Z', None) == '2024-05-01T10:00:00Z'
+
+
+def test_watcher_merge():
+    watcher = Watcher('dcim.sites', {}, lambda filters: iter(()), 1)
+    watcher.merge([
+        {'id': 1, 'last_updated': '2024-05-01T10:00:00.900000Z'},
+        {'id': 2, 'last_updated': '2024-05-01T12:00:00+02:00'},
+        {'id': 3, 'last_updated': None}])
+    assert watcher.newest == '2024-05-01T10:00:00.900000Z'
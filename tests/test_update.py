@@ -0,0 +1,51 @@
+""" Tests for the update and delete commands with --where """
+import pytest
+from click.testing import CliRunner
+
+from nbcli.cli import cli
+
+
+@pytest.mark.parametrize('group', ['sites', 'regions'])
+@pytest.mark.parametrize('arguments', [
+    ('--slug', 'same'), ('--set', 'name=same'), ('--set', 'slug=same')])
+def test_where_rejects_unique_fields(instance, netbox, group, arguments):
+    netbox.reset_stats()
+    result = CliRunner().invoke(
+        cli, ['organization', group, 'update', '--where', 'id=1', *arguments])
+    assert 'cannot be set with --where' in result.output
+    assert netbox.get_stats()['requests'] == 0
+
+
+def test_where_updates_other_fields(instance, netbox):
+    result = CliRunner().invoke(
+        cli, ['organization', 'regions', 'update', '--where', 'name=region1',
+              '--description', 'changed'])
+    assert result.exit_code == 0, result.output
+    assert netbox.data['dcim/regions'][1]['description'] == 'changed'
+
+
+def test_where_without_changes(instance, netbox):
+    netbox.reset_stats()
+    result = CliRunner().invoke(cli, ['organization', 'sites', 'update', '--where', 'status=active'])
+    assert 'Give the values to update' in result.output
+    assert netbox.get_stats()['requests'] == 0
+
+
+def test_delete_confirms_with_matches(instance, netbox):
+    result = CliRunner().invoke(
+        cli, ['organization', 'regions', 'delete', '--where', 'name=region2'], input='n\n')
+    assert 'region2' in result.output
+    assert 'Delete the 1 objects that match?' in result.output
+    assert 2 in netbox.data['dcim/regions']
+
+    result = CliRunner().invoke(
+        cli, ['organization', 'regions', 'delete', '--where', 'name=region2'], input='y\n')
+    assert result.exit_code == 0, result.output
+    assert 2 not in netbox.data['dcim/regions']
+
+
+def test_delete_without_matches_does_not_confirm(instance, netbox):
+    result = CliRunner().invoke(
+        cli, ['organization', 'sites', 'delete', '--where', 'name=missing'])
+    assert result.exit_code == 0, result.output
+    assert '0 objects match' in result.output